@@ -0,0 +1,236 @@
+"""
+gunicorn_bench.py
+
+Load-test comparison of gunicorn configurations. Starts gunicorn with
+`gunicorn.conf.py` once per configuration, drives it over HTTP with a mix of
+database-bound reads and CPU-bound logins from concurrent clients, and
+reports throughput and latency percentiles.
+
+Configurations are given as `<workload>` presets of `gunicorn.conf.py` or as
+explicit `<workers>x<threads>` sizes. Uses the database configured by `MODE`
+and its database URL (e.g. in `.env`), and registers a benchmark user and
+group on first run. Must be run from the repository root.
+
+Usage:
+    python -m benchmarks.gunicorn_bench --configs 1x1 io cpu mixed \
+        --clients 32 --duration 20
+"""
+# Standard Imports
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from statistics import quantiles
+
+# Project-Specific Imports
+from src import create_app
+
+USERNAME = 'bench_gunicorn_user'
+PASSWORD = 'bench_gunicorn_password'
+GROUP_NAME = 'bench_gunicorn_group'
+
+# Share of each request type, roughly our production mix
+SCENARIO = [
+    ('group info', 0.45),
+    ('group users', 0.20),
+    ('resolve user', 0.15),
+    ('user groups', 0.15),
+    ('login', 0.05),
+]
+
+
+def setup():
+    """Register the benchmark user and group. Returns (token, group ID)."""
+    app = create_app()
+    app.config['RATE_LIMIT_ENABLED'] = False
+    client = app.test_client()
+
+    # 409 if they already exist
+    client.post('/users', json={"username": USERNAME, "password": PASSWORD,
+                                "email": "bench@email.com"})
+    login = client.post('/users/login', json={"username": USERNAME,
+                                              "password": PASSWORD}).get_json()
+    client.post('/groups', json={"group_name": GROUP_NAME,
+                                 "description": "Benchmark"})
+    group_id = client.get(f'/groups/resolve/{GROUP_NAME}')\
+        .get_json()["group_id"]
+
+    headers = {"Authorization": f"Bearer {login['access_token']}"}
+    client.post(f'/groups/{group_id}/users/{login["user_id"]}',
+                headers=headers)
+    return login["access_token"], group_id
+
+
+def server_env(config: str, port: int) -> dict:
+    """Environment selecting a configuration of `gunicorn.conf.py`."""
+    env = {**os.environ, 'GUNICORN_BIND': f'127.0.0.1:{port}',
+           'GUNICORN_LOG_LEVEL': 'warning', 'GUNICORN_ACCESS_LOG': '',
+           'LOG_LEVEL': 'WARNING', 'RATE_LIMIT_ENABLED': 'false'}
+    sizes = re.fullmatch(r'(\d+)x(\d+)', config)
+    if sizes:
+        env['GUNICORN_WORKERS'], env['GUNICORN_THREADS'] = sizes.groups()
+    else:
+        env['GUNICORN_WORKLOAD'] = config
+    return env
+
+
+def start_server(config: str, port: int) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'src:create_app()'],
+        env=server_env(config, port), stdout=subprocess.DEVNULL)
+
+    # Wait for the socket to accept connections
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"gunicorn ({config}) did not start")
+
+
+def request_for(kind: str, token: str, group_id: int):
+    """(method, path, body, headers) of a request type."""
+    auth = {"Authorization": f"Bearer {token}"}
+    if kind == 'group info':
+        return 'GET', f'/groups/{group_id}', None, auth
+    if kind == 'group users':
+        return 'GET', f'/groups/{group_id}/users', None, auth
+    if kind == 'resolve user':
+        return 'GET', f'/users/resolve/{USERNAME}', None, {}
+    if kind == 'user groups':
+        return 'GET', '/users/groups', None, auth
+    return 'POST', '/users/login', json.dumps(
+        {"username": USERNAME, "password": PASSWORD}), \
+        {"Content-Type": "application/json"}
+
+
+def run_load(port: int, token: str, group_id: int, clients: int,
+             duration: float):
+    """
+    Send requests from `clients` keep-alive connections for `duration`
+    seconds. Returns latencies (ms) per request type, and the counts of failed
+    requests and of connections reopened after a worker was recycled.
+    """
+    kinds, weights = zip(*SCENARIO)
+    latencies = defaultdict(list)
+    counts = {'errors': 0, 'reconnects': 0}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client(seed: int):
+        rng = random.Random(seed)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        local = defaultdict(list)
+        local_errors = local_reconnects = 0
+
+        while time.monotonic() < stop_at:
+            kind = rng.choices(kinds, weights)[0]
+            method, path, body, headers = request_for(kind, token, group_id)
+            start = time.perf_counter()
+            for attempt in range(2):
+                try:
+                    conn.request(method, path, body=body, headers=headers)
+                    response = conn.getresponse()
+                    response.read()
+                    ok = response.status < 400
+                    break
+                except (OSError, http.client.HTTPException) as e:
+                    conn.close()
+                    conn = http.client.HTTPConnection('127.0.0.1', port,
+                                                      timeout=60)
+                    ok = False
+                    # A recycled worker closed the idle keep-alive
+                    # connection - retry once, as HTTP clients do
+                    if not isinstance(e, (ConnectionResetError,
+                                          BrokenPipeError)):
+                        break
+                    local_reconnects += 1
+
+            if ok:
+                local[kind].append((time.perf_counter() - start) * 1000)
+            else:
+                local_errors += 1
+
+        conn.close()
+        with lock:
+            for kind, values in local.items():
+                latencies[kind].extend(values)
+            counts['errors'] += local_errors
+            counts['reconnects'] += local_reconnects
+
+    threads = [threading.Thread(target=client, args=(i,))
+               for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, counts
+
+
+def percentiles(values):
+    if len(values) < 2:
+        return (values[0],) * 3 if values else (float('nan'),) * 3
+    cuts = quantiles(values, n=100)
+    return cuts[49], cuts[94], cuts[98]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument('--configs', nargs='+',
+                        default=['1x1', 'io', 'mixed', 'cpu'],
+                        help="Workload presets or <workers>x<threads> sizes")
+    parser.add_argument('--clients', type=int, default=32,
+                        help="Concurrent keep-alive connections")
+    parser.add_argument('--duration', type=float, default=20,
+                        help="Seconds of load per configuration")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--per-route', action='store_true',
+                        help="Also report latencies per request type")
+    args = parser.parse_args()
+
+    # Keep per-request log lines out of the results
+    logging.getLogger('main').setLevel(logging.WARNING)
+
+    token, group_id = setup()
+
+    print(f"{args.clients} clients, {args.duration:.0f}s per configuration")
+    print(f"{'config':>8}{'req/s':>10}{'p50 (ms)':>10}{'p95 (ms)':>10}"
+          f"{'p99 (ms)':>10}{'errors':>8}{'reconnects':>12}")
+
+    for config in args.configs:
+        server = start_server(config, args.port)
+        try:
+            # Warm up every worker's connection pool and caches
+            run_load(args.port, token, group_id, args.clients, 2)
+            latencies, counts = run_load(args.port, token, group_id,
+                                         args.clients, args.duration)
+        finally:
+            server.terminate()
+            server.wait()
+
+        every = [value for values in latencies.values() for value in values]
+        p50, p95, p99 = percentiles(every)
+        print(f"{config:>8}{len(every) / args.duration:>10.1f}"
+              f"{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}{counts['errors']:>8}"
+              f"{counts['reconnects']:>12}")
+
+        if args.per_route:
+            for kind, _ in SCENARIO:
+                p50, p95, p99 = percentiles(latencies[kind])
+                print(f"{kind:>20}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,370 @@
+"""
+load_test.py
+
+Load-testing harness replaying what members of a group do: log in, list
+their groups, open a receipt, edit their units, save costs and upload
+receipts from `tests/static_files`. Virtual users run a weighted mix of these
+steps from concurrent threads for a fixed duration, and throughput, latency
+percentiles and errors are reported per step, to measure capacity before a
+deploy.
+
+The app is driven in process through the WSGI test client (`--target wsgi`),
+through a local gunicorn started with `gunicorn.conf.py`
+(`--target gunicorn`, sized with `--config`), or over HTTP against a running
+server (`--url`). Benchmark users, a group and a receipt are set up through
+the API on first run. The local targets use the database configured by `MODE`
+and its database URL (e.g. in `.env`) and must be run from the repository
+root. SQLite serializes writers, so with more than one user its write steps
+fail with `database is locked`: measure capacity against the production
+database.
+
+Usage:
+    python -m benchmarks.load_test --target gunicorn --config mixed \
+        --users 32 --duration 30 --json before.json
+    python -m benchmarks.load_test --url http://127.0.0.1:5000 --users 8
+"""
+# Standard Imports
+import argparse
+import http.client
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from pathlib import Path
+from statistics import quantiles
+from urllib.parse import urlsplit
+
+USERNAME = 'bench_load_user_{}'
+PASSWORD = 'bench_load_password'
+GROUP_NAME = 'bench_load_group'
+
+# Receipts uploaded by the benchmark, the first one being opened and edited
+FILES_DIR = Path(__file__).parent.parent / 'tests' / 'static_files'
+RECEIPT_FILES = sorted(FILES_DIR.glob('*.pdf'))
+
+# Share of each step, roughly what members do while splitting a receipt
+SCENARIO = [
+    ('login', 0.03),
+    ('list groups', 0.15),
+    ('group receipts', 0.15),
+    ('open receipt', 0.20),
+    ('receipt units', 0.17),
+    ('edit units', 0.15),
+    ('save costs', 0.10),
+    ('upload receipt', 0.05),
+]
+
+# Statuses of a successful step, other than 200
+EXPECTED = {
+    'save costs': (204,),
+    # Receipts already in the group are parsed too, then rejected
+    'upload receipt': (201, 409),
+}
+
+
+def percentiles(values):
+    if len(values) < 2:
+        return (values[0],) * 3 if values else (float('nan'),) * 3
+    cuts = quantiles(values, n=100)
+    return cuts[49], cuts[94], cuts[98]
+
+
+def encode_multipart(field: str, filename: str, content: bytes):
+    """Body and content type of a form uploading one file."""
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field}"; '
+            f'filename="{filename}"\r\n'
+            f'Content-Type: application/pdf\r\n\r\n').encode() \
+        + content + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+class WSGITransport():
+    """Sends requests to a Flask app in process, one client per thread."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, body: bytes = None,
+                headers: dict = None):
+        """Returns (status, body)."""
+        if not hasattr(self._local, 'client'):
+            self._local.client = self.app.test_client()
+        response = self._local.client.open(path, method=method, data=body,
+                                           headers=headers or {})
+        return response.status_code, response.get_data()
+
+
+class HTTPTransport():
+    """Sends requests over HTTP, one keep-alive connection per thread."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._local = threading.local()
+
+    def _connection(self, new: bool = False):
+        if new or not hasattr(self._local, 'conn'):
+            self._local.conn = http.client.HTTPConnection(
+                self.host, self.port, timeout=60)
+        return self._local.conn
+
+    def request(self, method: str, path: str, body: bytes = None,
+                headers: dict = None):
+        """Returns (status, body)."""
+        conn = self._connection()
+        for attempt in range(2):
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                return response.status, response.read()
+            # A recycled worker closed the idle keep-alive connection - retry
+            # once, as HTTP clients do
+            except (ConnectionResetError, BrokenPipeError,
+                    http.client.RemoteDisconnected):
+                conn.close()
+                conn = self._connection(new=True)
+                if attempt:
+                    raise
+
+
+class VirtualUser():
+    """A member of the benchmark group, running steps of the scenario."""
+
+    def __init__(self, transport, index: int, rng: random.Random):
+        self.transport = transport
+        self.username = USERNAME.format(index)
+        self.rng = rng
+        self.token = None
+        self.user_id = None
+
+    def call(self, method: str, path: str, json_body=None, body=None,
+             content_type=None, auth=True):
+        headers = {}
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            content_type = 'application/json'
+        if content_type:
+            headers['Content-Type'] = content_type
+        if auth:
+            headers['Authorization'] = f'Bearer {self.token}'
+        status, data = self.transport.request(method, path, body, headers)
+        try:
+            return status, json.loads(data) if data else None
+        except ValueError:
+            return status, None
+
+    def login(self):
+        status, data = self.call('POST', '/users/login', auth=False,
+                                 json_body={"username": self.username,
+                                            "password": PASSWORD})
+        if status == 200:
+            self.token, self.user_id = data["access_token"], data["user_id"]
+        return status
+
+    def step(self, name: str, group_id: int, receipt_id: int,
+             item_ids: list) -> int:
+        """Run a step of the scenario. Returns its response's status."""
+        if name == 'login':
+            return self.login()
+        if name == 'list groups':
+            return self.call('GET', '/users/groups')[0]
+        if name == 'group receipts':
+            return self.call('GET', f'/groups/{group_id}/receipts')[0]
+        if name == 'open receipt':
+            return self.call('GET', f'/receipts/{receipt_id}/items')[0]
+        if name == 'receipt units':
+            return self.call('GET', f'/receipts/user-items/{receipt_id}')[0]
+        if name == 'edit units':
+            return self.call('PUT', '/receipts/user-items', json_body=[
+                {"user_id": self.user_id, "item_id": self.rng.choice(item_ids),
+                 "unit": self.rng.randint(0, 3)}])[0]
+        if name == 'save costs':
+            return self.call('PUT', '/users/costs', json_body=[
+                {"user_id": self.user_id, "receipt_id": receipt_id,
+                 "cost": round(self.rng.uniform(0, 50), 2)}])[0]
+        if name == 'upload receipt':
+            path = self.rng.choice(RECEIPT_FILES)
+            body, content_type = encode_multipart('file', path.name,
+                                                  path.read_bytes())
+            return self.call('POST', f'/groups/{group_id}/receipts',
+                             body=body, content_type=content_type)[0]
+        raise ValueError(f"Unknown step '{name}'")
+
+
+def setup(transport, users: int):
+    """
+    Register and log in the benchmark users, add them to the benchmark group
+    and to its receipt. Returns (users, group ID, receipt ID, item IDs).
+    """
+    members = []
+    for index in range(users):
+        user = VirtualUser(transport, index, random.Random(index))
+        # 409 if the user already exists
+        user.call('POST', '/users', auth=False, json_body={
+            "username": user.username, "password": PASSWORD,
+            "email": "bench@email.com"})
+        if user.login() != 200:
+            raise RuntimeError(f"Failed to log in as {user.username}")
+        members.append(user)
+
+    owner = members[0]
+    owner.call('POST', '/groups', json_body={"group_name": GROUP_NAME,
+                                             "description": "Load test"})
+    status, data = owner.call('GET', f'/groups/resolve/{GROUP_NAME}')
+    if status != 200:
+        raise RuntimeError(f"Failed to create group {GROUP_NAME}")
+    group_id = data["group_id"]
+    for user in members:
+        user.call('POST', f'/groups/{group_id}/users/{user.user_id}')
+
+    # The receipt opened and edited by every user
+    receipt_file = RECEIPT_FILES[0]
+    body, content_type = encode_multipart('file', receipt_file.name,
+                                          receipt_file.read_bytes())
+    owner.call('POST', f'/groups/{group_id}/receipts', body=body,
+               content_type=content_type)
+    receipts = owner.call('GET', f'/groups/{group_id}/receipts')[1]["receipts"]
+    receipt_id = min(receipt["receipt_id"] for receipt in receipts)
+    items = owner.call('GET', f'/receipts/{receipt_id}/items')[1]
+    item_ids = [item["item_id"] for item in items]
+    for user in members:
+        user.call('POST', f'/receipts/{receipt_id}/users/{user.user_id}')
+
+    return members, group_id, receipt_id, item_ids
+
+
+def run_load(members: list, group_id: int, receipt_id: int, item_ids: list,
+             duration: float):
+    """
+    Run the scenario from one thread per user for `duration` seconds.
+    Returns latencies (ms) and counts of errors by status per step.
+    """
+    steps, weights = zip(*SCENARIO)
+    latencies = defaultdict(list)
+    errors = defaultdict(Counter)
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def run_user(user: VirtualUser):
+        local_latencies = defaultdict(list)
+        local_errors = defaultdict(Counter)
+        while time.monotonic() < stop_at:
+            step = user.rng.choices(steps, weights)[0]
+            start = time.perf_counter()
+            try:
+                status = user.step(step, group_id, receipt_id, item_ids)
+            except (OSError, http.client.HTTPException) as e:
+                status = type(e).__name__
+            if status in EXPECTED.get(step, (200,)):
+                local_latencies[step].append(
+                    (time.perf_counter() - start) * 1000)
+            else:
+                local_errors[step][status] += 1
+
+        with lock:
+            for step, values in local_latencies.items():
+                latencies[step].extend(values)
+            for step, statuses in local_errors.items():
+                errors[step].update(statuses)
+
+    threads = [threading.Thread(target=run_user, args=(user,))
+               for user in members]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def report(latencies: dict, errors: dict, duration: float) -> dict:
+    """Print and return throughput, percentiles and errors per step."""
+    results = {}
+    print(f"{'step':>16}{'count':>8}{'req/s':>9}{'p50 (ms)':>10}"
+          f"{'p95 (ms)':>10}{'p99 (ms)':>10}{'errors':>8}  statuses")
+
+    rows = [(step, latencies[step], errors[step]) for step, _ in SCENARIO]
+    rows.append(('all', [value for values in latencies.values()
+                         for value in values], sum(errors.values(), Counter())))
+    for step, values, statuses in rows:
+        p50, p95, p99 = percentiles(values)
+        error_count = sum(statuses.values())
+        results[step] = {"count": len(values),
+                         "throughput": len(values) / duration,
+                         "p50": p50, "p95": p95, "p99": p99,
+                         "errors": error_count,
+                         "error_statuses": {str(status): count for status, count
+                                            in statuses.items()}}
+        print(f"{step:>16}{len(values):>8}{len(values) / duration:>9.1f}"
+              f"{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}{error_count:>8}  "
+              + ' '.join(f"{status}x{count}"
+                         for status, count in statuses.most_common()))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument('--target', choices=['wsgi', 'gunicorn'],
+                        default='wsgi', help="Local app to drive")
+    parser.add_argument('--url', help="Drive a running server instead, "
+                                      "e.g. http://127.0.0.1:5000")
+    parser.add_argument('--config', default='mixed',
+                        help="gunicorn workload preset or <workers>x<threads>")
+    parser.add_argument('--port', type=int, default=8766,
+                        help="Port of the local gunicorn")
+    parser.add_argument('--users', type=int, default=16,
+                        help="Concurrent virtual users")
+    parser.add_argument('--duration', type=float, default=20,
+                        help="Seconds of load")
+    parser.add_argument('--warmup', type=float, default=2,
+                        help="Seconds of load before measuring")
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        url = urlsplit(args.url)
+        transport = HTTPTransport(url.hostname, url.port or 80)
+    elif args.target == 'gunicorn':
+        from benchmarks.gunicorn_bench import start_server
+        server = start_server(args.config, args.port)
+        transport = HTTPTransport('127.0.0.1', args.port)
+    else:
+        from src import create_app
+
+        # Keep per-request log lines out of the results
+        logging.getLogger('main').setLevel(logging.WARNING)
+        app = create_app()
+        app.config['RATE_LIMIT_ENABLED'] = False
+        transport = WSGITransport(app)
+
+    try:
+        members, group_id, receipt_id, item_ids = setup(transport, args.users)
+        target = args.url or (f"gunicorn ({args.config})"
+                              if server else "WSGI test client")
+        print(f"{target}: {args.users} users, {args.duration:.0f}s, "
+              f"receipt {receipt_id} with {len(item_ids)} items")
+
+        run_load(members, group_id, receipt_id, item_ids, args.warmup)
+        latencies, errors = run_load(members, group_id, receipt_id, item_ids,
+                                     args.duration)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    results = report(latencies, errors, args.duration)
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump({"target": target, "users": args.users,
+                       "duration": args.duration, "steps": results},
+                      output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+logging_bench.py
+
+Logging overhead benchmark. Compares the queued JSON-lines pipeline of
+`src/utils/app_logger.py` against a synchronous `FileHandler` (the previous
+setup) and against logging disabled, both per logged record in the calling
+thread and per request of `GET /users` through the Flask test client from
+concurrent threads.
+
+Uses the database configured by `MODE` and its database URL (e.g. in `.env`)
+and registers a benchmark user on first run. Log files are written to a
+temporary directory.
+
+Usage:
+    python -m benchmarks.logging_bench --threads 8 --requests 2000
+"""
+# Standard Imports
+import argparse
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from statistics import quantiles
+
+# Log to a temporary file only, set before the logger is configured on import
+log_dir = tempfile.mkdtemp(prefix='logging-bench-')
+os.environ['LOG_FILE'] = os.path.join(log_dir, 'queued.log')
+os.environ['LOG_CONSOLE'] = 'false'
+
+# Project-Specific Imports
+from src import create_app
+from src.utils import app_logger
+
+USERNAME = 'bench_logging_user'
+PASSWORD = 'bench_logging_password'
+
+
+def use_mode(mode: str):
+    """Switch the 'main' logger to a mode: `off`, `sync` or `queued`."""
+    logger = app_logger.logger
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    if mode == 'sync':
+        file_handler = logging.FileHandler(os.path.join(log_dir, 'sync.log'))
+        file_handler.setFormatter(app_logger.CustomFormatter(
+            '%(asctime)s - %(levelname)s - %(custom_filepath)s:%(lineno)d '
+            '- %(message)s'))
+        logger.addHandler(file_handler)
+    elif mode == 'queued':
+        logger.addHandler(app_logger.queue_handler)
+    logger.setLevel(logging.WARNING if mode == 'off' else logging.DEBUG)
+
+
+def per_record(records: int) -> float:
+    """Microseconds spent by the calling thread per logged record."""
+    logger = logging.getLogger('main.bench')
+    start = time.perf_counter()
+    for i in range(records):
+        logger.info("Benchmark record %s of user ID %s.", i, 1)
+    return (time.perf_counter() - start) / records * 1e6
+
+
+def run(app, headers: dict, threads: int, requests: int):
+    """Run `requests` requests across `threads` threads. Returns latencies."""
+
+    def get(_):
+        client = app.test_client()
+        start = time.perf_counter()
+        response = client.get('/users', headers=headers)
+        assert response.status_code == 200, response.get_json()
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(get, range(requests)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument('--threads', type=int, default=8,
+                        help="Concurrent requests")
+    parser.add_argument('--requests', type=int, default=2000,
+                        help="Requests per mode")
+    parser.add_argument('--records', type=int, default=50000,
+                        help="Records logged per mode")
+    parser.add_argument('--modes', nargs='+', default=['off', 'sync', 'queued'],
+                        choices=['off', 'sync', 'queued'])
+    args = parser.parse_args()
+
+    app = create_app()
+    app.config['RATE_LIMIT_ENABLED'] = False
+    client = app.test_client()
+
+    # Register and log in the benchmark user (409 if it already exists)
+    client.post('/users', json={"username": USERNAME, "password": PASSWORD,
+                                "email": "bench@email.com"})
+    response = client.post('/users/login', json={"username": USERNAME,
+                                                 "password": PASSWORD})
+    headers = {"Authorization": f"Bearer {response.get_json()['access_token']}"}
+
+    print(f"{args.records} records, {args.requests} requests, "
+          f"{args.threads} threads, logs in {log_dir}")
+    print(f"{'mode':>8}{'us/record':>11}{'req/s':>9}{'p50 (ms)':>10}"
+          f"{'p95 (ms)':>10}{'p99 (ms)':>10}")
+
+    for mode in args.modes:
+        use_mode(mode)
+        record_cost = per_record(args.records)
+
+        # Warm up
+        run(app, headers, 1, 20)
+
+        start = time.perf_counter()
+        latencies = run(app, headers, args.threads, args.requests)
+        elapsed = time.perf_counter() - start
+
+        percentiles = quantiles(latencies, n=100)
+        print(f"{mode:>8}{record_cost:>11.2f}"
+              f"{args.requests / elapsed:>9.1f}{percentiles[49]:>10.2f}"
+              f"{percentiles[94]:>10.2f}{percentiles[98]:>10.2f}")
+
+    use_mode('queued')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+login_bench.py
+
+Login throughput benchmark. Drives `POST /users/login` through the Flask test
+client from concurrent threads, for several sizes of the bcrypt hashing pool,
+and reports throughput and latency percentiles.
+
+Uses the database configured by `MODE` and its database URL (e.g. in `.env`)
+and registers a benchmark user on first run.
+
+Usage:
+    python -m benchmarks.login_bench --threads 16 --logins 200 --workers 1 2 4
+"""
+# Standard Imports
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from statistics import quantiles
+
+# Project-Specific Imports
+from src import create_app
+from src.routes import user_routes
+from src.utils.hashing import PasswordHasher, BCRYPT_ROUNDS
+
+USERNAME = 'bench_login_user'
+PASSWORD = 'bench_login_password'
+
+
+def run(app, threads: int, logins: int):
+    """Run `logins` logins across `threads` threads. Returns latencies (ms)."""
+
+    def login(_):
+        client = app.test_client()
+        start = time.perf_counter()
+        response = client.post('/users/login', json={"username": USERNAME,
+                                                     "password": PASSWORD})
+        assert response.status_code == 200, response.get_json()
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(login, range(logins)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument('--threads', type=int, default=16,
+                        help="Concurrent login requests")
+    parser.add_argument('--logins', type=int, default=200,
+                        help="Logins per configuration")
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[1, 2, os.cpu_count() or 1],
+                        help="Hashing pool sizes to compare")
+    parser.add_argument('--rounds', type=int, default=BCRYPT_ROUNDS,
+                        help="bcrypt cost factor")
+    args = parser.parse_args()
+
+    # Keep per-request log lines out of the results
+    logging.getLogger('main').setLevel(logging.WARNING)
+
+    app = create_app()
+    app.config['RATE_LIMIT_ENABLED'] = False
+    client = app.test_client()
+
+    # Register the benchmark user (409 if it already exists)
+    client.post('/users', json={"username": USERNAME, "password": PASSWORD,
+                                "email": "bench@email.com"})
+
+    print(f"{args.logins} logins, {args.threads} threads, "
+          f"bcrypt cost {args.rounds}")
+    print(f"{'workers':>8}{'logins/s':>10}{'p50 (ms)':>10}"
+          f"{'p95 (ms)':>10}{'p99 (ms)':>10}")
+
+    for workers in args.workers:
+        hasher = PasswordHasher(rounds=args.rounds, workers=workers)
+        user_routes.auth._hasher = hasher
+
+        # Warm up, which also rehashes the password to the benchmark cost
+        run(app, 1, 2)
+
+        start = time.perf_counter()
+        latencies = run(app, args.threads, args.logins)
+        elapsed = time.perf_counter() - start
+        hasher.shutdown()
+
+        percentiles = quantiles(latencies, n=100)
+        print(f"{workers:>8}{args.logins / elapsed:>10.1f}"
+              f"{percentiles[49]:>10.1f}{percentiles[94]:>10.1f}"
+              f"{percentiles[98]:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
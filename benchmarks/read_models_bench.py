@@ -0,0 +1,131 @@
+"""
+read_models_bench.py
+
+Micro-benchmark comparing the projection-only read models in
+`src/utils/read_models.py` against loading full ORM entities, for latency and
+peak memory. The benchmark seeds and reads its own in-memory SQLite database,
+but importing `src` still requires `MODE` and its database URL to be set (e.g.
+in `.env`).
+
+Usage:
+    python -m benchmarks.read_models_bench --rows 20000 --repeat 5
+"""
+# Standard Imports
+import argparse
+import time
+import tracemalloc
+from datetime import datetime as dt
+from statistics import median
+
+# Third-Party Imports
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Project-Specific Imports
+from src.utils.models import Base, Group, User, Receipt, Item
+from src.utils.read_models import to_dicts, list_receipt_items, list_groups
+
+
+def seed(session, rows: int):
+    """One receipt with `rows` items, and `rows` users and groups."""
+    session.execute(insert(Group), [
+        {"group_id": i, "group_name": f"Group {i}", "description": "Bench"}
+        for i in range(1, rows + 1)])
+    session.execute(insert(User), [
+        {"user_id": i, "username": f"User {i}", "email": "bench@email.com",
+         "hashed_password": "$2b$12$" + "x" * 53}
+        for i in range(1, rows + 1)])
+    session.execute(insert(Receipt), [{
+        "receipt_id": 1, "order_id": 1, "slot_time": dt.now(),
+        "total_price": 0, "group_id": 1, "payment_card": 1234,
+        "locked_by": 0, "lock_timestamp": dt.now()}])
+    session.execute(insert(Item), [
+        {"item_name": f"Sainsbury's Item {i % 500}", "receipt_id": 1,
+         "quantity": 1, "weight": None, "price": 1.25}
+        for i in range(rows)])
+    session.commit()
+
+
+# Compared read paths ---------------------------------------------------------
+def items_orm(session):
+    items = session.query(Item).filter(Item.receipt_id == 1).all()
+    return [{"item_id": item.item_id, "item_name": item.item_name,
+             "quantity": item.quantity, "weight": item.weight,
+             "price": item.price} for item in items]
+
+
+def items_projection(session):
+    return to_dicts(list_receipt_items(session, 1))
+
+
+def groups_orm(session):
+    groups = session.query(Group).all()
+    return [{"group_id": group.group_id, "group_name": group.group_name,
+             "description": group.description} for group in groups]
+
+
+def groups_projection(session):
+    return to_dicts(list_groups(session))
+
+
+def users_orm(session):
+    users = session.query(User).all()
+    return [{"user_id": user.user_id, "username": user.username}
+            for user in users]
+
+
+def users_projection(session):
+    return to_dicts(session.execute(select(User.user_id, User.username)))
+
+
+CASES = [
+    ("items", items_orm, items_projection),
+    ("groups", groups_orm, groups_projection),
+    ("users", users_orm, users_projection),
+]
+
+
+def measure(session_factory, read, repeat: int):
+    """Median latency (ms) and peak traced memory (MiB) of a read path."""
+    timings = []
+    for _ in range(repeat):
+        with session_factory() as session:
+            start = time.perf_counter()
+            read(session)
+            timings.append((time.perf_counter() - start) * 1000)
+
+    with session_factory() as session:
+        tracemalloc.start()
+        read(session)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return median(timings), peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument('--rows', type=int, default=20000,
+                        help="Rows per table")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help="Timed repetitions per case")
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://", poolclass=StaticPool,
+                           connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    with session_factory() as session:
+        seed(session, args.rows)
+
+    print(f"{args.rows} rows, median of {args.repeat} runs")
+    print(f"{'case':<8}{'path':<12}{'latency (ms)':>14}{'peak (MiB)':>12}")
+    for name, orm_read, projection_read in CASES:
+        for label, read in (("orm", orm_read), ("projection", projection_read)):
+            latency, peak = measure(session_factory, read, args.repeat)
+            print(f"{name:<8}{label:<12}{latency:>14.1f}{peak:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
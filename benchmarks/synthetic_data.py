@@ -0,0 +1,288 @@
+"""
+synthetic_data.py
+
+Synthetic dataset generator. Fills a database through the models of
+`src/utils/models.py` with realistic data at a configurable scale, to see how
+queries and endpoints behave at the data sizes expected in production:
+    users, groups       Households of 2 to 6 members; users can be in several
+    receipts            Spread over the year before `--until`, most of them
+                        in a few very active groups
+    items               Sainsbury's-like products, loose ones sold by weight
+    user_items          Each item claimed by some members of its group
+    user_spending       Every member's cost of a receipt, split as in
+                        `src/utils/split_engine.py`
+    spending_rollups    Rebuilt from all of `user_spending` once done
+
+Rows are written with bulk inserts in batches of `--batch-size` items, each
+batch in its own transaction. IDs continue from the rows already in the
+tables, so a dataset can be added to an existing database. Runs with the same
+seed, scale and `--until` generate the same rows (password hashes aside, as
+bcrypt salts them); every synthetic user can log in as `user<ID>` with
+`synthetic_password`.
+
+Uses the database configured by `MODE` and its database URL (e.g. in `.env`),
+or `--url`.
+
+Usage:
+    python -m benchmarks.synthetic_data --users 10000 --groups 2000 \
+        --receipts 200000 --items 10000000 --seed 42
+    python -m benchmarks.synthetic_data --url sqlite:///synthetic.db \
+        --users 1000 --groups 200 --receipts 20000 --items 1000000
+"""
+# Standard Imports
+import argparse
+import random
+import time
+from collections import defaultdict
+from datetime import datetime as dt, timedelta
+
+# Third-Party Imports
+from sqlalchemy import create_engine, func, insert, select
+
+# Project-Specific Imports
+from src.utils.models import Base, Group, User, Receipt, Item, UserItems, \
+                             UserSpending
+from src.utils.spending_rollups import rebuild_rollups
+
+PASSWORD = 'synthetic_password'
+
+# Members per group, and share of items nobody claimed (yet)
+GROUP_SIZE = (2, 6)
+UNCLAIMED_ITEMS = 0.05
+
+# Products: (name, price range, sold by weight)
+BRANDS = ["Sainsbury's", "Sainsbury's", "Sainsbury's", "Taste the Difference",
+          "Warburtons", "Heinz", "Lee Kum Kee", "Jordans", "Andrex", "Colgate",
+          "Bisto", "Haribo", "Laila", "Napolina"]
+PRODUCTS = [
+    ("Penne 1kg", (0.7, 1.6), False),
+    ("Basmati Rice 2kg", (2.0, 4.5), False),
+    ("Free Range British Eggs Medium x12", (2.5, 4.0), False),
+    ("British Semi Skimmed Milk 2.27L", (1.4, 2.1), False),
+    ("Thick Sliced Seeded Bread 800g", (1.2, 2.2), False),
+    ("Pasta Bake Sauce 480g", (0.7, 1.9), False),
+    ("Soy Sauce 150ml", (1.0, 3.0), False),
+    ("Greek Style Natural Yogurt 1kg", (1.5, 2.5), False),
+    ("British Beef Mince 500g", (3.0, 5.5), False),
+    ("Chicken Thighs 1kg", (3.5, 6.0), False),
+    ("Toilet Tissue x9", (4.5, 8.0), False),
+    ("Triple Action Toothpaste 75ml", (1.0, 3.0), False),
+    ("Gravy Granules 190g", (1.2, 2.0), False),
+    ("Ground Cumin 43g", (0.9, 1.5), False),
+    ("Fairtrade Bananas x5", (0.7, 1.2), False),
+    ("Royal Gala Apples x6", (1.0, 2.2), False),
+    ("Broccoli Loose", (0.4, 2.0), True),
+    ("Root Ginger Loose", (0.2, 1.5), True),
+    ("Brown Onions Loose", (0.3, 1.2), True),
+    ("Carrots Loose", (0.2, 0.9), True),
+]
+
+TABLES = ['users', 'groups', 'user_groups', 'receipts', 'items', 'user_items',
+          'user_spending']
+
+
+class DatasetWriter():
+    """
+    Inserts generated rows in bulk, once `batch_size` items are buffered.
+
+    Example Usage:
+        writer = DatasetWriter(engine, batch_size=50000)
+        writer.add('receipts', {"receipt_id": 1, ...})
+        writer.flush_if_full()
+    """
+
+    # Parents first, for databases enforcing foreign keys
+    TARGETS = {'users': User, 'groups': Group, 'user_groups': Base.metadata
+               .tables['user_groups'], 'receipts': Receipt, 'items': Item,
+               'user_items': UserItems, 'user_spending': UserSpending}
+
+    def __init__(self, engine, batch_size: int):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.rows = defaultdict(list)
+        self.counts = defaultdict(int)
+
+    def add(self, table: str, row: dict):
+        self.rows[table].append(row)
+
+    def flush_if_full(self):
+        """Flush between receipts, so that no item is written without it."""
+        if len(self.rows['items']) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        with self.engine.begin() as connection:
+            for table in TABLES:
+                rows = self.rows.pop(table, None)
+                if rows:
+                    connection.execute(insert(self.TARGETS[table]), rows)
+                    self.counts[table] += len(rows)
+
+
+def next_ids(engine) -> dict:
+    """First free ID of each table with an ID, to add to existing data."""
+    columns = {'users': User.user_id, 'groups': Group.group_id,
+               'receipts': Receipt.receipt_id, 'items': Item.item_id}
+    with engine.connect() as connection:
+        return {table: (connection.scalar(select(func.max(column))) or 0) + 1
+                for table, column in columns.items()}
+
+
+def receipt_sizes(rng: random.Random, receipts: int, items: int):
+    """Number of items of each receipt, around the mean and summing to
+    `items`."""
+    remaining = items
+    for left in range(receipts, 0, -1):
+        if left == 1:
+            yield remaining
+            return
+        mean = remaining / left
+        size = max(1, round(mean * rng.uniform(0.3, 1.7)))
+        size = min(size, remaining - (left - 1))
+        remaining -= size
+        yield size
+
+
+def generate(writer: DatasetWriter, rng: random.Random, users: int,
+             groups: int, receipts: int, items: int, until: dt,
+             hashed_password: str, start: dict):
+    """Generate the dataset into `writer`."""
+    user_ids = range(start['users'], start['users'] + users)
+    for user_id in user_ids:
+        writer.add('users', {"user_id": user_id, "username": f"user{user_id}",
+                             "email": f"user{user_id}@example.com",
+                             "hashed_password": hashed_password})
+
+    # Households, covering every user at least once
+    shuffled = list(user_ids)
+    rng.shuffle(shuffled)
+    members = {}
+    for index in range(groups):
+        group_id = start['groups'] + index
+        size = min(rng.randint(*GROUP_SIZE), users)
+        group_members = {shuffled[(index * GROUP_SIZE[0] + offset) % users]
+                         for offset in range(GROUP_SIZE[0])}
+        while len(group_members) < size:
+            group_members.add(rng.choice(shuffled))
+        members[group_id] = sorted(group_members)
+
+        writer.add('groups', {"group_id": group_id,
+                              "group_name": f"Synthetic {group_id}",
+                              "description": f"Household of {size}"})
+        for user_id in members[group_id]:
+            writer.add('user_groups', {"user_id": user_id,
+                                       "group_id": group_id})
+
+    # A few groups upload most of the receipts
+    group_ids = list(members)
+    activity = [rng.paretovariate(1.2) for _ in group_ids]
+    receipt_groups = rng.choices(group_ids, weights=activity, k=receipts)
+
+    item_id = start['items']
+    for index, size in enumerate(receipt_sizes(rng, receipts, items)):
+        receipt_id = start['receipts'] + index
+        group_members = members[receipt_groups[index]]
+        slot_time = until - timedelta(seconds=rng.randrange(365 * 24 * 3600))
+
+        total_price = 0.0
+        costs = defaultdict(float)
+        for _ in range(size):
+            brand = rng.choice(BRANDS)
+            name, (low, high), loose = rng.choice(PRODUCTS)
+            if loose:
+                quantity, weight = None, round(rng.uniform(0.1, 1.5), 3)
+                price = round(weight * rng.uniform(low, high), 2)
+            else:
+                quantity, weight = rng.choices((1, 2, 3, 4),
+                                               (70, 18, 8, 4))[0], None
+                price = round(quantity * rng.uniform(low, high), 2)
+            writer.add('items', {"item_id": item_id,
+                                 "item_name": f"{brand} {name}",
+                                 "receipt_id": receipt_id,
+                                 "quantity": quantity, "weight": weight,
+                                 "price": price})
+            total_price += price
+
+            # Split between the members claiming it, as `split_engine` does
+            if rng.random() >= UNCLAIMED_ITEMS:
+                claimants = rng.sample(group_members,
+                                       rng.randint(1, len(group_members)))
+                units = [rng.randint(1, 3) for _ in claimants]
+                total_units = sum(units)
+                for user_id, unit in zip(claimants, units):
+                    writer.add('user_items', {"user_id": user_id,
+                                              "item_id": item_id,
+                                              "unit": unit})
+                    costs[user_id] += price * unit / total_units
+            item_id += 1
+
+        writer.add('receipts', {"receipt_id": receipt_id,
+                                "order_id": rng.randrange(10**8, 10**9),
+                                "slot_time": slot_time,
+                                "total_price": round(total_price, 2),
+                                "group_id": receipt_groups[index],
+                                "payment_card": rng.randrange(10**4),
+                                "locked_by": 0, "lock_timestamp": slot_time})
+        for user_id, cost in sorted(costs.items()):
+            writer.add('user_spending', {"user_id": user_id,
+                                         "receipt_id": receipt_id,
+                                         "cost": round(cost, 2)})
+        writer.flush_if_full()
+    writer.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--groups', type=int, default=2000)
+    parser.add_argument('--receipts', type=int, default=200000)
+    parser.add_argument('--items', type=int, default=10000000,
+                        help="Items in total, spread over the receipts")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--until', type=dt.fromisoformat,
+                        default=dt.combine(dt.today(), dt.min.time()),
+                        help="Date of the latest receipts, e.g. 2026-01-31. "
+                             "Default today")
+    parser.add_argument('--batch-size', type=int, default=50000,
+                        help="Items inserted per transaction")
+    parser.add_argument('--url', help="Database to fill instead of the one "
+                                      "configured by MODE")
+    args = parser.parse_args()
+    if args.users < GROUP_SIZE[0] or args.groups < 1 \
+            or not 1 <= args.receipts <= args.items:
+        parser.error(f"Needs at least {GROUP_SIZE[0]} users, a group, a "
+                     f"receipt and as many items as receipts")
+
+    if args.url:
+        engine = create_engine(args.url)
+        Base.metadata.create_all(bind=engine)
+    else:
+        from src.utils.database import engine
+
+    # Every synthetic user shares one hash, as bcrypt is slow by design
+    from src.utils.hashing import password_hasher
+    hashed_password = password_hasher.hash(PASSWORD)
+    password_hasher.shutdown()
+
+    start = next_ids(engine)
+    writer = DatasetWriter(engine, args.batch_size)
+    began = time.perf_counter()
+    generate(writer, random.Random(args.seed), args.users, args.groups,
+             args.receipts, args.items, args.until, hashed_password, start)
+    elapsed = time.perf_counter() - began
+
+    # Costs were inserted in bulk, past the incremental rollups
+    with engine.begin() as connection:
+        rollups = rebuild_rollups(connection)
+
+    print(f"{'table':>14}{'rows':>12}{'first ID':>10}")
+    for table in TABLES:
+        first_id = start.get(table, '')
+        print(f"{table:>14}{writer.counts[table]:>12}{first_id:>10}")
+    total = sum(writer.counts.values())
+    print(f"{total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s)")
+    print(f"{rollups} spending rollups rebuilt")
+
+
+if __name__ == '__main__':
+    main()
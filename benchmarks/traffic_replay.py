@@ -0,0 +1,400 @@
+"""
+traffic_replay.py
+
+Replays request traces recorded by `src/utils/traffic_recording.py` against a
+fresh app instance and a copy of a database snapshot, and compares the
+latency distributions of two code versions per route, to catch regressions
+on the real mix of traffic.
+
+`replay` rebuilds every request of the trace: routes with their arguments,
+query strings, JSON bodies with their IDs, units and costs, and receipt
+uploads (with the receipt of `tests/static_files` closest in size). Requests
+are sent through the WSGI test client at their recorded pace (scaled by
+`--speed`, 0 for back to back) from `--threads` threads, authenticated with
+access tokens minted for the recorded users. Recorded strings are replaced
+consistently: group names and usernames which existed when recorded by those
+of the snapshot, others (e.g. a resolve of a missing group, or a name created
+during the recording) by filler of the same length that matches nothing, so
+replayed resolves take the same path as the recorded ones. A name existed if
+a request using it in its route or body succeeded (2xx), other than the one
+creating it; bulk resolves succeed either way, so do not tell. Credentials are
+not recorded, so logins and registrations fail; these, and any other request
+whose status differs from the recorded one, are counted as mismatches. Event
+streams are skipped.
+
+The snapshot is a SQLite file, copied so that it is left untouched, or a
+database URL (`--url`) to be restored between runs.
+
+`compare` prints p50/p95/p99 per route of two replays and exits with status 1
+if a route with at least `--min-count` requests regressed by more than
+`--threshold` percent.
+
+Usage:
+    TRAFFIC_RECORD_FILE=traffic.jsonl gunicorn "src:create_app()"
+    git worktree add ../before main
+    (cd ../before && python -m benchmarks.traffic_replay replay \
+        ../app/traffic.jsonl --snapshot ../app/snapshot.db --json ../before.json)
+    python -m benchmarks.traffic_replay replay traffic.jsonl \
+        --snapshot snapshot.db --json after.json
+    python -m benchmarks.traffic_replay compare before.json after.json
+"""
+# Standard Imports
+import argparse
+import io
+import json
+import os
+import re
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from statistics import quantiles
+
+# Receipts uploaded in place of the recorded ones
+FILES_DIR = Path(__file__).parent.parent / 'tests' / 'static_files'
+
+# Placeholder of a recorded string
+PLACEHOLDER = re.compile(r'<str:(\d+):(\w+)>')
+
+# Recorded strings replaced by names of the snapshot
+NAME_ARGS = ('group_name', 'username')
+
+# Requests creating the name they are sent with
+CREATING = {('POST', 'users.register_user'), ('POST', 'groups.manage_groups')}
+
+
+def read_trace(paths: list) -> list:
+    """Entries of trace files (e.g. rotated ones), by start time."""
+    entries = []
+    for path in paths:
+        with open(path) as trace:
+            entries.extend(json.loads(line) for line in trace if line.strip())
+    return sorted(entries, key=lambda entry: entry["ts"])
+
+
+def percentiles(values):
+    if len(values) < 2:
+        return (values[0],) * 3 if values else (float('nan'),) * 3
+    cuts = quantiles(values, n=100, method='inclusive')
+    return cuts[49], cuts[94], cuts[98]
+
+
+def name_digests(value, arg: str = None):
+    """Digests of the recorded names in a route's arguments or a body."""
+    if isinstance(value, dict):
+        for name, item in value.items():
+            yield from name_digests(item, name)
+    elif isinstance(value, list):
+        for item in value:
+            yield from name_digests(item, arg)
+    elif arg in NAME_ARGS and isinstance(value, str):
+        match = PLACEHOLDER.fullmatch(value)
+        if match:
+            yield match[2]
+
+
+def existing_names(entries: list) -> set:
+    """
+    Digests of the names which existed when recorded: used in the route or
+    body of a successful request, other than the one creating them.
+    """
+    created, succeeded = set(), set()
+    for entry in entries:
+        digests = set(name_digests(entry["view_args"]))
+        digests.update(name_digests((entry["body"] or {}).get("json")))
+        if (entry["method"], entry["endpoint"]) in CREATING:
+            created.update(digests)
+        elif 200 <= entry["status"] < 300:
+            succeeded.update(digests - created)
+    return succeeded
+
+
+class Strings():
+    """
+    Consistent replacements of recorded strings: the same recorded value is
+    always replaced by the same string. Names which existed when recorded are
+    replaced by names of the snapshot, given by argument name.
+    """
+
+    def __init__(self, names: dict, existing: set = frozenset()):
+        self.names = names
+        self.existing = existing
+        self.values = {}
+        self._used = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def replace(self, value, arg: str = None):
+        if isinstance(value, dict):
+            return {name: self.replace(item, name)
+                    for name, item in value.items()}
+        if isinstance(value, list):
+            return [self.replace(item, arg) for item in value]
+        match = PLACEHOLDER.fullmatch(value) if isinstance(value, str) \
+            else None
+        if not match:
+            return value
+
+        length, digest = int(match[1]), match[2]
+        with self._lock:
+            if digest not in self.values:
+                names = self.names.get(arg)
+                if arg in NAME_ARGS and names and digest in self.existing:
+                    self.values[digest] = names[self._used[arg] % len(names)]
+                    self._used[arg] += 1
+                else:
+                    self.values[digest] = (digest * (length // len(digest)
+                                                     + 1))[:length]
+            return self.values[digest]
+
+
+class Replayer():
+    """Rebuilds and sends the requests of a trace to an app."""
+
+    def __init__(self, app, strings: Strings):
+        self.app = app
+        self.strings = strings
+        self.receipts = sorted((path.stat().st_size, path)
+                               for path in FILES_DIR.glob('*.pdf'))
+        self.tokens = {}
+        self.etags = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def token(self, user_id) -> str:
+        from flask_jwt_extended import create_access_token
+
+        with self._lock:
+            if user_id not in self.tokens:
+                with self.app.app_context():
+                    self.tokens[user_id] = create_access_token(
+                        identity=user_id)
+            return self.tokens[user_id]
+
+    def path(self, entry: dict) -> str:
+        from flask import url_for
+
+        view_args = self.strings.replace(entry["view_args"])
+        with self.app.test_request_context():
+            return url_for(entry["endpoint"], **view_args)
+
+    def send(self, entry: dict):
+        """Send a request of the trace. Returns (latency in ms, status)."""
+        if not hasattr(self._local, 'client'):
+            self._local.client = self.app.test_client()
+
+        path = self.path(entry)
+        query = [(name, value) for name, values
+                 in self.strings.replace(entry["query"]).items()
+                 for value in values]
+        headers = {}
+        if entry["user_id"] is not None:
+            headers['Authorization'] = f'Bearer {self.token(entry["user_id"])}'
+        if 'Idempotency-Key' in entry["headers"]:
+            # Retries of a request share their recorded key
+            headers['Idempotency-Key'] = self.strings.replace(
+                entry["headers"]['Idempotency-Key'], 'Idempotency-Key')
+        if 'If-None-Match' in entry["headers"] and path in self.etags:
+            headers['If-None-Match'] = self.etags[path]
+
+        kwargs = {}
+        body = entry["body"] or {}
+        if "json" in body:
+            kwargs['json'] = self.strings.replace(body["json"])
+        elif "files" in body:
+            data = {name: values[0] for name, values
+                    in self.strings.replace(body["form"]).items()}
+            for name, file in body["files"].items():
+                size, receipt = min(self.receipts, key=lambda receipt: abs(
+                    receipt[0] - file["size"]))
+                data[name] = (io.BytesIO(receipt.read_bytes()), receipt.name)
+            kwargs.update(data=data, content_type='multipart/form-data')
+
+        start = time.perf_counter()
+        response = self._local.client.open(
+            path, method=entry["method"], query_string=query,
+            headers=headers, **kwargs)
+        response.get_data()
+        latency = (time.perf_counter() - start) * 1000
+
+        if 'ETag' in response.headers:
+            self.etags[path] = response.headers['ETag']
+        return latency, response.status_code
+
+
+def code_version() -> str:
+    """Commit of the working tree, marked if it has changes."""
+    try:
+        commit = subprocess.run(['git', 'describe', '--always', '--dirty'],
+                                capture_output=True, text=True, check=True)
+        return commit.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def replay(args):
+    entries = [entry for entry in read_trace(args.trace)
+               if entry["endpoint"] and not entry["streamed"]]
+    if args.limit:
+        entries = entries[:args.limit]
+    if not entries:
+        sys.exit("No replayable requests in the trace")
+
+    # Configure the app before it is imported: a copy of the snapshot, and
+    # no logs or traces of the replay
+    work_dir = tempfile.mkdtemp(prefix='traffic-replay-')
+    if args.snapshot:
+        database = shutil.copy(args.snapshot, work_dir)
+        os.environ['DATABASE_URL_TEST'] = f'sqlite:///{database}'
+    else:
+        os.environ['DATABASE_URL_TEST'] = args.url
+    os.environ['MODE'] = 'testing'
+    os.environ['TRAFFIC_RECORD_FILE'] = ''
+    os.environ['LOG_FILE'] = os.path.join(work_dir, 'flask.log')
+    os.environ['LOG_CONSOLE'] = 'false'
+    os.environ['SLOW_QUERY_LOG'] = ''
+    os.environ.setdefault('SECRET_KEY', secrets.token_hex(32))
+
+    from sqlalchemy import select
+    from src import create_app
+    from src.utils.database import SessionLocal
+    from src.utils.models import Group, User
+
+    app = create_app()
+    app.config['RATE_LIMIT_ENABLED'] = False
+    with SessionLocal() as session:
+        names = {
+            'group_name': list(session.scalars(
+                select(Group.group_name).order_by(Group.group_id))),
+            'username': list(session.scalars(
+                select(User.username).order_by(User.user_id)))}
+    replayer = Replayer(app, Strings(names, existing_names(entries)))
+
+    latencies = defaultdict(list)
+    recorded = defaultdict(list)
+    mismatches = defaultdict(lambda: defaultdict(int))
+    lock = threading.Lock()
+
+    def run(entry):
+        route = f'{entry["method"]} {entry["route"]}'
+        latency, status = replayer.send(entry)
+        with lock:
+            latencies[route].append(latency)
+            recorded[route].append(entry["duration_ms"])
+            if status != entry["status"]:
+                mismatches[route][f'{entry["status"]}->{status}'] += 1
+
+    print(f"Replaying {len(entries)} requests at "
+          f"{'full speed' if not args.speed else f'{args.speed}x'} "
+          f"from {args.threads} threads ({code_version()})")
+    first_ts = entries[0]["ts"]
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        futures = []
+        for entry in entries:
+            if args.speed:
+                delay = (entry["ts"] - first_ts) / args.speed \
+                    - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append(pool.submit(run, entry))
+        for future in futures:
+            future.result()
+    elapsed = time.monotonic() - start
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'route':<48}{'count':>7}{'p50 (ms)':>10}{'p95 (ms)':>10}"
+          f"{'p99 (ms)':>10}{'rec p50':>9}  mismatches")
+    for route in sorted(latencies, key=lambda route: -len(latencies[route])):
+        p50, p95, p99 = percentiles(latencies[route])
+        print(f"{route:<48}{len(latencies[route]):>7}{p50:>10.1f}"
+              f"{p95:>10.1f}{p99:>10.1f}"
+              f"{percentiles(recorded[route])[0]:>9.1f}  " + ' '.join(
+                  f"{change}x{count}"
+                  for change, count in mismatches[route].items()))
+    print(f"{len(entries)} requests in {elapsed:.1f}s")
+
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump({"version": code_version(), "trace": args.trace,
+                       "requests": len(entries), "elapsed": elapsed,
+                       "routes": {route: {
+                           "latencies_ms": latencies[route],
+                           "recorded_ms": recorded[route],
+                           "mismatches": mismatches[route]}
+                           for route in latencies}}, output)
+
+
+def compare(args):
+    with open(args.before) as before_file, open(args.after) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+
+    print(f"{before['version']} -> {after['version']}")
+    print(f"{'route':<48}{'count':>7}{'p50 (ms)':>16}{'p95 (ms)':>16}"
+          f"{'p99 (ms)':>16}{'change':>9}")
+    regressions = []
+    for route in sorted(set(before["routes"]) | set(after["routes"])):
+        old = before["routes"].get(route, {}).get("latencies_ms", [])
+        new = after["routes"].get(route, {}).get("latencies_ms", [])
+        old_stats, new_stats = percentiles(old), percentiles(new)
+        change = max((new_value / old_value - 1) * 100
+                     for old_value, new_value
+                     in zip(old_stats[:2], new_stats[:2])
+                     if old_value > 0) if old and new else float('nan')
+
+        regressed = min(len(old), len(new)) >= args.min_count \
+            and change > args.threshold
+        if regressed:
+            regressions.append(route)
+        print(f"{route:<48}{min(len(old), len(new)):>7}" + ''.join(
+            f"{old_value:>7.1f} ->{new_value:>6.1f}"
+            for old_value, new_value in zip(old_stats, new_stats))
+            + f"{change:>+8.0f}%" + ('  REGRESSED' if regressed else ''))
+
+    if regressions:
+        print(f"{len(regressions)} routes regressed by more than "
+              f"{args.threshold:.0f}% (p50 or p95)")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    replay_parser = commands.add_parser('replay', help="Replay a trace")
+    replay_parser.add_argument('trace', nargs='+',
+                               help="Trace files, e.g. traffic.jsonl*")
+    database = replay_parser.add_mutually_exclusive_group(required=True)
+    database.add_argument('--snapshot', help="SQLite snapshot, copied")
+    database.add_argument('--url', help="Database URL, used as is")
+    replay_parser.add_argument('--speed', type=float, default=1.0,
+                               help="Pace relative to the recording, 0 for "
+                                    "back to back")
+    replay_parser.add_argument('--threads', type=int, default=8)
+    replay_parser.add_argument('--limit', type=int,
+                               help="Replay only the first requests")
+    replay_parser.add_argument('--json', help="Write the latencies to this "
+                                              "file, to compare")
+    replay_parser.set_defaults(run=replay)
+
+    compare_parser = commands.add_parser('compare',
+                                         help="Compare two replays")
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.add_argument('--threshold', type=float, default=10,
+                                help="Regression in percent of p50 or p95")
+    compare_parser.add_argument('--min-count', type=int, default=20,
+                                help="Requests of a route to judge it")
+    compare_parser.set_defaults(run=compare)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
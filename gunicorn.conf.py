@@ -0,0 +1,170 @@
+"""
+gunicorn.conf.py
+
+Production gunicorn configuration, picked up automatically when gunicorn is
+started from the repository root:
+    gunicorn "src:create_app()"
+
+Workers and threads are sized from the CPUs available to the container and
+the workload type:
+    io     Mostly small database-bound reads (default). Few processes with
+           many threads, as threads wait on the database with the GIL released
+    cpu    Mostly password hashing and receipt parsing. One process per CPU,
+           no threads, as CPU-bound Python code holds the GIL
+    mixed  In between
+
+The app is preloaded in the master process, so import-time work (creating
+tables, reading the environment) runs once. Connections opened meanwhile are
+discarded before forking so workers never share a database socket. Workers
+are recycled after a jittered number of requests to bound memory growth from
+receipt parsing, without restarting all workers at once.
+
+Each open event stream (`GET /groups/<id>/events`) holds a thread for up to
+EVENTS_STREAM_SECONDS, so a worker serves at most EVENTS_MAX_STREAMS streams,
+half of its threads unless set, and refuses more with 503. Sync workers (one
+thread, e.g. the `cpu` workload) therefore serve no streams.
+
+Prometheus metrics are aggregated across workers through files in
+PROMETHEUS_MULTIPROC_DIR (see `src/utils/metrics.py`), a fresh temporary
+directory unless set. Each worker writes its own log file, `flask.<pid>.log`
+(see LOG_FILE in `src/utils/app_logger.py`), as rotating one file from several
+processes is unsafe.
+
+Configuration (environmental variables):
+    GUNICORN_WORKLOAD: `io`, `cpu` or `mixed`. Default `io`
+    GUNICORN_WORKERS, GUNICORN_THREADS: Override the computed sizes
+    GUNICORN_BIND: Default `0.0.0.0:$PORT`, with PORT defaulting to 8000
+    GUNICORN_MAX_REQUESTS: Requests before a worker is recycled, 0 to disable.
+        Default 1000, with up to 10% jitter
+    GUNICORN_TIMEOUT: Seconds of silence before a worker is killed. Default 30
+    GUNICORN_GRACEFUL_TIMEOUT: Seconds to finish in-flight requests on
+        restart or shutdown. Default 30
+    GUNICORN_KEEPALIVE: Seconds to hold idle keep-alive connections. Default 5
+    GUNICORN_LOG_LEVEL: Default `info`
+    GUNICORN_ACCESS_LOG: Access log file, empty to disable. Default `-`
+        (stdout)
+    PROMETHEUS_MULTIPROC_DIR: Directory of the workers' metric files, cleared
+        on startup. Default a temporary directory
+    EVENTS_MAX_STREAMS: Event streams open at once per worker. Default half
+        the threads
+"""
+# Standard Imports
+import os
+import math
+import shutil
+import tempfile
+from pathlib import Path
+
+
+def available_cpus() -> int:
+    """
+    CPUs this process may use, honouring CPU affinity and the cgroup (v2) CPU
+    quota of containers, which `os.cpu_count()` ignores.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+
+    return cpus
+
+
+def size_workers(workload: str, cpus: int):
+    """
+    Number of worker processes and threads per worker for a workload type.
+    """
+    if workload == 'cpu':
+        return cpus + 1, 1
+    if workload == 'mixed':
+        return 2 * cpus + 1, 2
+    if workload == 'io':
+        return cpus + 1, 8
+    raise ValueError(f"Invalid GUNICORN_WORKLOAD: {workload}")
+
+
+workload = os.getenv('GUNICORN_WORKLOAD', 'io')
+default_workers, default_threads = size_workers(workload, available_cpus())
+
+# Server socket
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', 8000)}")
+
+# Worker processes
+workers = int(os.getenv('GUNICORN_WORKERS', default_workers))
+threads = int(os.getenv('GUNICORN_THREADS', default_threads))
+worker_class = 'gthread' if threads > 1 else 'sync'
+preload_app = True
+
+# Recycle workers, with jitter so they do not all restart together
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+
+# Timeouts
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Leave threads free for other requests while event streams are open, set
+# before the app is (pre)loaded
+os.environ.setdefault('EVENTS_MAX_STREAMS', str(threads // 2))
+
+# Keep worker heartbeats off disk-backed /tmp when shared memory is available
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+# Metrics shared by the workers, set before the app is (pre)loaded
+metrics_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+created_metrics_dir = not metrics_dir
+if created_metrics_dir:
+    metrics_dir = tempfile.mkdtemp(
+        prefix='prometheus-',
+        dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = metrics_dir
+else:
+    # Discard the metric files of a previous run
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in Path(metrics_dir).glob('*.db'):
+        path.unlink()
+
+# Logging
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+
+
+# Server hooks ----------------------------------------------------------------
+def when_ready(server):
+    """Close the master's database connections, opened by the preload."""
+    from src.utils.database import engine
+    engine.dispose()
+
+    server.log.info(f"Workload '{workload}': {workers} {worker_class} "
+                    f"workers x {threads} threads, recycled after "
+                    f"{max_requests}+{max_requests_jitter} requests")
+
+
+def post_fork(server, worker):
+    """
+    Drop any pooled connection inherited from the master without closing it,
+    which would close the master's socket too.
+    """
+    from src.utils.database import engine
+    engine.dispose(close=False)
+
+
+def child_exit(server, worker):
+    """Drop the live gauges (e.g. in-flight requests) of an exited worker."""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    if created_metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
@@ -7,11 +7,25 @@ from flask import Flask
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 
+# Logging, configured before the routes (and database) modules log anything
+from src.utils.app_logger import init_request_logging
+
 # Routes
 from src.routes.group_routes import groups_blueprint
 from src.routes.user_routes import users_blueprint
 from src.routes.receipt_routes import receipt_blueprint
 
+# Utilities
+from src.utils.metrics import init_metrics
+from src.utils.profiling import init_profiling
+from src.utils.memory_tracking import init_memory_tracking
+from src.utils.traffic_recording import init_traffic_recording
+from src.utils.server_timing import init_server_timing
+from src.utils.compression import init_compression
+from src.utils.rate_limit import init_rate_limits
+from src.utils.revocation import init_revocation
+from src.utils.receipt_locks import init_receipt_locks
+
 def create_app():
     app = Flask(__name__)
     
@@ -35,4 +49,37 @@ def create_app():
     
     jwt = JWTManager(app)
     
+    # Reject tokens revoked on logout
+    init_revocation(jwt)
+    
+    # Record per-endpoint latency and status metrics, served at /metrics.
+    # Registered first so that the other hooks are timed too
+    init_metrics(app)
+    
+    # Tag log records and responses with a request ID
+    init_request_logging(app)
+    
+    # Time JWT decoding, database sessions, parsing and serialization in a
+    # Server-Timing header
+    init_server_timing(app, jwt)
+    
+    # Profile requests sent with X-Profile, or sampled, to PROFILE_DIR
+    init_profiling(app)
+    
+    # Trace the memory of receipt uploads, reported at /memory
+    init_memory_tracking(app)
+    
+    # Record sanitized traces of requests to TRAFFIC_RECORD_FILE, for replay.
+    # Registered before compression so that response sizes are as sent
+    init_traffic_recording(app)
+    
+    # Compress JSON responses (gzip, or brotli if installed)
+    init_compression(app)
+    
+    # Throttle login and registration attempts
+    init_rate_limits(app)
+    
+    # Release expired receipt leases in the background
+    init_receipt_locks(app)
+    
     return app
@@ -0,0 +1,127 @@
+"""
+asgi.py
+
+ASGI entrypoint, an alternative to serving `run.py`'s Flask app with a WSGI
+server. The I/O-bound read routes of users and groups (see
+`routes/async_routes.py`) are served by async views on the async database
+engine, so one process handles many concurrent reads while waiting on the
+database. Every other request falls through to the Flask app, run on a
+bounded thread pool.
+
+Run with an ASGI server, e.g.
+    uvicorn src.asgi:app --host 0.0.0.0 --port 8000
+
+Configuration (environmental variables):
+    ASGI_WSGI_THREADS (int): Threads running Flask routes. Default 10
+"""
+# Standard Imports
+import os
+import time
+import logging
+import traceback
+
+# Third-Party Imports
+from a2wsgi import WSGIMiddleware
+from dotenv import load_dotenv
+from flask import Flask
+from starlette.requests import Request
+from starlette.routing import Match
+
+# Project-Specific Imports
+from src import create_app
+from src.routes.async_routes import async_routes
+from src.utils.app_logger import request_id, new_request_id, REQUEST_ID_HEADER
+from src.utils.async_database import async_engine
+from src.utils.async_views import json_response, compress_response
+from src.utils.metrics import observe_request, requests_in_progress, UNMATCHED
+
+# Load environment variables
+load_dotenv()
+
+ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', 10))
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.asgi')
+
+
+class AsyncApp():
+    """
+    ASGI app dispatching to async routes, falling back to a Flask app.
+
+    Example Usage:
+        app = AsyncApp(create_app(), async_routes)
+    """
+
+    def __init__(self, flask_app: Flask, routes: list,
+                 wsgi_threads: int = ASGI_WSGI_THREADS):
+        self.flask_app = flask_app
+        self.routes = routes
+        self.wsgi_app = WSGIMiddleware(flask_app, workers=wsgi_threads)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(scope, receive, send)
+
+        if scope['type'] == 'http':
+            for route in self.routes:
+                match, child_scope = route.matches(scope)
+                if match == Match.FULL:
+                    scope = {**scope, **child_scope, 'app': self}
+                    return await self.handle(route.endpoint, scope,
+                                             receive, send)
+
+        # Routes not (yet) served asynchronously, or another method
+        await self.wsgi_app(scope, receive, send)
+
+    def flask_endpoint(self, scope) -> str:
+        """Name of the Flask endpoint of a path, to label its metrics."""
+        try:
+            return self.flask_app.url_map.bind('').match(
+                scope['path'], scope['method'])[0]
+        except Exception:
+            return UNMATCHED
+
+    async def handle(self, endpoint, scope, receive, send):
+        request = Request(scope, receive)
+        metrics_endpoint = self.flask_endpoint(scope)
+        in_progress = requests_in_progress.labels(request.method,
+                                                  metrics_endpoint)
+        in_progress.inc()
+        start = time.perf_counter()
+        token = request_id.set(new_request_id(
+            request.headers.get(REQUEST_ID_HEADER)))
+        try:
+            try:
+                response = await endpoint(request)
+            except Exception as e:
+                logger.error("Unhandled error on %s - %s", request.url.path, e)
+                logger.debug(traceback.format_exc())
+                response = json_response(request, {
+                    "error": "Internal Server Error", "message": str(e)}, 500)
+
+            response = compress_response(request, response)
+            response.headers[REQUEST_ID_HEADER] = request_id.get()
+            await response(scope, receive, send)
+            observe_request(request.method, metrics_endpoint,
+                            response.status_code, time.perf_counter() - start)
+        finally:
+            in_progress.dec()
+            request_id.reset(token)
+
+    async def lifespan(self, scope, receive, send):
+        """Dispose the async engine's connections on shutdown."""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_asgi_app() -> AsyncApp:
+    return AsyncApp(create_app(), async_routes)
+
+
+app = create_asgi_app()
@@ -0,0 +1,290 @@
+"""
+Async versions of the read routes in `user_routes.py` and `group_routes.py`,
+served by the ASGI entry point (`asgi.py`). Responses match the Flask routes;
+any request not matched here falls through to the Flask app.
+
+Queries are the read models in `read_models.py`, run through the async engine
+with `run_sync`, so both serving modes issue identical SQL.
+"""
+# Standard Imports
+import logging
+
+# Third-Party Imports
+from starlette.requests import Request
+from starlette.routing import Route
+
+# Project-Specific Imports
+from src.utils.async_database import AsyncSessionLocal
+from src.utils.async_views import json_response, async_jwt_required, \
+                                  async_group_member_required, async_etag_for
+from src.utils.cache import username_to_id, user_id_to_name, \
+                            group_name_to_id, MISSING
+from src.utils.versioning import GROUP, GROUP_LIST
+from src.utils.read_models import to_dicts, get_user, list_user_groups, \
+                                  list_user_costs, find_users, list_groups, \
+                                  get_group, list_group_members, find_groups
+
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.async_routes')
+
+
+# Users -----------------------------------------------------------------------
+@async_jwt_required
+async def get_user_info(request: Request):
+    """Get user information of the authorized user."""
+    user_id = request.state.user_id
+
+    async with AsyncSessionLocal() as session:
+        user = await session.run_sync(get_user, user_id)
+
+    # Return 404 Not Found if the user no longer exists
+    if not user:
+        return json_response(request, {"error": "Not Found",
+                                       "message": "User does not exist"}, 404)
+
+    return json_response(request, user._asdict())
+
+
+async def resolve_username(request: Request):
+    """Get user ID of a given username"""
+    username = request.path_params['username']
+    user_id = username_to_id.get(username)
+
+    # Cache miss: look up the user ID and cache it, even if not found
+    if user_id is MISSING:
+        async with AsyncSessionLocal() as session:
+            rows = await session.run_sync(find_users, [], [username])
+        user_id = rows[0].user_id if rows else None
+        username_to_id.set(username, user_id)
+
+    if not user_id:
+        return json_response(
+            request, {"message": "No users found with this name"}, 404)
+
+    return json_response(request, {"message": "User ID found",
+                                   "user_id": user_id})
+
+
+async def resolve_user_id(request: Request):
+    """Get username of a given user ID"""
+    user_id = request.path_params['user_id']
+    username = user_id_to_name.get(user_id)
+
+    # Cache miss: look up the username and cache it, even if not found
+    if username is MISSING:
+        async with AsyncSessionLocal() as session:
+            rows = await session.run_sync(find_users, [user_id], [])
+        username = rows[0].username if rows else None
+        user_id_to_name.set(user_id, username)
+
+    if not username:
+        return json_response(
+            request, {"message": "No users found with this ID"}, 404)
+
+    return json_response(request, {"message": "Username found",
+                                   "username": username})
+
+
+async def resolve_users(request: Request):
+    """
+    Resolve many user IDs and/or usernames in one request, see
+    `user_routes.resolve_users`.
+    """
+    # Invalid IDs are skipped, as with Flask's `getlist(type=int)`
+    user_ids = [int(i) for i in request.query_params.getlist("user_id")
+                if i.isdigit()]
+    usernames = request.query_params.getlist("username")
+
+    if not user_ids and not usernames:
+        return json_response(request, {
+            "error": "Bad Request",
+            "message": "Provide at least one user_id or username"
+        }, 400)
+
+    names_by_id = user_id_to_name.get_many(user_ids)
+    ids_by_name = username_to_id.get_many(usernames)
+    missed_ids = [i for i in user_ids if i not in names_by_id]
+    missed_names = [n for n in usernames if n not in ids_by_name]
+
+    # Resolve all cache misses with a single query
+    if missed_ids or missed_names:
+        async with AsyncSessionLocal() as session:
+            rows = await session.run_sync(find_users, missed_ids,
+                                          missed_names)
+
+        found_names = {row.user_id: row.username for row in rows}
+        found_ids = {row.username: row.user_id for row in rows}
+        fetched_names = {i: found_names.get(i) for i in missed_ids}
+        fetched_ids = {n: found_ids.get(n) for n in missed_names}
+
+        user_id_to_name.set_many(fetched_names)
+        username_to_id.set_many(fetched_ids)
+        names_by_id.update(fetched_names)
+        ids_by_name.update(fetched_ids)
+
+    # Merge both directions into unique users
+    users = {user_id: username
+             for user_id, username in names_by_id.items() if username}
+    users.update({user_id: username
+                  for username, user_id in ids_by_name.items() if user_id})
+
+    return json_response(request, {
+        "users": [{"user_id": user_id, "username": username}
+                  for user_id, username in users.items()],
+        "missing": {
+            "user_ids": [i for i, n in names_by_id.items() if not n],
+            "usernames": [n for n, i in ids_by_name.items() if not i]
+        }
+    })
+
+
+@async_jwt_required
+async def get_groups_joined_by_user(request: Request):
+    """Get the groups joined by the authorized user."""
+    async with AsyncSessionLocal() as session:
+        groups = await session.run_sync(list_user_groups,
+                                        request.state.user_id)
+
+    return json_response(request, to_dicts(groups))
+
+
+@async_jwt_required
+async def get_user_costs(request: Request):
+    """Cost spent by the authorized user on each receipt."""
+    async with AsyncSessionLocal() as session:
+        results = await session.run_sync(list_user_costs,
+                                         request.state.user_id)
+
+    # Return error 404 if no results are returned
+    if not results:
+        return json_response(request, {
+            "error": "Not Found",
+            "message": "No records found for the given user_id"}, 404)
+
+    return json_response(request, to_dicts(results))
+
+
+# Groups ----------------------------------------------------------------------
+@async_etag_for(GROUP_LIST)
+async def get_all_groups(request: Request):
+    """Get all available groups"""
+    async with AsyncSessionLocal() as session:
+        groups = await session.run_sync(list_groups)
+
+    if not groups:
+        return json_response(request, {"error": "No Content",
+                                       "message": "No groups available"}, 404)
+
+    return json_response(request, to_dicts(groups))
+
+
+@async_group_member_required()
+@async_etag_for(GROUP, 'group_id')
+async def get_group_info(request: Request):
+    """Get the name and description of a group"""
+    group_id = request.path_params['group_id']
+
+    async with AsyncSessionLocal() as session:
+        group = await session.run_sync(get_group, group_id)
+
+    if not group:
+        return json_response(request, {
+            "error": "Not Found",
+            "message": "Group with given ID not found"}, 404)
+
+    return json_response(request, {
+        "message": "Group found",
+        "group_id": group_id,
+        "group_name": group.group_name,
+        "description": group.description
+    })
+
+
+async def resolve_group_name(request: Request):
+    """Get group ID of a given group name"""
+    group_name = request.path_params['group_name']
+    group_id = group_name_to_id.get(group_name)
+
+    # Cache miss: look up the group ID and cache it, even if not found
+    if group_id is MISSING:
+        async with AsyncSessionLocal() as session:
+            rows = await session.run_sync(find_groups, [group_name])
+        group_id = rows[0].group_id if rows else None
+        group_name_to_id.set(group_name, group_id)
+
+    if not group_id:
+        return json_response(request, {
+            "error": "Not Found",
+            "message": f"No group with name '{group_name}' is found"
+        }, 400)
+
+    return json_response(request, {"message": "Group resolved successfully",
+                                   "group_id": group_id})
+
+
+async def resolve_group_names(request: Request):
+    """
+    Resolve many group names in one request, see
+    `group_routes.resolve_group_names`.
+    """
+    group_names = request.query_params.getlist("group_name")
+
+    if not group_names:
+        return json_response(request, {
+            "error": "Bad Request",
+            "message": "Provide at least one group_name"}, 400)
+
+    ids_by_name = group_name_to_id.get_many(group_names)
+    missed_names = [name for name in group_names if name not in ids_by_name]
+
+    # Resolve all cache misses with a single query
+    if missed_names:
+        async with AsyncSessionLocal() as session:
+            rows = await session.run_sync(find_groups, missed_names)
+
+        found = {row.group_name: row.group_id for row in rows}
+        fetched = {name: found.get(name) for name in missed_names}
+        group_name_to_id.set_many(fetched)
+        ids_by_name.update(fetched)
+
+    return json_response(request, {
+        "groups": [{"group_id": group_id, "group_name": name}
+                   for name, group_id in ids_by_name.items() if group_id],
+        "missing": [name for name, group_id in ids_by_name.items()
+                    if not group_id]
+    })
+
+
+@async_group_member_required()
+@async_etag_for(GROUP, 'group_id')
+async def get_all_users_in_group(request: Request):
+    """Get the user ID and username of the members of a group"""
+    async with AsyncSessionLocal() as session:
+        users_in_group = await session.run_sync(
+            list_group_members, request.path_params['group_id'])
+
+    if not users_in_group:
+        return json_response(
+            request, {"error": "No user found in this group!"}, 404)
+
+    return json_response(request, to_dicts(users_in_group))
+
+
+# Integer routes come first, as in Flask an `int` converter takes precedence
+async_routes = [
+    Route('/users', get_user_info, methods=['GET']),
+    Route('/users/resolve/{user_id:int}', resolve_user_id, methods=['GET']),
+    Route('/users/resolve/{username:str}', resolve_username,
+          methods=['GET']),
+    Route('/users/resolve', resolve_users, methods=['GET']),
+    Route('/users/groups', get_groups_joined_by_user, methods=['GET']),
+    Route('/users/costs', get_user_costs, methods=['GET']),
+    Route('/groups', get_all_groups, methods=['GET']),
+    Route('/groups/{group_id:int}', get_group_info, methods=['GET']),
+    Route('/groups/resolve/{group_name:str}', resolve_group_name,
+          methods=['GET']),
+    Route('/groups/resolve', resolve_group_names, methods=['GET']),
+    Route('/groups/{group_id:int}/users', get_all_users_in_group,
+          methods=['GET']),
+]
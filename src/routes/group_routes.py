@@ -1,22 +1,35 @@
 # Standard Imports
+import time
 import logging
 
 # Third-Party Imports
-from flask import Blueprint, request, jsonify
-from sqlalchemy import select
+from flask import Blueprint, Response, request, jsonify
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from sqlalchemy import select, insert, delete, exists
 
 # Project-Specific Imports
 from src.utils.database import SessionLocal
 from src.utils.models import Group, User, UserGroups
-from src.utils.Authentication import Authentication
+from src.utils.versioning import etag_for, bump_version, get_version, \
+                                 GROUP, GROUP_LIST
+from src.utils.cache import group_name_to_id, MISSING
+from src.utils.authorization import group_member_required, \
+                                   authorize_groups, remember_membership, \
+                                   forget_membership, forget_group
+from src.utils.read_models import to_dicts, list_groups, get_group, \
+                                  list_group_members, list_group_rollups, \
+                                  find_groups
+from src.utils.spending_rollups import summary_args, summarize, bucket_start
+from src.utils.events import event_bus, EVENTS_HEARTBEAT, \
+                             EVENTS_STREAM_SECONDS
 
 groups_blueprint = Blueprint('groups', __name__)
-auth = Authentication()
 
 # Module-level logging inherited from 'main'
 logger = logging.getLogger('main.user_routes')
 
-@groups_blueprint.route('', methods=['GET', 'POST', 'OUT', 'DELETE'])
+@groups_blueprint.route('', methods=['GET', 'POST', 'PUT', 'DELETE'])
+@etag_for(GROUP_LIST)
 def manage_groups():
     """
     General route for group management.
@@ -25,6 +38,8 @@ def manage_groups():
     POST: Create a group given group name and description
     PUT: Update an existing group given a new group name and description
     DELETE: Delete a group.
+
+    PUT and DELETE require a JWT of a member of the group.
     """
     # GET: Get all available groups
     if request.method == 'GET':
@@ -34,7 +49,7 @@ def manage_groups():
         try:
             with SessionLocal() as session:
 
-                groups = session.query(Group).all()
+                groups = list_groups(session)
                 
                 # Raise no content error if no groups found
                 if not groups:
@@ -42,11 +57,7 @@ def manage_groups():
                                     "message": "No groups available"}), 404
                 
                 # Successful code
-                return jsonify([{
-                    "group_id": group.group_id,
-                    "group_name": group.group_name,
-                    "description": group.description
-                } for group in groups]), 200
+                return jsonify(to_dicts(groups)), 200
             
         except Exception as e:
             return jsonify({"error": str(e)}), 500
@@ -84,6 +95,12 @@ def manage_groups():
                 # Fetch the newly created group, including the auto-incremented
                 # group_id
                 session.refresh(new_group)
+                bump_version(session, GROUP, new_group.group_id)
+                bump_version(session, GROUP_LIST, 0)
+                session.commit()
+                
+                # The name may have been cached as unknown
+                group_name_to_id.invalidate(group_name)
                 
                 return jsonify({"message": "Group created successfully!",
                                 "group": {
@@ -102,6 +119,8 @@ def manage_groups():
         
         logger.info("Attempting to update group info...")
         
+        # Raises 401 if the JWT is missing or invalid
+        verify_jwt_in_request()
         data = request.json
     
         try: 
@@ -122,6 +141,11 @@ def manage_groups():
                 if not group:
                     return jsonify({"error": "Group not found!"}), 404
                 
+                denied = authorize_groups(get_jwt_identity(),
+                                          [group.group_id])
+                if denied:
+                    return denied
+                
                 # Check if there is a group with the new name
                 existing_group = session.query(Group)\
                     .filter_by(group_name=new_name)\
@@ -135,6 +159,10 @@ def manage_groups():
                     group.group_name = new_name
                 if new_description:
                     group.description = new_description
+                bump_version(session, GROUP, group.group_id)
+                bump_version(session, GROUP_LIST, 0)
+
+            group_name_to_id.invalidate(old_name, new_name)
 
             return jsonify({"status": "success", "message": "Group updated successfully!"}), 200
         
@@ -146,6 +174,8 @@ def manage_groups():
         
         logging.info("Attempting to delete a group...")
         
+        # Raises 401 if the JWT is missing or invalid
+        verify_jwt_in_request()
         data = request.json
         group_name = data.get('group_name', False)
         
@@ -159,8 +189,17 @@ def manage_groups():
                     filter_by(group_name=group_name).one_or_none()
                 if not group:
                     return jsonify({"error": "Group not found!"}), 404
+                denied = authorize_groups(get_jwt_identity(),
+                                          [group.group_id])
+                if denied:
+                    return denied
+                bump_version(session, GROUP, group.group_id)
+                bump_version(session, GROUP_LIST, 0)
                 session.delete(group)
 
+            group_name_to_id.invalidate(group_name)
+            forget_group(group.group_id)
+
             # Upon successful deletion, return 204 - no content
             return '', 204
             
@@ -169,17 +208,18 @@ def manage_groups():
         
 
 @groups_blueprint.route('/<int:group_id>', methods=['GET'])
+@group_member_required()
+@etag_for(GROUP, 'group_id')
 def get_group_info(group_id: int):
     """
     Get the name and description of a group
     """
-    logger.info(f"Fetching group information for group ID {group_id}")
+    logger.info("Fetching group information for group ID %s", group_id)
     
     try:
         with SessionLocal() as session:
             
-            group = session.execute(select(Group)\
-                .where(Group.group_id == group_id)).one_or_none()
+            group = get_group(session, group_id)
             
             # Raise 404 Not Found error if no group with this ID is found
             if not group:
@@ -203,41 +243,169 @@ def get_group_info(group_id: int):
 @groups_blueprint.route('/resolve/<string:group_name>', methods=['GET'])
 def resolve_group_name(group_name: str):
     
-    with SessionLocal() as session:
-        group_id = session.scalar(
-            select(Group.group_id).where(Group.group_name == group_name))
+    group_id = group_name_to_id.get(group_name)
+    
+    # Cache miss: look up the group ID and cache it, even if not found
+    if group_id is MISSING:
+        with SessionLocal() as session:
+            group_id = session.scalar(
+                select(Group.group_id).where(Group.group_name == group_name))
+        group_name_to_id.set(group_name, group_id)
         
-        if not group_id:
-            return jsonify({
-                "error": "Not Found",
-                "message": f"No group with name '{group_name}' is found"
-            }), 400
+    if not group_id:
+        return jsonify({
+            "error": "Not Found",
+            "message": f"No group with name '{group_name}' is found"
+        }), 400
         
     return jsonify({
         "message": "Group resolved successfully", "group_id": group_id}), 200
+
+
+@groups_blueprint.route('/resolve', methods=['GET'])
+def resolve_group_names():
+    """
+    Resolve many group names in one request, given as repeated query
+    parameters, e.g. `/groups/resolve?group_name=Flat&group_name=Office`.
+        {
+            "groups": [{"group_id": 1, "group_name": "Flat"}],
+            "missing": ["Office"]
+        }
+    """
+    group_names = request.args.getlist("group_name")
+    
+    if not group_names:
+        return jsonify({"error": "Bad Request",
+                        "message": "Provide at least one group_name"}), 400
+    
+    ids_by_name = group_name_to_id.get_many(group_names)
+    missed_names = [name for name in group_names if name not in ids_by_name]
+    
+    # Resolve all cache misses with a single query
+    if missed_names:
+        with SessionLocal() as session:
+            rows = find_groups(session, missed_names)
+        
+        found = {row.group_name: row.group_id for row in rows}
+        fetched = {name: found.get(name) for name in missed_names}
+        group_name_to_id.set_many(fetched)
+        ids_by_name.update(fetched)
+    
+    return jsonify({
+        "groups": [{"group_id": group_id, "group_name": name}
+                   for name, group_id in ids_by_name.items() if group_id],
+        "missing": [name for name, group_id in ids_by_name.items()
+                    if not group_id]
+    }), 200
    
      
 @groups_blueprint.route('/<int:group_id>/users', methods=['GET'])
+@group_member_required()
+@etag_for(GROUP, 'group_id')
 def get_all_users_in_group(group_id: int):
     """
     Get the user information within a group of group_id, including user_id and username.
     """
     with SessionLocal() as session:
-        users_in_group = session.query(User).join(
-            UserGroups, User.user_id==UserGroups.c.user_id
-        ).filter(UserGroups.c.group_id==group_id)
+        users_in_group = list_group_members(session, group_id)
         
-        if not users_in_group:
-            return jsonify({"error": "No user found in this group!"}), 404
+    if not users_in_group:
+        return jsonify({"error": "No user found in this group!"}), 404
     
-    return jsonify([{
-        "user_id": user.user_id,
-        "username": user.username
-    } for user in users_in_group])
+    return jsonify(to_dicts(users_in_group))
+
+
+@groups_blueprint.route('/<int:group_id>/costs/summary', methods=['GET'])
+@group_member_required()
+def get_group_costs_summary(group_id: int):
+    """
+    Spending in the group per week or month (`?bucket=week|month`), in total
+    and per user, from `start` to `end` (YYYY-MM-DD, optional). Every bucket
+    of the range is listed, empty ones with a cost of 0.
+        {
+            "bucket": "month",
+            "buckets": ["2024-06-01", "2024-07-01"],
+            "costs": [21.88, 9.10], "receipts": [2, 1], "total": 30.98,
+            "users": [{"user_id": 1, "username": "Username1",
+                       "costs": [12.78, 0.0], "receipts": [1, 0],
+                       "total": 12.78}, ...]
+        }
+    """
+    logger.info("Fetching costs summary of group ID %s", group_id)
+
+    try:
+        period, start, end = summary_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": "Bad Request", "message": str(e)}), 400
+
+    try:
+        with SessionLocal() as session:
+            rows = list_group_rollups(
+                session, group_id, period,
+                since=start and bucket_start(start, period), until=end)
+
+        try:
+            summary = summarize(rows, period, 'user_id', 'username', 'users',
+                                start, end)
+        except ValueError as e:
+            return jsonify({"error": "Bad Request", "message": str(e)}), 400
+        return jsonify(summary), 200
+
+    except Exception as e:
+        logger.error("Failed to get costs summary of group %s - %s",
+                     group_id, e)
+        return jsonify({"error": "Internal Server Error",
+                        "message": str(e)}), 500
+
+
+@groups_blueprint.route('/<int:group_id>/events', methods=['GET'])
+@group_member_required()
+def stream_group_events(group_id: int):
+    """
+    Server-Sent Events stream of changes to the receipts of a group (see
+    `utils/events.py` for the event types), so that clients refetch what
+    changed instead of polling. The stream ends after EVENTS_STREAM_SECONDS,
+    or if the client falls behind, and is reopened by the client. Refused
+    with 503 Service Unavailable once the process holds EVENTS_MAX_STREAMS.
+    """
+    if not event_bus.open_stream():
+        logger.warning("Refused to stream events of group ID %s, %s streams "
+                       "are already open.", group_id, event_bus.max_streams)
+        response = jsonify({"error": "Service Unavailable",
+                            "message": "Too many event streams are open"})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+
+    def stream():
+        # Subscribing here rather than in the route ensures the `finally`
+        # runs, as it is skipped for a generator closed before it started
+        subscription = event_bus.subscribe(group_id)
+        try:
+            # Ask EventSource to reconnect after a second once the stream ends
+            yield "retry: 1000\n\n"
+            deadline = time.monotonic() + EVENTS_STREAM_SECONDS
+            while not subscription.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                event = subscription.get(min(EVENTS_HEARTBEAT, remaining))
+                yield event.encode() if event else ": keep-alive\n\n"
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    logger.info("Streaming events of group ID %s.", group_id)
+    response = Response(stream(), mimetype='text/event-stream',
+                        headers={"Cache-Control": "no-cache",
+                                 # Stop nginx from buffering the stream
+                                 "X-Accel-Buffering": "no"})
+    # Called once the response is closed, even if the stream never started
+    response.call_on_close(event_bus.close_stream)
+    return response
 
 
 @groups_blueprint.route('/<int:group_id>/users/<int:user_id>', 
                         methods=['POST', 'DELETE'])
+@group_member_required(self_arg='user_id')
 def manage_users_in_group(group_id: int, user_id: int):
     """
     Create or delete a user from a group given user_id and group_id
@@ -248,7 +416,8 @@ def manage_users_in_group(group_id: int, user_id: int):
     
     if request.method == 'POST':
 
-        logger.info(f"Attempting to add user ID {user_id} to group ID {group_id}.")
+        logger.info("Attempting to add user ID %s to group ID %s.",
+                    user_id, group_id)
 
         try: 
             
@@ -259,22 +428,29 @@ def manage_users_in_group(group_id: int, user_id: int):
                     .filter_by(group_id=group_id).one_or_none()
                 user = session.query(User)\
                     .filter_by(user_id=user_id).one_or_none()
-                if not group and not user:
+                if not group or not user:
                     return jsonify({"error": "Group or user does not exist"}), 404
                 
-                # Checks if user is already in the group
-                if user in group.users:
+                # Checks if user is already in the group, without loading
+                # every member of the group
+                if session.scalar(select(exists().where(
+                        UserGroups.c.user_id == user_id,
+                        UserGroups.c.group_id == group_id))):
                     return jsonify({"error": "User is already in the group"}), 409
                 
                 # Let the user join the group
-                group.users.append(user)
-            
-                return jsonify({"message": "User added to group"}), 200
+                session.execute(insert(UserGroups)\
+                    .values(user_id=user_id, group_id=group_id))
+                bump_version(session, GROUP, group_id)
+                version = get_version(session, GROUP, group_id)
+
+            remember_membership(user_id, group_id, version)
+            return jsonify({"message": "User added to group"}), 200
         
         except Exception as e:
             session.rollback()
-            logger.error(f"Adding user {user_id} to group {group_id} \
-                failed - {str(e)}")
+            logger.error("Adding user %s to group %s failed - %s",
+                         user_id, group_id, e)
             return jsonify({"error": str(e)}), 500
 
         finally:
@@ -282,7 +458,8 @@ def manage_users_in_group(group_id: int, user_id: int):
             
     elif request.method == 'DELETE':
         
-        logger.info(f"Attempting to delete user ID {user_id} from group ID {group_id}.")
+        logger.info("Attempting to delete user ID %s from group ID %s.",
+                    user_id, group_id)
         
         try:
             with SessionLocal() as session:
@@ -299,17 +476,24 @@ def manage_users_in_group(group_id: int, user_id: int):
                          }), 404
                 
                 # Check if the user is in the group
-                if group not in user.groups:
+                if not session.scalar(select(exists().where(
+                        UserGroups.c.user_id == user_id,
+                        UserGroups.c.group_id == group_id))):
                     return jsonify({"error": "Not Found", 
                                     "message": "User not in the group"}), 404
                 
                 # Remove the user from the group
-                user.groups.remove(group)
+                session.execute(delete(UserGroups).where(
+                    UserGroups.c.user_id == user_id,
+                    UserGroups.c.group_id == group_id))
+                bump_version(session, GROUP, group_id)
+
+            forget_membership(user_id, group_id)
             
             return jsonify({"message": "User removed from the group!"}), 200
     
         except Exception as e:
-            logger.error(f"Deleting user {user_id} fropm group {group_id} \
-                failed - {str(e)}")
+            logger.error("Deleting user %s from group %s failed - %s",
+                         user_id, group_id, e)
             return jsonify({"status": "failed", "message": str(e)}), 500
     
\ No newline at end of file
@@ -7,12 +7,32 @@ from werkzeug.utils import secure_filename
 # Third-Party Imports
 from sqlalchemy import select, insert, update, desc
 from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm.exc import StaleDataError
 
 # Project-Specific Imports
 from src.utils.database import SessionLocal
 from src.utils.models import User, Group, Receipt, Item, UserItems, UserSpending
-from src.receipt_reader.SainsburysReceipt import SainsburysReceipt
+from src.utils.split_engine import settle_receipts, settle_group
+from src.utils.spending_rollups import record_spending
+from src.utils.versioning import etag_for, bump_version, bump_versions, \
+                                 version_conflict, GROUP, RECEIPT
+from src.utils.authorization import group_member_required, \
+                                   receipt_member_required, \
+                                   authorize_groups, forget_receipt
+from src.utils.read_models import to_dicts, list_group_receipts, \
+                                  list_receipt_items, list_user_items, \
+                                  find_user_items, item_receipts, \
+                                  receipt_exists, find_receipt_costs
+from src.utils.events import publish_after_commit, publish_receipt_rows, \
+                             listened, RECEIPT_ADDED, RECEIPT_DELETED, \
+                             USER_ITEM_UPDATED, COST_UPDATED
+from src.utils.receipt_parsing import receipt_parser
+from src.utils.memory_tracking import memory_tracker
+from src.utils.idempotency import idempotent
+from src.utils.receipt_locks import acquire_lease, renew_lease, \
+                                    release_lease, active_leases, lease_expiry
 from src.utils.app_logger import logger
 from src.routes.group_routes import groups_blueprint
 
@@ -23,30 +43,19 @@ logger = logging.getLogger('main.receipt_routes')
 
 # Nest group-related operations under 'groups/<group_id>/receipts'
 @groups_blueprint.route('<int:group_id>/receipts', methods=['GET'])
+@group_member_required()
+@etag_for(GROUP, 'group_id')
 def get_receipts_in_group(group_id: int):
     
-    logger.info(f"Attempting to fetch receipts of group with ID {group_id}.")
+    logger.info("Attempting to fetch receipts of group with ID %s.", group_id)
     
     try:
         with SessionLocal() as session:
-            logger.debug(f"Fetching receipt in group ID: {group_id}")
-            receipts = session.query(Receipt).join(Group)\
-                .filter(Group.group_id == group_id)\
-                    .order_by(desc(Receipt.slot_time)).all()
-
-            results = {
-                "receipts": [
-                    {
-                        "receipt_id": receipt.receipt_id,
-                        "order_id": receipt.order_id,
-                        "slot_time": receipt.slot_time,
-                        "total_price": receipt.total_price,
-                        "payment_card": receipt.payment_card,
-                    } 
-                    for receipt in receipts
-                ]
-            }
-            logger.debug(f"Sending receipt JSON...")
+            logger.debug("Fetching receipt in group ID: %s", group_id)
+            receipts = list_group_receipts(session, group_id)
+
+            results = {"receipts": to_dicts(receipts)}
+            logger.debug("Sending receipt JSON...")
         return jsonify(results), 200
     
     except Exception as e:
@@ -57,9 +66,12 @@ def get_receipts_in_group(group_id: int):
 
 
 @groups_blueprint.route('/<int:group_id>/receipts', methods=['POST'])
+@memory_tracker.track('upload')
+@group_member_required()
+@idempotent
 def add_receipt_to_group(group_id: int):
     
-    logger.info(f"Attempting to add receipt to group with ID {group_id}.")
+    logger.info("Attempting to add receipt to group with ID %s.", group_id)
     
     try:
         
@@ -89,11 +101,11 @@ def add_receipt_to_group(group_id: int):
                             
         # Secure filename to remove dangerous characters
         filename = secure_filename(file.filename)
-        logger.debug(f"Received valid receipt with name: {filename}")
+        logger.debug("Received valid receipt with name: %s", filename)
         
         # Not to be confused - receipt is the SainsburysReceipt object defined
         # in receipt_reader folder, whereas receipt_for_db is a database entry
-        receipt = SainsburysReceipt(file)
+        receipt = receipt_parser.parse(file)
         
         # Ensure the receipt is new - return Resource Already Exists error when
         # a receipt with the same order ID is found in the specified group
@@ -139,6 +151,11 @@ def add_receipt_to_group(group_id: int):
                                    price=item["price"])
             
                 session.add(item_for_db)
+
+            bump_version(session, GROUP, group_id)
+            bump_version(session, RECEIPT, added_receipt.receipt_id)
+            publish_after_commit(session, group_id, RECEIPT_ADDED,
+                                 {"receipt_id": added_receipt.receipt_id})
             session.commit()
         
         logger.debug("Receipt successfully added to group.")
@@ -150,10 +167,58 @@ def add_receipt_to_group(group_id: int):
                         "message": str(e)}), 500
 
 
+@groups_blueprint.route('/<int:group_id>/receipts/settle', methods=['POST'])
+@group_member_required()
+def settle_receipts_in_group(group_id: int):
+    """
+    Recompute the costs of every user across all receipts of a group, e.g.
+    after a pricing fix. Returns the updated costs.
+        [
+            {"user_id": 1, "receipt_id": 2, "cost": 12.78},
+            {"user_id": 2, "receipt_id": 2, "cost":  9.10}
+        ]
+    """
+    logger.info("Attempting to settle all receipts in group ID %s.", group_id)
+
+    try:
+        with SessionLocal() as session:
+
+            group_exists = session.scalar(select(Group.group_id)\
+                .where(Group.group_id == group_id))
+            if not group_exists:
+                return jsonify({"error": "Not Found",
+                                "message": "No group with this ID found"}), 404
+
+            # Costs carry the version read while settling, so a concurrent
+            # update of one of them is detected
+            try:
+                costs = settle_group(session, group_id)
+            except StaleDataError:
+                session.rollback()
+                receipt_ids = session.scalars(select(Receipt.receipt_id)\
+                    .where(Receipt.group_id == group_id)).all()
+                return version_conflict(
+                    "User costs were updated by another request",
+                    find_receipt_costs(session, receipt_ids))
+            bump_versions(session, RECEIPT,
+                          [cost["receipt_id"] for cost in costs])
+            publish_receipt_rows(session, COST_UPDATED, "costs", costs)
+
+        logger.info("Settled %s user costs in group ID %s.",
+                    len(costs), group_id)
+        return jsonify(costs), 200
+
+    except Exception as e:
+        logger.error("Failed to settle group %s - %s", group_id, e)
+        return jsonify({"error": "Internal Server Error",
+                        "message": str(e)}), 500
+
+
 @receipt_blueprint.route('/<int:receipt_id>', methods=['DELETE'])
+@receipt_member_required()
 def delete_receipt(receipt_id: int):
     
-    logger.info(f"Attempting to delete receipt with ID {receipt_id}.")
+    logger.info("Attempting to delete receipt with ID %s.", receipt_id)
     
     try:
         
@@ -171,8 +236,17 @@ def delete_receipt(receipt_id: int):
                     "message": "No receipts found with this ID"
                 }), 404
                 
+            bump_version(session, GROUP, receipt.group_id)
+            bump_version(session, RECEIPT, receipt_id)
+            # Its costs are deleted with it
+            record_spending(session, [
+                (spending.user_id, receipt_id, spending.cost, None)
+                for spending in receipt.spending])
+            publish_after_commit(session, receipt.group_id, RECEIPT_DELETED,
+                                 {"receipt_id": receipt_id})
             session.delete(receipt)
-            logger.info(f"Receipt ID {receipt_id} deleted!")
+            forget_receipt(receipt_id)
+            logger.info("Receipt ID %s deleted!", receipt_id)
         
             return jsonify(), 202
         
@@ -182,19 +256,139 @@ def delete_receipt(receipt_id: int):
                         "message": str(e)}), 500
 
 
+@receipt_blueprint.route('/<int:receipt_id>/settle', methods=['POST'])
+@receipt_member_required()
+def settle_receipt(receipt_id: int):
+    """
+    Compute the cost of every user associated with the receipt from their
+    units and the item prices, and store them as user spending.
+        [
+            {"user_id": 1, "receipt_id": 2, "cost": 12.78},
+            {"user_id": 2, "receipt_id": 2, "cost":  9.10}
+        ]
+    """
+    logger.info("Attempting to settle receipt with ID %s.", receipt_id)
+
+    try:
+        with SessionLocal() as session:
+
+            # Verify that the receipt with the provided ID exists
+            receipt_exists = session.scalar(select(Receipt.receipt_id)\
+                .where(Receipt.receipt_id == receipt_id))
+            if not receipt_exists:
+                return jsonify({
+                    "error": "Not Found",
+                    "message": "Receipt with this ID does not exist"
+                }), 404
+
+            # Costs carry the version read while settling, so a concurrent
+            # update of one of them is detected
+            try:
+                costs = settle_receipts(session, [receipt_id])
+            except StaleDataError:
+                session.rollback()
+                return version_conflict(
+                    "User costs were updated by another request",
+                    find_receipt_costs(session, [receipt_id]))
+            bump_version(session, RECEIPT, receipt_id)
+            publish_receipt_rows(session, COST_UPDATED, "costs", costs)
+
+        logger.info("Receipt ID %s settled for %s users.",
+                    receipt_id, len(costs))
+        return jsonify(costs), 200
+
+    except Exception as e:
+        logger.error("Failed to settle receipt %s - %s", receipt_id, e)
+        return jsonify({"error": "Internal Server Error",
+                        "message": str(e)}), 500
+
+
+def lock_conflict(lease):
+    """409 Conflict response for a receipt leased by another user."""
+    return jsonify({
+        "error": "Conflict",
+        "message": "Receipt is being edited by another user",
+        "receipt_id": lease.receipt_id,
+        "locked_by": lease.locked_by,
+        "expires_at": lease_expiry(lease.lock_timestamp)
+    }), 409
+
+
+@receipt_blueprint.route('/<int:receipt_id>/lock', 
+                         methods=['POST', 'PUT', 'DELETE'])
+@receipt_member_required()
+def manage_receipt_lock(receipt_id: int):
+    """
+    Lease-based lock of a receipt while a user edits its unit assignments.
+    
+    POST: Acquire the lease (or renew it if already held)
+    PUT: Renew a lease held by the user
+    DELETE: Release a lease held by the user
+    
+    POST and PUT return the lease, e.g.
+        {"receipt_id": 1, "locked_by": 1, "expires_at": "..."}
+    If another user holds the lease, 409 Conflict is returned with its holder
+    and expiry.
+    """
+    user_id = get_jwt_identity()
+    
+    try:
+        with SessionLocal() as session:
+            
+            if request.method == 'POST':
+                expires_at = acquire_lease(session, receipt_id, user_id)
+            elif request.method == 'PUT':
+                expires_at = renew_lease(session, receipt_id, user_id)
+            else:
+                released = release_lease(session, receipt_id, user_id)
+            
+            # Report the current holder if the operation lost
+            holders = active_leases(session, [receipt_id],
+                                    excluding_user=user_id)
+        
+        if holders:
+            logger.info("Receipt ID %s is locked by user ID %s.",
+                        receipt_id, holders[0].locked_by)
+            return lock_conflict(holders[0])
+        
+        if request.method == 'DELETE':
+            if released:
+                logger.info("User ID %s released receipt ID %s",
+                            user_id, receipt_id)
+            else:
+                logger.info("Receipt ID %s was not locked.", receipt_id)
+            return '', 204
+        
+        if not expires_at:
+            return jsonify({"error": "Conflict",
+                            "message": "Lease expired, acquire it again"}), 409
+        
+        logger.info("User ID %s holds receipt ID %s until %s.",
+                    user_id, receipt_id, expires_at)
+        return jsonify({"receipt_id": receipt_id, 
+                        "locked_by": user_id,
+                        "expires_at": expires_at}), 200
+    
+    except Exception as e:
+        logger.error("Failed to lock receipt %s - %s", receipt_id, e)
+        return jsonify({"error": "Internal Server Error",
+                        "message": str(e)}), 500
+
+
 @receipt_blueprint.route('/<int:receipt_id>/items', methods=['GET'])
+@receipt_member_required()
+@etag_for(RECEIPT, 'receipt_id')
 def get_receipt_items(receipt_id: int):
     
-    logger.info(f"Attempting to fetch receipt items with receipt ID "
-                f"{receipt_id}.")
+    logger.info("Attempting to fetch receipt items with receipt ID %s.",
+                receipt_id)
         
     try:
         
         with SessionLocal() as session:
             
             # Query for all items pertaining to the receipt ID
-            items: List[Item] = session.query(Item)\
-                .filter(Item.receipt_id==receipt_id).all()
+            items = list_receipt_items(session, receipt_id)
                 
             # Raise 404 Not Found error if no items are found
             if not items:
@@ -203,14 +397,9 @@ def get_receipt_items(receipt_id: int):
                     "message": "No items found associated with this receipt"
                 }), 404
             
-            results = [{"item_id": item.item_id,
-                        "item_name": item.item_name,
-                        "quantity": item.quantity,
-                        "weight": item.weight,
-                        "price": item.price}
-                       for item in items]
+            results = to_dicts(items)
 
-            logger.info(f"Successfully gathered receipt item data to send.")
+            logger.info("Successfully gathered receipt item data to send.")
 
         return jsonify(results), 200
 
@@ -221,11 +410,14 @@ def get_receipt_items(receipt_id: int):
     
 
 @receipt_blueprint.route('<int:receipt_id>/users/<int:user_id>', methods=['POST'])
+@receipt_member_required()
 def create_user_item_associations(receipt_id: int, user_id: int):
     """
     Create new entry in the user quantity table given the user and receipt ID.
     """
-    logger.info(f"Attempting to create new association between user (user ID = {user_id}) and receipt (receipt ID = {receipt_id})")
+    logger.info("Attempting to create new association between user "
+                "(user ID = %s) and receipt (receipt ID = %s)",
+                user_id, receipt_id)
 
     try:
         # Data type validation
@@ -261,38 +453,52 @@ def create_user_item_associations(receipt_id: int, user_id: int):
             ]
             if new_associations:
                 session.execute(insert(UserItems).values(new_associations))
+                bump_version(session, RECEIPT, receipt_id)
+                publish_receipt_rows(session, USER_ITEM_UPDATED, "user_items", [
+                    {**association, "receipt_id": receipt_id, "version": 1}
+                    for association in new_associations])
                 session.commit()
-                logger.info(f"Added user ID {user_id} to receipt ID {receipt_id}")
+                logger.info("Added user ID %s to receipt ID %s",
+                            user_id, receipt_id)
             else:
-                logger.info(f"No new items to associate for user ID {user_id} and receipt ID {receipt_id}")
+                logger.info("No new items to associate for user ID %s and "
+                            "receipt ID %s", user_id, receipt_id)
 
         return jsonify({"message": "User added to this receipt"}), 201
 
     except OperationalError as e:
-        logger.error(f"Operational Error occurred: {str(e)}")
+        logger.error("Operational Error occurred: %s", e)
         return jsonify({"error": "Internal Server Error", "message": "Database operation failed"}), 500
 
     except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
+        logger.error("Unexpected error: %s", e)
         return jsonify({"error": "Internal Server Error", "message": str(e)}), 500
 
 
 @receipt_blueprint.route('/user-items', methods=['PUT'])
+@jwt_required()
+@idempotent
 def update_user_item_associations():
     """
     Update a set of existing rows corresponding to the combination of user
     IDs and item IDs, usually after some modification.
         [
-            {'user_id': 1, 'item_id': 1, 'unit': 0.1},
+            {'user_id': 1, 'item_id': 1, 'unit': 0.1, 'version': 3},
             {'user_id': 1, 'item_id': 2, 'unit': 1.0},
         ]
+    
+    `version` is optional: the version of the row as last read (see
+    `GET /receipts/user-items/<receipt_id>`). If the row has been updated
+    since, nothing is updated and 409 Conflict is returned with the current
+    values of the conflicting rows. Returns the updated rows with their new
+    versions.
     """
-    logger.info(f"Attempting to update association between user and items.")
+    logger.info("Attempting to update association between user and items.")
 
     try:
         
         data = request.json
-        print(data)
+        logger.debug("User-item update: %s", data)
         # Ensure received data is a list
         if not isinstance(data, list):
             msg = (f"Data is not of type list, but of type {type(data)}, with " 
@@ -341,9 +547,33 @@ def update_user_item_associations():
                 return jsonify({"error": "Internal Server Error", 
                                 "message": msg}), 500
             
+            if "version" in obj and not isinstance(obj["version"], int):
+                msg = f"version must be an integer. Received {obj['version']}"
+                logger.info(msg)
+                return jsonify({"error": "Bad Request", "message": msg}), 400
+            
         # Create a new entry in the database
         with SessionLocal() as session:
+            
+            # Every item must belong to a group the user is a member of
+            group_ids = session.scalars(select(Receipt.group_id).distinct()\
+                .join(Item, Item.receipt_id == Receipt.receipt_id)\
+                .where(Item.item_id.in_([entry["item_id"] for entry in data])))
+            denied = authorize_groups(get_jwt_identity(), group_ids)
+            if denied:
+                return denied
+            
+            # Reject edits to receipts another user holds the lease of
+            receipt_ids = session.scalars(
+                select(Item.receipt_id).distinct()
+                .where(Item.item_id.in_([entry["item_id"] for entry in data])))\
+                .all()
+            leases = active_leases(session, receipt_ids,
+                                   excluding_user=get_jwt_identity())
+            if leases:
+                return lock_conflict(leases[0])
                 
+            conflicts = []
             for entry in data:
                 
                 user_id, item_id = entry["user_id"], entry["item_id"]
@@ -369,12 +599,37 @@ def update_user_item_associations():
                 stmt = update(UserItems).where(
                     (UserItems.c.user_id==entry["user_id"]) &
                     (UserItems.c.item_id==entry["item_id"])
-                ).values(unit=entry["unit"])
+                ).values(unit=entry["unit"], version=UserItems.c.version + 1)
                 
-                session.execute(stmt)
+                # Compare-and-swap on the version the client last read
+                if "version" in entry:
+                    stmt = stmt.where(UserItems.c.version == entry["version"])
+                    if session.execute(stmt).rowcount == 0:
+                        conflicts.append((user_id, item_id))
+                else:
+                    session.execute(stmt)
+
+            # All or nothing: undo the other updates of the request
+            if conflicts:
+                session.rollback()
+                return version_conflict(
+                    "User items were updated by another request",
+                    find_user_items(session, conflicts))
+
+            # Bump the version of every receipt the items belong to
+            bump_versions(session, RECEIPT, receipt_ids)
+            updated = to_dicts(find_user_items(
+                session, [(entry["user_id"], entry["item_id"]) for entry in data]))
+            if listened():
+                receipt_of = item_receipts(
+                    session, [row["item_id"] for row in updated])
+                publish_receipt_rows(session, USER_ITEM_UPDATED, "user_items", [
+                    {**row, "receipt_id": receipt_of[row["item_id"]]}
+                    for row in updated])
             session.commit()
 
-        return jsonify({"message": "Updated successfully"}), 200
+        return jsonify({"message": "Updated successfully",
+                        "user_items": updated}), 200
 
     except Exception as e:
         logger.error(str(e))
@@ -383,36 +638,28 @@ def update_user_item_associations():
     
 
 @receipt_blueprint.route('/user-items/<int:receipt_id>', methods=['GET'])
+@receipt_member_required()
+@etag_for(RECEIPT, 'receipt_id')
 def get_user_item_associations(receipt_id: int):
     
-    logger.info((
-        f"Attempting to fetch user-item associations from receipt "
-        f"ID {receipt_id}"))
+    logger.info(
+        "Attempting to fetch user-item associations from receipt ID %s",
+        receipt_id)
     
     try:
         with SessionLocal() as session:
             
             # Verify that the receipt with the provided ID exists
-            receipt = session.execute(select(Receipt).\
-                where(Receipt.receipt_id == receipt_id)).one_or_none()
-            if not receipt:
+            if not receipt_exists(session, receipt_id):
                 return jsonify({
                     "error": "Not Found",
                     "message": "Receipt with this ID does not exist"
                 }), 404
             
             # Execute the results
-            results = session.query(UserItems).\
-                join(Item, Item.item_id==UserItems.c.item_id).\
-                filter(Item.receipt_id==receipt_id).all()
-        
-        user_item_association = [{
-            'user_id': user_item_comb.user_id,
-            'item_id': user_item_comb.item_id,
-            'unit': user_item_comb.unit,
-            } for user_item_comb in results]
+            results = list_user_items(session, receipt_id)
 
-        return jsonify(user_item_association), 200
+        return jsonify(to_dicts(results)), 200
     
     # Raise internal server error
     except Exception as e:
@@ -1,19 +1,36 @@
 # Standard Imports
 import logging
 from typing import Tuple, Dict
-from passlib.context import CryptContext
 
 # Third party imports
 from sqlalchemy import select, update, insert
 from sqlalchemy.sql import exists
-from flask import Blueprint, request, jsonify, session, redirect, url_for
-from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
+from sqlalchemy.orm.exc import StaleDataError
+from flask import Blueprint, request, jsonify, session
+from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity, \
+    get_jwt, decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import ExpiredSignatureError, PyJWTError
 from datetime import timedelta
 
 # Project-Specific Imports
 from src.utils.database import SessionLocal
-from src.utils.models import Group, User, Receipt, UserGroups, UserSpending
+from src.utils.models import Group, User, Receipt, Item, UserGroups, \
+                             UserItems, UserSpending
 from src.utils.Authentication import Authentication
+from src.utils.versioning import bump_versions, version_conflict, GROUP, \
+                                 RECEIPT
+from src.utils.cache import username_to_id, user_id_to_name, MISSING
+from src.utils.authorization import authorize_groups, forget_user
+from src.utils.rate_limit import rate_limited
+from src.utils.revocation import revocation_store
+from src.utils.read_models import to_dicts, get_user, list_user_groups, \
+                                  list_user_costs, list_user_rollups, \
+                                  find_user_costs, find_users
+from src.utils.events import publish_receipt_rows, COST_UPDATED
+from src.utils.idempotency import idempotent
+from src.utils.spending_rollups import record_spending, summary_args, \
+                                      summarize, bucket_start
 
 users_blueprint = Blueprint('users', __name__)
 
@@ -25,6 +42,7 @@ logger = logging.getLogger('main.user_routes')
 
 
 @users_blueprint.route("", methods=['POST'])
+@rate_limited('REGISTER')
 def register_user():
     """
     Registers a new user. The expected JSON request should contain:
@@ -34,7 +52,7 @@ def register_user():
         "email": "example@gmail.com"
     }
     """
-    logger.info(f"Attempting to register new user.")
+    logger.info("Attempting to register new user.")
     
     try:
 
@@ -59,13 +77,17 @@ def register_user():
             # Conflict Error
             user_exists = session.query(exists().\
                 where(User.username == username)).scalar()
-            if user_exists:
-                logger.warning(f"User with username '{username}' already exists.")
-                return jsonify({"error": "Resource Conflict", 
-                                "message": "User already exists"}), 409
 
-            # Hash the password before storing in database
-            hashed_password = auth.hash_password(password)
+        if user_exists:
+            logger.warning("User with username '%s' already exists.", username)
+            return jsonify({"error": "Resource Conflict", 
+                            "message": "User already exists"}), 409
+
+        # Hash the password before storing in database, without holding a
+        # database connection
+        hashed_password = auth.hash_password(password)
+
+        with SessionLocal() as session:
 
             # Create a new_user
             new_user = User(username=username, 
@@ -73,12 +95,15 @@ def register_user():
                             email=email)
             session.add(new_user)
 
+        # The username may have been cached as unknown
+        username_to_id.invalidate(username)
+
         logger.info("User created successfully.")
         return jsonify({
             "message": "User created successfully"}), 201
 
     except Exception as e:
-        logger.error(f"User Registration Failed - {str(e)}")
+        logger.error("User Registration Failed - %s", e)
         return jsonify({"error": "Internal Server Error", 
                         "message": str(e)}), 500
 
@@ -89,11 +114,11 @@ def delete_user():
     """
     Delete the current user from the database, given the user ID in JWT
     """
-    logger.info(f"Attempting to delete a user.")
+    logger.info("Attempting to delete a user.")
     
     try:
         user_id = get_jwt_identity()
-        logger.info(f"Attempting to delete a user with ID {user_id}.")
+        logger.info("Attempting to delete a user with ID %s.", user_id)
         
         with SessionLocal() as db_session:
 
@@ -105,34 +130,50 @@ def delete_user():
 
             # Return 404 Not found is user does not exist            
             if not user:
-                logger.error(f"""User cannot be deleted since a user with ID 
-                             {user_id} cannot be found""")
+                logger.error("User cannot be deleted since a user with ID "
+                             "%s cannot be found", user_id)
                 return jsonify({"Error": "Not Found", 
                                 "message": "User does not exists!"}), 404
             
+            # Membership and user-item associations are removed together
+            # with the user, so bump the groups and receipts they belong to
+            group_ids = db_session.scalars(select(UserGroups.c.group_id)\
+                .where(UserGroups.c.user_id == user_id))
+            bump_versions(db_session, GROUP, group_ids)
+            receipt_ids = db_session.scalars(select(Item.receipt_id).distinct()\
+                .join(UserItems, UserItems.c.item_id == Item.item_id)\
+                .where(UserItems.c.user_id == user_id))
+            bump_versions(db_session, RECEIPT, receipt_ids)
+
             # Delete the user
+            username = user.username
             db_session.delete(user)
 
+        username_to_id.invalidate(username)
+        user_id_to_name.invalidate(user_id)
+        forget_user(user_id)
+
         # Return 204 No Content upon successful deletion
-        logger.info(f"User with ID {user_id} deleted successfully.")
+        logger.info("User with ID %s deleted successfully.", user_id)
         return '', 204
         
     except Exception as e:
-        logger.error(f"User deletion failed - {str(e)}")
+        logger.error("User deletion failed - %s", e)
         return jsonify({"status": "failed", "message": str(e)}), 500
     
 
 @users_blueprint.route('/login', methods=['POST'])
+@rate_limited('LOGIN')
 def login():
     data = request.json
     
     username = data.get('username')
     password = data.get('password')
     
-    logger.info(f"Attempt to login by {username}.")
+    logger.info("Attempt to login by %s.", username)
     
     if (not username) or (not password):
-        logger.warning(f"Login failed as username or password is not given.")
+        logger.warning("Login failed as username or password is not given.")
         return jsonify({
             "error": "Bad Request",
             "message": "Username or password not provided"
@@ -144,8 +185,8 @@ def login():
     # Send the user_id to the frontend to user
     if user_id:
         
-        logger.info((f"User ID {user_id} authenticated for login. "
-                     f"Generating JWT token..."))
+        logger.info("User ID %s authenticated for login. "
+                    "Generating JWT token...", user_id)
         
         # Generate JWT and pass as access token
         access_token = create_access_token(identity=user_id, fresh=True, expires_delta=timedelta(hours=1))
@@ -155,15 +196,44 @@ def login():
                         "refresh_token": refresh_token,
                         "user_id": user_id}), 200
     else:
-        logger.warning(f"Login failed as user is unauthorized.")
+        logger.warning("Login failed as user is unauthorized.")
         return jsonify({"error": "Unauthorized",
                         "message": "Invalid username or password", 
                         "user_id": None}), 401
 
-@users_blueprint.route('/logout')
+@users_blueprint.route('/logout', methods=['POST'])
+@jwt_required(verify_type=False)
 def logout():
+    """
+    Revoke the JWT used for the request, and the refresh token if given in the
+    request body as {"refresh_token": "..."}. Revoked tokens are rejected with
+    401 until they would have expired.
+    """
+    token = get_jwt()
+    revocation_store.revoke(token["jti"], token["exp"])
+    
+    data = request.get_json(silent=True) or {}
+    refresh_token = data.get('refresh_token')
+    if refresh_token:
+        try:
+            refresh = decode_token(refresh_token)
+        except ExpiredSignatureError:
+            refresh = None  # Already unusable
+        except (PyJWTError, JWTExtendedException) as e:
+            return jsonify({"error": "Bad Request",
+                            "message": f"Invalid refresh token - {str(e)}"}), 400
+        
+        if refresh and refresh["sub"] != token["sub"]:
+            return jsonify({"error": "Forbidden",
+                            "message": "Refresh token belongs to another user"}), 403
+        if refresh:
+            revocation_store.revoke(refresh["jti"], refresh["exp"])
+    
+    session.pop('authenticated', None)
     session.pop('user_id', None)
-    return redirect(url_for(login))
+    
+    logger.info("User ID %s logged out.", get_jwt_identity())
+    return jsonify({"message": "Logged out successfully"}), 200
 
 
 @users_blueprint.route("/verify-token", methods=["POST"])
@@ -177,9 +247,8 @@ def verify_token():
 @users_blueprint.route("/refresh", methods=["POST"])
 @jwt_required(refresh=True)
 def refresh():
-    print("Obtained request for refresh")
     identity = get_jwt_identity()  # Get user from refresh token
-    print("Refresh success!")
+    logger.info("Refreshed access token of user ID %s.", identity)
     new_access_token = create_access_token(identity=identity, expires_delta=timedelta(hours=1))
     return jsonify({"message": "Token refreshed!", 
                     "access_token": new_access_token}), 200
@@ -203,16 +272,18 @@ def get_user_info():
         user_id = get_jwt_identity()
         
         with SessionLocal() as session:
-            user = session.query(User).filter_by(user_id=user_id).one_or_none()
-            logger.info(f"User '{user.username}' found.")
-            return jsonify({
-                "user_id": user.user_id,
-                "username": user.username,
-                "email": user.email
-                }), 200
+            user = get_user(session, user_id)
+
+        # Return 404 Not Found if the user no longer exists
+        if not user:
+            return jsonify({"error": "Not Found",
+                            "message": "User does not exist"}), 404
+
+        logger.info("User '%s' found.", user.username)
+        return jsonify(user._asdict()), 200
         
     except Exception as e:
-        logger.error(f"Failed to fetch user information - {str(e)}")
+        logger.error("Failed to fetch user information - %s", e)
         return jsonify({"status": "failed", "message": str(e)}), 400
     
         
@@ -220,21 +291,26 @@ def get_user_info():
 def resolve_username(username: str):
     """Get user ID of a given username"""
     try:
-        with SessionLocal() as session:
-            user_id = session.scalar(select(User.user_id)\
-                .where(User.username == username))
-            
-            # Not Found Error: If no user ID found for this name
-            if not user_id:
-                return jsonify({
-                    "message": "No users found with this name"
-                }), 404
+        user_id = username_to_id.get(username)
+        
+        # Cache miss: look up the user ID and cache it, even if not found
+        if user_id is MISSING:
+            with SessionLocal() as session:
+                user_id = session.scalar(select(User.user_id)\
+                    .where(User.username == username))
+            username_to_id.set(username, user_id)
             
-            # Success: return status code 200 (default)
-            return jsonify({"message": "User ID found", "user_id": user_id})
+        # Not Found Error: If no user ID found for this name
+        if not user_id:
+            return jsonify({
+                "message": "No users found with this name"
+            }), 404
+        
+        # Success: return status code 200 (default)
+        return jsonify({"message": "User ID found", "user_id": user_id})
         
     except Exception as e:
-        print(str(e))
+        logger.error("Failed to resolve username - %s", e)
         return jsonify({"status": "failed", "message": str(e)}), 500
 
 
@@ -242,21 +318,86 @@ def resolve_username(username: str):
 def resolve_user_id(user_id: int):
     """Get username of a given user ID"""
     try:
-        with SessionLocal() as session:
-            username = session.scalar(select(User.username)\
-                .where(User.user_id == user_id))
+        username = user_id_to_name.get(user_id)
+        
+        # Cache miss: look up the username and cache it, even if not found
+        if username is MISSING:
+            with SessionLocal() as session:
+                username = session.scalar(select(User.username)\
+                    .where(User.user_id == user_id))
+            user_id_to_name.set(user_id, username)
             
-            # Not Found Error: If no user ID found for this name
-            if not username:
-                return jsonify({
-                    "message": "No users found with this ID"
-                }), 404
+        # Not Found Error: If no user ID found for this name
+        if not username:
+            return jsonify({
+                "message": "No users found with this ID"
+            }), 404
+        
+        # Success: return status code 200 (default)
+        return jsonify({"message": "Username found", "username": username})
+        
+    except Exception as e:
+        logger.error("Failed to resolve user ID - %s", e)
+        return jsonify({"status": "failed", "message": str(e)}), 500
+
+
+@users_blueprint.route("/resolve", methods=['GET'])
+def resolve_users():
+    """
+    Resolve many user IDs and/or usernames in one request, given as repeated
+    query parameters, e.g. `/users/resolve?user_id=1&user_id=2&username=Bob`.
+        {
+            "users": [{"user_id": 1, "username": "Arthur"}, ...],
+            "missing": {"user_ids": [2], "usernames": []}
+        }
+    """
+    user_ids = request.args.getlist("user_id", type=int)
+    usernames = request.args.getlist("username")
+    
+    if not user_ids and not usernames:
+        return jsonify({
+            "error": "Bad Request",
+            "message": "Provide at least one user_id or username"
+        }), 400
+    
+    try:
+        names_by_id = user_id_to_name.get_many(user_ids)
+        ids_by_name = username_to_id.get_many(usernames)
+        missed_ids = [i for i in user_ids if i not in names_by_id]
+        missed_names = [n for n in usernames if n not in ids_by_name]
+        
+        # Resolve all cache misses with a single query
+        if missed_ids or missed_names:
+            with SessionLocal() as session:
+                rows = find_users(session, missed_ids, missed_names)
+            
+            found_names = {row.user_id: row.username for row in rows}
+            found_ids = {row.username: row.user_id for row in rows}
+            fetched_names = {i: found_names.get(i) for i in missed_ids}
+            fetched_ids = {n: found_ids.get(n) for n in missed_names}
             
-            # Success: return status code 200 (default)
-            return jsonify({"message": "Username found", "username": username})
+            user_id_to_name.set_many(fetched_names)
+            username_to_id.set_many(fetched_ids)
+            names_by_id.update(fetched_names)
+            ids_by_name.update(fetched_ids)
         
+        # Merge both directions into unique users
+        users = {user_id: username 
+                 for user_id, username in names_by_id.items() if username}
+        users.update({user_id: username 
+                      for username, user_id in ids_by_name.items() if user_id})
+        
+        return jsonify({
+            "users": [{"user_id": user_id, "username": username}
+                      for user_id, username in users.items()],
+            "missing": {
+                "user_ids": [i for i, n in names_by_id.items() if not n],
+                "usernames": [n for n, i in ids_by_name.items() if not i]
+            }
+        }), 200
+    
     except Exception as e:
-        print(str(e))
+        logger.error("Failed to resolve users - %s", e)
         return jsonify({"status": "failed", "message": str(e)}), 500
     
 
@@ -271,29 +412,17 @@ def get_groups_joined_by_user():
     try:
         
         user_id = get_jwt_identity()
-        logger.info((
-            f"Attempting to fetch groups joined by the authorized user "
-            f"with ID {user_id}."
-        ))
+        logger.info(
+            "Attempting to fetch groups joined by the authorized user "
+            "with ID %s.", user_id)
         
         with SessionLocal() as session:
-            groups_joined_by_user = session.query(Group).join(
-                UserGroups, Group.group_id == UserGroups.c.group_id
-            ).filter_by(user_id=user_id)
-
-            return jsonify(
-                [
-                    {
-                        "group_id": group.group_id,
-                        "group_name": group.group_name,
-                        "description": group.description
-                    }
-                    for group in groups_joined_by_user 
-                ]
-            ), 200
+            groups_joined_by_user = list_user_groups(session, user_id)
+
+        return jsonify(to_dicts(groups_joined_by_user)), 200
         
     except Exception as e:
-        logger.error(f"Failed to get groups joined by user - {str(e)}")
+        logger.error("Failed to get groups joined by user - %s", e)
         return jsonify({"status": "failed", "message": str(e)}), 500
 
 
@@ -327,14 +456,7 @@ def get_user_costs():
         with SessionLocal() as session:
             # Performing an inner join where receipt ID matches and filter
             # by user ID
-            # Perform an inner join and select the required fields
-            results = session.query(Receipt.receipt_id,
-                                    Receipt.slot_time,
-                                    UserSpending.cost)\
-            .join(UserSpending, 
-                  UserSpending.receipt_id == Receipt.receipt_id)\
-            .filter(UserSpending.user_id == user_id)\
-            .all()
+            results = list_user_costs(session, user_id)
                 
             # Return error 404 if results are no results are returned
             if not results:
@@ -342,38 +464,78 @@ def get_user_costs():
                 logger.info(msg)
                 return jsonify({"error": "Not Found", "message": msg}), 404
             
-            # Initialize an empty list to store the dictionary
-            data_list = []
-            
-            for row in results:
-                data_dict = {"receipt_id": row.receipt_id,
-                             "slot_time":  row.slot_time,
-                             "cost":       row.cost}
-                data_list.append(data_dict)
-                
-        return jsonify(data_list), 200
+        return jsonify(to_dicts(results)), 200
 
     except Exception as e:
-        logger.error(f"Failed to get user spending - {str(e)}")
+        logger.error("Failed to get user spending - %s", e)
         return jsonify({"error": "Internal Server Error", 
                         "message": str(e)}), 500
 
 
+@users_blueprint.route("/costs/summary", methods=['GET'])
+@jwt_required()
+def get_user_costs_summary():
+    """
+    Spending of the user per week or month (`?bucket=week|month`), in total
+    and per group, from `start` to `end` (YYYY-MM-DD, optional). Every bucket
+    of the range is listed, empty ones with a cost of 0.
+        {
+            "bucket": "week",
+            "buckets": ["2024-06-10", "2024-06-17"],
+            "costs": [12.78, 0.0], "receipts": [1, 0], "total": 12.78,
+            "groups": [{"group_id": 1, "group_name": "Flat",
+                        "costs": [12.78, 0.0], "receipts": [1, 0],
+                        "total": 12.78}]
+        }
+    """
+    logger.info("Fetching user costs summary...")
+
+    try:
+        period, start, end = summary_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": "Bad Request", "message": str(e)}), 400
+
+    try:
+        with SessionLocal() as session:
+            rows = list_user_rollups(
+                session, get_jwt_identity(), period,
+                since=start and bucket_start(start, period), until=end)
+
+        try:
+            summary = summarize(rows, period, 'group_id', 'group_name',
+                                'groups', start, end)
+        except ValueError as e:
+            return jsonify({"error": "Bad Request", "message": str(e)}), 400
+        return jsonify(summary), 200
+
+    except Exception as e:
+        logger.error("Failed to get user costs summary - %s", e)
+        return jsonify({"error": "Internal Server Error",
+                        "message": str(e)}), 500
+
+
 @users_blueprint.route('/costs', methods=['PUT'])
+@jwt_required()
+@idempotent
 def update_user_costs():
     """
     Expects an array-based JSON structure containing the user ID, receipt ID
     and the user's spending in the receipt.
         [
             {"user_id": 1, "receipt_id": 2, "cost": 12.78},
-            {"user_id:: 2, "receipt_id": 2, "cost":  9.10}
+            {"user_id:: 2, "receipt_id": 2, "cost":  9.10, "version": 4}
         ]
+    
+    `version` is optional: the version of the cost as last read. If the cost
+    has been updated since (e.g. by another member or by settling the
+    receipt), nothing is updated and 409 Conflict is returned with the current
+    values of the conflicting costs.
     """
     logger.info("Attempting to updating user costs...")
     
     try:
         data = request.json
-        print(data)
+        logger.debug("User costs update: %s", data)
         # Check that data is a list
         if not isinstance(data, list):
             msg = "Input data is not a list"
@@ -423,7 +585,23 @@ def update_user_costs():
                 logger.info(msg)
                 return jsonify({"status": "failed", "message": msg}), 400
 
+            if "version" in obj and not isinstance(obj["version"], int):
+                msg = f"version must be an integer. Received {obj['version']}"
+                logger.info(msg)
+                return jsonify({"status": "failed", "message": msg}), 400
+
         with SessionLocal() as session:
+            
+            # Every receipt must belong to a group the user is a member of
+            group_ids = session.scalars(select(Receipt.group_id).distinct()\
+                .where(Receipt.receipt_id.in_(
+                    [entry["receipt_id"] for entry in data])))
+            denied = authorize_groups(get_jwt_identity(), group_ids)
+            if denied:
+                return denied
+            
+            conflicts = []
+            changes = []
             for entry in data:
                 
                 # Extract data from dictionary
@@ -437,6 +615,13 @@ def update_user_costs():
                     receipt_id=receipt_id
                 ).one_or_none()
                 
+                # The client must have read the current version
+                if "version" in entry and (
+                        existing_entry is None or
+                        existing_entry.version != entry["version"]):
+                    conflicts.append((user_id, receipt_id))
+                    continue
+                
                 # If user has no association with the receipt ID, 
                 # create a new entry
                 if not existing_entry:
@@ -446,15 +631,44 @@ def update_user_costs():
                                                  receipt_id=receipt_id, 
                                                  cost=cost)
                     session.add(user_spending)
+                    changes.append((user_id, receipt_id, None, cost))
                 
                 # If an entry exists, just update the values
                 else:
+                    changes.append((user_id, receipt_id,
+                                    existing_entry.cost, cost))
                     existing_entry.cost = cost
+
+            keys = [(entry["user_id"], entry["receipt_id"]) for entry in data]
+            
+            # All or nothing: undo the other updates of the request
+            if conflicts:
+                session.rollback()
+                return version_conflict(
+                    "User costs were updated by another request",
+                    find_user_costs(session, conflicts))
+            
+            # The ORM updates each cost only if its version is still the one
+            # loaded above, so a concurrent write in between is detected too
+            try:
+                session.flush()
+            except StaleDataError:
+                session.rollback()
+                return version_conflict(
+                    "User costs were updated by another request",
+                    find_user_costs(session, keys))
+
+            record_spending(session, changes)
+            bump_versions(session, RECEIPT,
+                          [entry["receipt_id"] for entry in data])
+            publish_receipt_rows(session, COST_UPDATED, "costs", [
+                {"user_id": entry["user_id"], "receipt_id": entry["receipt_id"],
+                 "cost": entry["cost"]} for entry in data])
             session.commit()
 
         # Must have empty content
         return '', 204
                     
     except Exception as e:
-        logger.error(f"Failed to update user spending - {str(e)}")
+        logger.error("Failed to update user spending - %s", e)
         return jsonify({"status": "failed", "message": str(e)}), 500
@@ -3,27 +3,28 @@ import logging
 
 # Third-Party Imports
 from flask import session, jsonify
-from passlib.context import CryptContext
+from sqlalchemy import select, update
 from sqlalchemy.exc import OperationalError
 
 # Project-Specific Imports
 from src.utils.database import SessionLocal
 from src.utils.models import User
+from src.utils.hashing import password_hasher
 
 
 # Module-level logging
-logger = logging.getLogger('app.auth')
+logger = logging.getLogger('main.auth')
 
 
 class Authentication():
     
     def __init__(self):
         
-        # Encryption context for password hashing
-        self._pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+        # Password hashing service shared across the process
+        self._hasher = password_hasher
         
     def hash_password(self, plain_password: str) -> str:
-        return self._pwd_context.hash(plain_password)
+        return self._hasher.hash(plain_password)
 
     def _verify_password(self, plain_password: str, hashed_password: str):
         """
@@ -41,7 +42,7 @@ class Authentication():
             0: The passwords are not equal
             1: The passwords are equal
         """
-        return self._pwd_context.verify(plain_password, hashed_password)
+        return self._hasher.verify(plain_password, hashed_password)
     
     def authenticate(self, username: str, password: str) -> int:
         """
@@ -65,27 +66,42 @@ class Authentication():
                 
                 # Find the user with selected username. Not filtered by
                 # username and password combination to prevent injection attack
-                user = db_session.query(User).filter_by(username=username).first()
+                user = db_session.execute(
+                    select(User.user_id, User.hashed_password)\
+                    .where(User.username == username)).first()
+            
+            # Return none for invalid credentials
+            if not user:
+                return None
+            
+            # Match the provided password with the stored password. The
+            # database session is closed while bcrypt runs
+            valid, new_hash = self._hasher.verify_and_update(
+                password, user.hashed_password)
+            if not valid:
+                return None
+            
+            # Rehash passwords stored with an outdated bcrypt cost
+            if new_hash:
+                with SessionLocal() as db_session:
+                    db_session.execute(update(User)\
+                        .where(User.user_id == user.user_id)\
+                        .values(hashed_password=new_hash))
+                logger.info("Rehashed password of user ID %s.", user.user_id)
                 
-                # Match the provided password with the stored password
-                if user and self._verify_password(password, user.hashed_password):
-                    
-                    # Setting flask session cookies
-                    session['authenticated'] = True
-                    session['user_id'] = user.user_id
+            # Setting flask session cookies
+            session['authenticated'] = True
+            session['user_id'] = user.user_id
 
-                    return user.user_id
-
-                # Return none for invalid credentials
-                return None
+            return user.user_id
 
         except OperationalError as e:
-            logger.error((f"Operational Error occured. This is usually caused by "
-                        f"database connection pool. {str(e)}"))
+            logger.error("Operational Error occured. This is usually caused by "
+                         "database connection pool. %s", e)
             raise e
     
         except Exception as e:
-            print(str(e))
+            logger.error("Login failed - %s", e)
             return None
 
     
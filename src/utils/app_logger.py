@@ -1,14 +1,60 @@
+"""
+Configures the 'main' logger, which every module logs to through a child
+logger (e.g. `logging.getLogger('main.db')`).
+
+Logging a record only puts it on a queue: a background thread formats it and
+writes it to the console and to a size-rotated file of JSON lines, so requests
+never wait on disk flushes. Messages use lazy `%`-style arguments, so they are
+only built for records at or above LOG_LEVEL:
+
+    logger.info("Settled %s user costs in group ID %s.", len(costs), group_id)
+
+Every request is given an ID, taken from a valid `X-Request-ID` header or
+generated, which is returned in the `X-Request-ID` response header and added
+to every record logged while serving it.
+
+Configuration (environment variables):
+    LOG_LEVEL: Level of the 'main' logger. Default DEBUG
+    LOG_FILE: File of the JSON lines, empty to disable. Default `flask.log`.
+        Forked processes (e.g. gunicorn workers) each write and rotate their
+        own file, `flask.<pid>.log`
+    LOG_MAX_BYTES (int): Size at which the file is rotated. Default 10485760
+    LOG_BACKUP_COUNT (int): Rotated files kept. Default 5
+    LOG_CONSOLE: Also log to the console, as text. Default true
+"""
 # Standard Imports
 import os
+import re
+import json
+import uuid
+import queue
+import atexit
 import logging
+import contextvars
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
 
 # Third-Party Imports
 from dotenv import load_dotenv
+from flask import Flask, request, g
 
 # Load environmental variable to check if logger is configured
 load_dotenv()
 LOG = os.getenv('LOG', False)
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG')
+LOG_FILE = os.getenv('LOG_FILE', 'flask.log')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+LOG_CONSOLE = os.getenv('LOG_CONSOLE', 'true').lower() in ('1', 'true', 'yes')
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+# Request IDs accepted from clients, so they cannot inject into log lines
+VALID_REQUEST_ID = re.compile(r'[\w.:-]{1,128}')
+
+# ID of the request being served, if any
+request_id = contextvars.ContextVar('request_id', default=None)
 
 
 # Configure the main logger with the name 'main'
@@ -23,30 +69,161 @@ logger.setLevel(numeric_level)
 
 # Define a custom formatter that logs the parent folder and filename
 class CustomFormatter(logging.Formatter):
-    
+
     def format(self, record):
         """Overide"""
-        
+
         # Get the full pathname of the module where the log message was generated
         full_path = record.pathname
-        
+
         # Extract the filename
         filename = os.path.basename(full_path)
-        
+
         # Modify the log message format to show the filename
         record.custom_filepath = filename
-        
+
         # Now use this in the log message format
         return super().format(record)
 
-# Create a log format with the custom filepath
-formatter = CustomFormatter('%(asctime)s - %(levelname)s - %(custom_filepath)s:%(lineno)d - %(message)s')
 
-# Configure handlers
-console_handler = logging.StreamHandler()
-file_handler = logging.FileHandler('flask.log')
-file_handler.setFormatter(formatter)
+class JSONFormatter(logging.Formatter):
+    """
+    Formats a record as one line of JSON, including the fields passed as
+    `extra={"fields": {...}}`.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc)
+                            .isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, 'request_id', None),
+            "file": os.path.basename(record.pathname),
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestQueueHandler(QueueHandler):
+    """
+    Queues records with the ID of the request logging them. Unlike
+    `QueueHandler`, keeps the message and traceback apart so that they can be
+    formatted as separate fields by the listener.
+    """
+
+    def prepare(self, record):
+        record.request_id = request_id.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class ProcessFileHandler(RotatingFileHandler):
+    """
+    Size-rotated file handler which, in a forked process, writes to its own
+    file named after the process ID (e.g. `flask.1234.log`), as several
+    processes rotating one file lose and interleave records.
+    """
+
+    def __init__(self, filename: str, **kwargs):
+        super().__init__(filename, delay=True, **kwargs)
+        self.filename = self.baseFilename
+        os.register_at_fork(after_in_child=self.reopen)
+
+    def reopen(self):
+        root, ext = os.path.splitext(self.filename)
+        self.baseFilename = f"{root}.{os.getpid()}{ext}"
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+
+def _handlers() -> list:
+    handlers = []
+    if LOG_CONSOLE:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(CustomFormatter(
+            '%(asctime)s - %(levelname)s - %(request_id)s - '
+            '%(custom_filepath)s:%(lineno)d - %(message)s'))
+        handlers.append(console_handler)
+    if LOG_FILE:
+        file_handler = ProcessFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES,
+                                          backupCount=LOG_BACKUP_COUNT)
+        file_handler.setFormatter(JSONFormatter())
+        handlers.append(file_handler)
+    return handlers
+
+
+def queued(handlers: list) -> RequestQueueHandler:
+    """
+    Queue handler whose records are written to `handlers` by a background
+    listener thread, available as its `listener` attribute.
+
+    Example Usage:
+        logger.addHandler(queued([RotatingFileHandler('app.log')]))
+    """
+    queue_handler = RequestQueueHandler(queue.SimpleQueue())
+
+    def start_listener():
+        queue_handler.listener = QueueListener(
+            queue_handler.queue, *handlers, respect_handler_level=True)
+        queue_handler.listener.start()
+
+    # Forked processes (e.g. preloaded gunicorn workers) do not inherit the
+    # listener's thread: start one on a new queue
+    def restart_listener():
+        queue_handler.queue = queue.SimpleQueue()
+        start_listener()
+
+    start_listener()
+    os.register_at_fork(after_in_child=restart_listener)
+
+    # Write the records still queued on exit
+    atexit.register(lambda: queue_handler.listener.stop())
+    return queue_handler
+
+
+queue_handler = queued(_handlers())
+logger.addHandler(queue_handler)
+
+
+def new_request_id(header: Optional[str] = None) -> str:
+    """The client's request ID if valid, otherwise a new one."""
+    if header and VALID_REQUEST_ID.fullmatch(header):
+        return header
+    return uuid.uuid4().hex
+
+
+def init_request_logging(app: Flask):
+    """
+    Give every request of the app an ID, logged with its records and
+    returned in the `X-Request-ID` response header.
+    """
+
+    @app.before_request
+    def start_request_id():
+        g.request_id = new_request_id(request.headers.get(REQUEST_ID_HEADER))
+        g.request_id_token = request_id.set(g.request_id)
+
+    @app.after_request
+    def add_request_id(response):
+        if 'request_id' in g:
+            response.headers[REQUEST_ID_HEADER] = g.request_id
+        return response
 
-# Add handlers to logger
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
+    @app.teardown_request
+    def end_request_id(exc):
+        if 'request_id_token' in g:
+            request_id.reset(g.pop('request_id_token'))
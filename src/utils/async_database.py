@@ -0,0 +1,84 @@
+"""
+Async database engine and session used by the ASGI entry point (`asgi.py`).
+
+Connects to the same database as `database.py` through an async driver:
+aiosqlite for SQLite, asyncpg for PostgreSQL and aiomysql for MySQL. The URL
+can be overridden with the ASYNC_DATABASE_URL environmental variable.
+
+Dependencies: database.py
+"""
+# Standard Imports
+import os
+import logging
+from contextlib import asynccontextmanager
+
+# Third-Party Imports
+from dotenv import load_dotenv
+from sqlalchemy.engine import make_url, URL
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+# Project-Specific Imports
+from src.utils.database import DATABASE_URL
+from src.utils.slow_queries import slow_query_log
+
+
+# Load environmental variables
+load_dotenv()
+
+# Async driver of each database backend
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql',
+}
+
+# Initialize module-level logger
+logger = logging.getLogger('main.async_db')
+
+
+def to_async_url(url: str) -> URL:
+    """
+    Swap the driver of a database URL for its async counterpart, e.g.
+    `postgresql+psycopg2://...` to `postgresql+asyncpg://...`.
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver known for database '{backend}'")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL') \
+    or to_async_url(DATABASE_URL)
+
+# Create Engine. Tables are created by `database.py` on import
+async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True)
+slow_query_log.install(async_engine)
+
+async_session_blueprint = async_sessionmaker(bind=async_engine,
+                                             autoflush=False,
+                                             expire_on_commit=False)
+
+
+@asynccontextmanager
+async def AsyncSessionLocal():
+    """
+    Async context manager to make transactions around database.
+
+    The read models in `read_models.py` take a sync session; run them with
+    `run_sync`, which passes them a session issuing its queries through the
+    async driver.
+
+    Example Usage:
+        async with AsyncSessionLocal() as session:
+            user = await session.run_sync(get_user, user_id)
+    """
+    session = async_session_blueprint()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
@@ -0,0 +1,207 @@
+"""
+Helpers for the async views served by the ASGI entry point (`asgi.py`).
+
+The decorators wrap the same checks as their sync counterparts (token
+verification, `authorization.check_access`, the compression helpers), so async
+views behave exactly like the Flask routes they replace:
+    async_jwt_required             ~ flask_jwt_extended.jwt_required
+    async_group_member_required    ~ authorization.group_member_required
+    async_etag_for                 ~ versioning.etag_for
+Settings (JWT secret, compression) are read from the config of the Flask app
+mounted by the ASGI app, so both serving modes share one configuration.
+
+Dependencies: async_database.py, authorization.py, versioning.py,
+              revocation.py, compression.py
+"""
+# Standard Imports
+import logging
+from functools import wraps
+from typing import Any, Optional
+
+# Third-Party Imports
+import jwt
+from flask import Flask, Response as FlaskResponse
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import PyJWTError
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import Response
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag, \
+                          unquote_etag
+
+# Project-Specific Imports
+from src.utils.async_database import AsyncSessionLocal
+from src.utils.authorization import check_access
+from src.utils.compression import ENCODINGS, compressible, compress, \
+                                  encoded_etag
+from src.utils.revocation import revocation_store
+from src.utils.versioning import get_version, make_etag, matching_etag
+
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.async_views')
+
+
+# Responses -------------------------------------------------------------------
+def json_response(request: Request, data: Any, status: int = 200) -> Response:
+    """Serialize `data` exactly as Flask's `jsonify` would."""
+    flask_app = request.app.flask_app
+    body = flask_app.json.response(data).get_data()
+    return Response(body, status_code=status, media_type='application/json')
+
+
+def compress_response(request: Request, response: Response) -> Response:
+    """
+    Compress a response following the COMPRESS_* settings, as the Flask app's
+    after-request hook does. Compressed responses carry the ETag suffixed
+    with their encoding.
+    """
+    config = request.app.flask_app.config
+    if not config['COMPRESS_ENABLED']:
+        return response
+
+    media_type = response.headers.get('content-type', '').split(';')[0]
+    if not compressible(response.status_code, media_type,
+                        'content-encoding' in response.headers):
+        return response
+
+    response.headers.append('Vary', 'Accept-Encoding')
+
+    accept = parse_accept_header(request.headers.get('accept-encoding'))
+    encoding = accept.best_match(ENCODINGS)
+    if not encoding or len(response.body) < config['COMPRESS_MIN_SIZE']:
+        return response
+
+    headers = dict(response.headers)
+    headers.pop('content-length')
+    headers['Content-Encoding'] = encoding
+    etag = headers.pop('etag', None)
+    if etag:
+        etag, is_weak = unquote_etag(etag)
+        headers['ETag'] = quote_etag(encoded_etag(etag, encoding), is_weak)
+
+    return Response(compress(response.body, encoding,
+                             config['COMPRESS_LEVEL']),
+                    status_code=response.status_code, headers=headers)
+
+
+def flask_response(response: FlaskResponse) -> Response:
+    """Starlette copy of a response built by the Flask app."""
+    return Response(response.get_data(), status_code=response.status_code,
+                    headers=dict(response.headers))
+
+
+# Authentication --------------------------------------------------------------
+def authenticate(flask_app: Flask, authorization: str):
+    """
+    Verify the access token of an Authorization header with
+    flask_jwt_extended, exactly as `jwt_required` does (including the
+    revocation check), and render any error with the Flask app's JWT error
+    handlers. Returns the user ID and None, or None and the error response.
+    """
+    with flask_app.test_request_context(
+            headers={'Authorization': authorization}):
+        try:
+            verify_jwt_in_request()
+        except (JWTExtendedException, PyJWTError) as e:
+            return None, flask_app.make_response(
+                flask_app.handle_user_exception(e))
+        return get_jwt_identity(), None
+
+
+def async_jwt_required(view):
+    """
+    Decorator requiring a valid, unrevoked access token in the Authorization
+    header. The user ID is stored in `request.state.user_id`.
+    """
+    @wraps(view)
+    async def wrapper(request: Request):
+        flask_app = request.app.flask_app
+        authorization = request.headers.get('authorization', '')
+
+        # The revocation store only touches the database on a filter hit or
+        # a due sync, so most requests skip the thread hop. The unverified
+        # ID only picks the thread, the token is verified either way
+        try:
+            jti = jwt.decode(authorization.partition(' ')[2],
+                             options={"verify_signature": False}).get("jti")
+        except PyJWTError:
+            jti = None
+        if jti and revocation_store.may_be_revoked(jti):
+            user_id, error = await run_in_threadpool(authenticate, flask_app,
+                                                     authorization)
+        else:
+            user_id, error = authenticate(flask_app, authorization)
+
+        if error:
+            return flask_response(error)
+        request.state.user_id = user_id
+        return await view(request)
+
+    return wrapper
+
+
+# Authorization ---------------------------------------------------------------
+async def authorize_group(user_id: int, group_id: int) -> Optional[tuple]:
+    """
+    Async `authorization.authorize_groups` for a single group. Returns the
+    error body and status if the user may not access the group.
+    """
+    async with AsyncSessionLocal() as session:
+        return await session.run_sync(check_access, user_id, group_id)
+
+
+def async_group_member_required(group_arg: str = 'group_id'):
+    """
+    Decorator requiring a valid JWT whose user belongs to the group given by
+    the `group_arg` path parameter.
+    """
+    def decorator(view):
+
+        @wraps(view)
+        @async_jwt_required
+        async def wrapper(request: Request):
+            denied = await authorize_group(request.state.user_id,
+                                           request.path_params[group_arg])
+            if denied:
+                return json_response(request, *denied)
+            return await view(request)
+
+        return wrapper
+
+    return decorator
+
+
+# Conditional GET -------------------------------------------------------------
+def async_etag_for(resource: str, id_arg: Optional[str] = None):
+    """
+    Decorator adding conditional GET to an async view, see
+    `versioning.etag_for`.
+    """
+    def decorator(view):
+
+        @wraps(view)
+        async def wrapper(request: Request):
+
+            resource_id = request.path_params[id_arg] if id_arg else 0
+            async with AsyncSessionLocal() as session:
+                version = await session.run_sync(get_version, resource,
+                                                 resource_id)
+            etag = make_etag(resource, resource_id, version)
+
+            # Client already holds the latest representation
+            client_etag = matching_etag(etag, parse_etags(
+                request.headers.get('if-none-match')))
+            if client_etag:
+                return Response(status_code=304,
+                                headers={'ETag': quote_etag(client_etag)})
+
+            response = await view(request)
+            if response.status_code == 200:
+                response.headers['ETag'] = quote_etag(etag)
+            return response
+
+        return wrapper
+
+    return decorator
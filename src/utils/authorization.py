@@ -0,0 +1,220 @@
+"""
+Group membership authorization for group- and receipt-scoped routes.
+
+The groups each user belongs to are cached per process as
+`user_id -> {group_id: version}`, with the version of the group when the
+membership was confirmed. Every join and leave bumps the group's version (see
+`versioning.py`), in whichever process handles it, so a cached membership is
+only trusted while the group's version is unchanged: a removal takes effect in
+every worker on the next request. Otherwise the membership is confirmed with a
+single EXISTS query and remembered with the current version. Authorized
+requests therefore cost a primary key lookup of the version.
+
+Example Usage:
+    @groups_blueprint.route('/<int:group_id>/receipts', methods=['GET'])
+    @group_member_required()
+    def get_receipts_in_group(group_id: int):
+        ...
+
+Dependencies: models.py, database.py, cache.py, versioning.py
+"""
+# Standard Imports
+import os
+import logging
+from functools import wraps
+from typing import Dict, Iterable, Optional, Tuple
+
+# Third-Party Imports
+from dotenv import load_dotenv
+from flask import jsonify
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from sqlalchemy import select, exists
+
+# Project-Specific Imports
+from src.utils.database import SessionLocal
+from src.utils.models import Group, Receipt, UserGroups
+from src.utils.cache import TTLCache, MISSING
+from src.utils.versioning import get_version, GROUP
+
+
+# Load environmental variables
+load_dotenv()
+
+MEMBERSHIP_CACHE_SIZE = int(os.getenv('MEMBERSHIP_CACHE_SIZE', 10000))
+MEMBERSHIP_CACHE_TTL = float(os.getenv('MEMBERSHIP_CACHE_TTL', 300))
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.authorization')
+
+# user_id -> {group_id: version of the group} the user is known to belong to
+memberships = TTLCache(MEMBERSHIP_CACHE_SIZE, MEMBERSHIP_CACHE_TTL)
+# receipt_id -> group_id. Receipts never move between groups
+receipt_groups = TTLCache(MEMBERSHIP_CACHE_SIZE, MEMBERSHIP_CACHE_TTL)
+
+
+# Membership cache ------------------------------------------------------------
+def check_membership(session, user_id: int, group_id: int) -> bool:
+    """
+    Check whether a user belongs to a group, trusting the cache only while the
+    group's version is the one the membership was confirmed at.
+    """
+    # Read before the EXISTS, so a join or leave committed in between leaves
+    # a version that no longer matches
+    version = get_version(session, GROUP, group_id)
+    groups = memberships.get(user_id)
+    if groups is not MISSING and groups.get(group_id) == version:
+        return True
+
+    member = session.scalar(select(exists().where(
+        UserGroups.c.user_id == user_id,
+        UserGroups.c.group_id == group_id)))
+
+    if member:
+        remember_membership(user_id, group_id, version)
+    else:
+        forget_membership(user_id, group_id)
+    return member
+
+
+def remember_membership(user_id: int, group_id: int, version: int):
+    """Record that a user belongs to a group at a version of the group."""
+    groups = memberships.get(user_id)
+    # Replace rather than mutate the cached mapping, which other threads read
+    groups = {} if groups is MISSING else dict(groups)
+    groups[group_id] = version
+    memberships.set(user_id, groups)
+
+
+def forget_membership(user_id: int, group_id: int):
+    """Record that a user left a group."""
+    groups = memberships.get(user_id)
+    if groups is not MISSING and group_id in groups:
+        groups = dict(groups)
+        del groups[group_id]
+        memberships.set(user_id, groups)
+
+
+def forget_user(user_id: int):
+    memberships.invalidate(user_id)
+
+
+def forget_group(group_id: int):
+    """
+    Drop every cached membership. Only needed when a group is deleted, which
+    is rare enough not to warrant a reverse index.
+    """
+    memberships.clear()
+
+
+def group_of_receipt(receipt_id: int) -> Optional[int]:
+    """Group ID of a receipt, None if the receipt does not exist."""
+    group_id = receipt_groups.get(receipt_id)
+    if group_id is MISSING:
+        with SessionLocal() as session:
+            group_id = session.scalar(select(Receipt.group_id)
+                                      .where(Receipt.receipt_id == receipt_id))
+        # Do not cache unknown receipts, they may be uploaded later
+        if group_id is not None:
+            receipt_groups.set(receipt_id, group_id)
+    return group_id
+
+
+def forget_receipt(receipt_id: int):
+    receipt_groups.invalidate(receipt_id)
+
+
+# Authorization ---------------------------------------------------------------
+def authorize_groups(user_id: int, group_ids: Iterable[int]):
+    """
+    Return an error response if the user is not a member of every group,
+    otherwise None.
+    """
+    with SessionLocal() as session:
+        for group_id in set(group_ids):
+            denied = check_access(session, user_id, group_id)
+            if denied:
+                return jsonify(denied[0]), denied[1]
+    return None
+
+
+def check_access(session, user_id: int,
+                 group_id: int) -> Optional[Tuple[Dict, int]]:
+    """
+    Error body and status if the user may not access the group, otherwise
+    None: 404 if the group does not exist, 403 otherwise. Shared by the sync
+    and async views; the existence check only runs on the rejected path.
+    """
+    if check_membership(session, user_id, group_id):
+        return None
+
+    group_exists = session.scalar(
+        select(exists().where(Group.group_id == group_id)))
+    if not group_exists:
+        return {"error": "Not Found",
+                "message": "No group with this ID found"}, 404
+
+    logger.warning("User ID %s denied access to group ID %s.",
+                   user_id, group_id)
+    return {"error": "Forbidden",
+            "message": "User is not a member of this group"}, 403
+
+
+def group_member_required(group_arg: str = 'group_id',
+                          self_arg: Optional[str] = None):
+    """
+    Decorator requiring a valid JWT whose user belongs to the group given by
+    the `group_arg` route argument.
+
+    Inputs
+    ------
+    group_arg (str)
+        Name of the route argument holding the group ID
+    self_arg (str)
+        Name of a route argument holding a user ID. If it equals the caller's
+        own ID, membership is not required (e.g. a user joining a group)
+    """
+    def decorator(view):
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            verify_jwt_in_request()
+            user_id = get_jwt_identity()
+
+            if self_arg and kwargs.get(self_arg) == user_id:
+                return view(*args, **kwargs)
+
+            denied = authorize_groups(user_id, [kwargs[group_arg]])
+            if denied:
+                return denied
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def receipt_member_required(receipt_arg: str = 'receipt_id'):
+    """
+    Decorator requiring a valid JWT whose user belongs to the group owning the
+    receipt given by the `receipt_arg` route argument.
+    """
+    def decorator(view):
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            verify_jwt_in_request()
+            user_id = get_jwt_identity()
+
+            group_id = group_of_receipt(kwargs[receipt_arg])
+            if group_id is None:
+                return jsonify({"error": "Not Found",
+                                "message": "No receipt with this ID found"}), 404
+
+            denied = authorize_groups(user_id, [group_id])
+            if denied:
+                return denied
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,106 @@
+"""
+Bounded in-process LRU cache with per-entry time-to-live, and the caches used
+to resolve usernames, user IDs and group names.
+
+The caches are local to each worker process. Routes that change a mapping must
+invalidate it explicitly; the TTL bounds how long other workers may serve a
+stale answer.
+"""
+# Standard Imports
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable
+
+# Third-Party Imports
+from dotenv import load_dotenv
+
+
+# Load environmental variables
+load_dotenv()
+
+# Maximum entries and time-to-live (seconds) of the resolution caches
+RESOLVE_CACHE_SIZE = int(os.getenv('RESOLVE_CACHE_SIZE', 10000))
+RESOLVE_CACHE_TTL = float(os.getenv('RESOLVE_CACHE_TTL', 300))
+
+# Returned by `TTLCache.get` when a key is not cached. Distinct from None so
+# that negative lookups (e.g. unknown usernames) can be cached too
+MISSING = object()
+
+
+class TTLCache():
+    """
+    Thread-safe least-recently-used cache whose entries expire `ttl` seconds
+    after being set.
+
+    Example Usage:
+        cache = TTLCache(maxsize=100, ttl=60)
+        value = cache.get(key)
+        if value is MISSING:
+            value = expensive_lookup(key)
+            cache.set(key, value)
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300,
+                 timer: Callable[[], float] = time.monotonic):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._timer = timer
+        self._entries: OrderedDict = OrderedDict()  # key -> (expiry, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value, or MISSING if absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            expiry, value = entry
+            if expiry <= self._timer():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        """Return the cached values of all keys that are present."""
+        results = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not MISSING:
+                results[key] = value
+        return results
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (self._timer() + self._ttl, value)
+            self._entries.move_to_end(key)
+            # Evict the least recently used entries
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def set_many(self, mapping: Dict[Hashable, Any]):
+        for key, value in mapping.items():
+            self.set(key, value)
+
+    def invalidate(self, *keys: Hashable):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Resolution caches -----------------------------------------------------------
+# username -> user_id (None if no such user)
+username_to_id = TTLCache(RESOLVE_CACHE_SIZE, RESOLVE_CACHE_TTL)
+# user_id -> username (None if no such user)
+user_id_to_name = TTLCache(RESOLVE_CACHE_SIZE, RESOLVE_CACHE_TTL)
+# group_name -> group_id (None if no such group)
+group_name_to_id = TTLCache(RESOLVE_CACHE_SIZE, RESOLVE_CACHE_TTL)
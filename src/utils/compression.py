@@ -0,0 +1,134 @@
+"""
+Response compression for the Flask app.
+
+Compresses responses with brotli (if installed) or gzip, depending on the
+client's `Accept-Encoding`. Small payloads and non-compressible content types
+are sent as-is. Optionally, compressed bodies of responses carrying an ETag are
+cached so that repeated reads of unchanged resources are only compressed once.
+
+Configuration (app.config, defaults from environment variables):
+    COMPRESS_ENABLED (bool): Enable compression. Default true
+    COMPRESS_MIN_SIZE (int): Minimum body size in bytes. Default 500
+    COMPRESS_LEVEL (int): gzip level 1-9 (brotli quality 0-11). Default 6
+    COMPRESS_CACHE (bool): Cache compressed bodies of ETagged responses.
+        Default false
+    COMPRESS_CACHE_SIZE (int): Maximum cached bodies. Default 256
+"""
+# Standard Imports
+import os
+import gzip
+import logging
+
+# Third-Party Imports
+from flask import Flask, request
+
+# Project-Specific Imports
+from src.utils.cache import TTLCache, MISSING
+
+# Brotli is optional - only gzip is offered if it is not installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.compression')
+
+# Supported encodings, in order of preference
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/plain',
+                          'text/csv', 'application/javascript'}
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes')
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=min(level, 11))
+    return gzip.compress(data, compresslevel=min(max(level, 1), 9))
+
+
+def compressible(status_code: int, mimetype: str, encoded: bool) -> bool:
+    """
+    Whether a response may be compressed: complete, successful, not already
+    encoded and of a compressible type. Shared by the Flask and ASGI apps.
+    """
+    return (200 <= status_code
+            and status_code not in (204, 206, 304)
+            and not encoded
+            and mimetype in COMPRESSIBLE_MIMETYPES)
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """
+    ETag of a compressed representation. A strong ETag identifies a single
+    representation, so compressed bodies are tagged separately.
+    """
+    return f"{etag}-{encoding}"
+
+
+def init_compression(app: Flask):
+    """
+    Register the compression hook on the app.
+    """
+    app.config.setdefault('COMPRESS_ENABLED',
+                          _env_flag('COMPRESS_ENABLED', 'true'))
+    app.config.setdefault('COMPRESS_MIN_SIZE',
+                          int(os.getenv('COMPRESS_MIN_SIZE', 500)))
+    app.config.setdefault('COMPRESS_LEVEL',
+                          int(os.getenv('COMPRESS_LEVEL', 6)))
+    app.config.setdefault('COMPRESS_CACHE',
+                          _env_flag('COMPRESS_CACHE', 'false'))
+    app.config.setdefault('COMPRESS_CACHE_SIZE',
+                          int(os.getenv('COMPRESS_CACHE_SIZE', 256)))
+
+    # Compressed bodies keyed by (path, ETag, encoding). The ETag changes with
+    # the content so entries never go stale; the TTL only bounds memory
+    precompressed = TTLCache(maxsize=app.config['COMPRESS_CACHE_SIZE'],
+                             ttl=3600)
+
+    @app.after_request
+    def compress_response(response):
+
+        config = app.config
+        if not config['COMPRESS_ENABLED']:
+            return response
+
+        # Only compress complete, successful, compressible responses
+        if response.direct_passthrough or not compressible(
+                response.status_code, response.mimetype,
+                'Content-Encoding' in response.headers):
+            return response
+
+        response.vary.add('Accept-Encoding')
+
+        encoding = request.accept_encodings.best_match(ENCODINGS)
+        if not encoding:
+            return response
+
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+
+        etag, is_weak = response.get_etag()
+        cache_key = (request.full_path, etag, encoding)
+        compressed = MISSING
+        if config['COMPRESS_CACHE'] and etag:
+            compressed = precompressed.get(cache_key)
+
+        if compressed is MISSING:
+            compressed = compress(data, encoding, config['COMPRESS_LEVEL'])
+            if config['COMPRESS_CACHE'] and etag:
+                precompressed.set(cache_key, compressed)
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+
+        if etag:
+            response.set_etag(encoded_etag(etag, encoding), weak=is_weak)
+
+        return response
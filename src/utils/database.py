@@ -13,12 +13,16 @@ from contextlib import contextmanager
 from pathlib import Path
 
 # Third-Party Imports
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import create_engine, inspect, text, MetaData
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 
 # Project-Specific Imports
 from src.utils.models import Base
+from src.utils.spending_rollups import backfill_rollups
+from src.utils.metrics import db_session_retries
+from src.utils.slow_queries import slow_query_log
+from src.utils.server_timing import span
 
 
 # Load environmental variables
@@ -42,11 +46,14 @@ elif mode == 'production':
 else:
     raise ValueError(f"Invalid MODE: {mode}")
 
-print(f"Running in {mode} mode!")
+logger.info("Running in %s mode!", mode)
 
 # Create Engine
 engine = create_engine(DATABASE_URL, pool_pre_ping=True)
 
+# Log queries slower than SLOW_QUERY_MS to SLOW_QUERY_LOG
+slow_query_log.install(engine)
+
 # Session object for database transaction sessions
 @contextmanager
 def SessionLocal():
@@ -64,11 +71,13 @@ def SessionLocal():
         session = session_blueprint()
         
         try:
-            # Yield session to the calling code
-            yield session
-            
-            # Commit the transaction
-            session.commit()
+            # Timed as a `db` span of the request's Server-Timing
+            with span('db'):
+                # Yield session to the calling code
+                yield session
+                
+                # Commit the transaction
+                session.commit()
             break
         
         # Catch database connection errors. This must be raised by children
@@ -76,19 +85,52 @@ def SessionLocal():
         except Exception as e:
             session.rollback()
             attempt += 1
+            db_session_retries.inc()
             if attempt >= RETRY_LIMIT:
                 msg = f"""Database operation faiiled after 
                       {RETRY_LIMIT} retries: {e}"""
                 logger.critical(msg)
                 raise Exception(msg)
             
-            logger.critical((f"Retrying session operation due to "
-                             f"disconnection..." 
-                             f"(Attempt {attempt}/{RETRY_LIMIT})"))
+            logger.critical("Retrying session operation due to "
+                            "disconnection...(Attempt %s/%s)",
+                            attempt, RETRY_LIMIT)
             time.sleep(RETRY_DELAY)
         
         finally:
             session.close()
 
+def add_missing_columns(bind):
+    """
+    Add columns defined in `models.py` but missing from existing tables,
+    which `create_all` does not do. Only suited to columns with a server
+    default (or nullable), e.g. the `version` columns added to `user_items`
+    and `user_spending`.
+    """
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column["name"]
+                        for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = (f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                       f"{column.type.compile(bind.dialect)}")
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+                connection.execute(text(ddl))
+                logger.warning("Added missing column %s.%s",
+                               table.name, column.name)
+
 # Create tables (IF NOT EXISTS)
 Base.metadata.create_all(bind=engine)
+add_missing_columns(engine)
+# Costs written before the spending rollups existed
+backfill_rollups(engine)
@@ -0,0 +1,343 @@
+"""
+Per-group change events, pushed to clients over Server-Sent Events by
+`GET /groups/<group_id>/events` instead of them polling the receipt and
+user-item routes.
+
+Routes call `publish_after_commit` inside their session; the events are
+published once (and only if) the session commits. The `EventBus` fans each
+event out to the subscribers of its group in this process through bounded
+queues. A subscriber too slow to keep up is disconnected rather than allowed
+to buffer without bound, and refetches on reconnecting.
+
+gunicorn runs several worker processes, and a client's stream is held by one
+of them. With EVENTS_BROKER_URL set, events are instead appended to a
+`group_events` table in that database (e.g. a SQLite file shared by the
+workers of a host, or the main database across hosts), which every process
+polls and fans out locally.
+
+Each open stream holds a worker thread, so a process serves at most
+EVENTS_MAX_STREAMS at once. Streams above the limit are refused with
+`503 Service Unavailable` and keep the remaining threads free for other
+requests. `gunicorn.conf.py` defaults the limit to half the threads of a
+worker.
+
+Event types:
+    receipt-added, receipt-deleted    {"receipt_id": 3}
+    user-item-updated                 {"receipt_id": 3, "user_items": [...]}
+    cost-updated                      {"receipt_id": 3, "costs": [...]}
+
+Configuration (environment variables):
+    EVENTS_BROKER_URL (str): SQLAlchemy URL of the event log shared by
+        processes. Default unset (in-process only)
+    EVENTS_POLL_INTERVAL (float): Seconds between polls of the broker.
+        Default 0.5
+    EVENTS_RETENTION (float): Seconds events are kept in the broker. Default 300
+    EVENTS_QUEUE_SIZE (int): Events buffered per subscriber. Default 100
+    EVENTS_HEARTBEAT (float): Seconds between keep-alive comments on an idle
+        stream. Default 15
+    EVENTS_STREAM_SECONDS (float): Seconds before a stream is closed, after
+        which the client reconnects. Default 300
+    EVENTS_MAX_STREAMS (int): Streams open at once in a process. Default 4
+
+Dependencies: read_models.py
+"""
+# Standard Imports
+import os
+import json
+import time
+import queue
+import logging
+import itertools
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional
+
+# Third-Party Imports
+from dotenv import load_dotenv
+from sqlalchemy import Table, Column, MetaData, Integer, VARCHAR, Text, \
+                       DateTime, create_engine, event, select, insert, delete, \
+                       func
+from sqlalchemy.orm import Session
+
+# Project-Specific Imports
+from src.utils.read_models import receipt_groups
+
+
+# Load environmental variables
+load_dotenv()
+
+EVENTS_BROKER_URL = os.getenv('EVENTS_BROKER_URL')
+EVENTS_POLL_INTERVAL = float(os.getenv('EVENTS_POLL_INTERVAL', 0.5))
+EVENTS_RETENTION = float(os.getenv('EVENTS_RETENTION', 300))
+EVENTS_QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', 100))
+EVENTS_HEARTBEAT = float(os.getenv('EVENTS_HEARTBEAT', 15))
+EVENTS_STREAM_SECONDS = float(os.getenv('EVENTS_STREAM_SECONDS', 300))
+EVENTS_MAX_STREAMS = int(os.getenv('EVENTS_MAX_STREAMS', 4))
+
+# Event types
+RECEIPT_ADDED = 'receipt-added'
+RECEIPT_DELETED = 'receipt-deleted'
+USER_ITEM_UPDATED = 'user-item-updated'
+COST_UPDATED = 'cost-updated'
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.events')
+
+
+class Event(NamedTuple):
+    id: int
+    group_id: int
+    name: str
+    data: Dict
+
+    def encode(self) -> str:
+        """The event as a Server-Sent Events frame."""
+        return (f"id: {self.id}\nevent: {self.name}\n"
+                f"data: {json.dumps(self.data, default=str)}\n\n")
+
+
+class Subscription():
+    """
+    Events of a group received by one client. Closed when the client falls
+    more than `maxsize` events behind.
+    """
+
+    def __init__(self, group_id: int, maxsize: int = EVENTS_QUEUE_SIZE):
+        self.group_id = group_id
+        self.closed = False
+        self._queue = queue.Queue(maxsize)
+
+    def put(self, event: Event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.closed = True
+
+    def get(self, timeout: float) -> Optional[Event]:
+        """Next event, None if there is none within `timeout` seconds."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus():
+    """
+    In-process fan-out of events to the subscribers of each group, optionally
+    through a broker shared with other processes.
+
+    Example Usage:
+        subscription = event_bus.subscribe(group_id)
+        try:
+            event = subscription.get(timeout=15)
+        finally:
+            event_bus.unsubscribe(subscription)
+    """
+
+    def __init__(self, broker: Optional['DatabaseBroker'] = None,
+                 max_streams: int = EVENTS_MAX_STREAMS):
+        self.broker = broker
+        self.max_streams = max_streams
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        self._ids = itertools.count(1)
+        self._streams = 0
+
+    def open_stream(self) -> bool:
+        """Reserve one of the streams of the process, False if none is left."""
+        with self._lock:
+            if self._streams >= self.max_streams:
+                return False
+            self._streams += 1
+            return True
+
+    def close_stream(self):
+        with self._lock:
+            self._streams -= 1
+
+    def subscribe(self, group_id: int) -> Subscription:
+        if self.broker:
+            self.broker.ensure_started(self)
+        subscription = Subscription(group_id)
+        with self._lock:
+            self._subscribers[group_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.group_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.group_id]
+
+    def has_subscribers(self) -> bool:
+        return bool(self._subscribers)
+
+    def publish(self, group_id: int, name: str, data: Dict):
+        """Send an event to the subscribers of a group, in every process."""
+        if self.broker:
+            self.broker.append(group_id, name, data)
+        else:
+            self.deliver(Event(next(self._ids), group_id, name, data))
+
+    def deliver(self, event: Event):
+        """Send an event to the subscribers of its group in this process."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(event.group_id, ()))
+        for subscription in subscribers:
+            subscription.put(event)
+
+
+class DatabaseBroker():
+    """
+    Event log in a database shared by processes. Each process polls it for
+    events appended since its last poll and delivers them to its bus.
+
+    Polling threads do not survive a fork, so polling starts with the first
+    subscriber of each process, and skips the database while it has none.
+    """
+
+    def __init__(self, url: str, poll_interval: float = EVENTS_POLL_INTERVAL,
+                 retention: float = EVENTS_RETENTION):
+        self.engine = create_engine(url, pool_pre_ping=True)
+        self.table = Table(
+            'group_events', MetaData(),
+            Column('event_id', Integer, primary_key=True, autoincrement=True),
+            Column('group_id', Integer, nullable=False),
+            Column('name', VARCHAR(30), nullable=False),
+            Column('data', Text, nullable=False),
+            Column('created_at', DateTime, nullable=False, index=True))
+        self.table.metadata.create_all(self.engine)
+
+        self._poll_interval = poll_interval
+        self._retention = retention
+        self._lock = threading.Lock()
+        self._pid = None
+
+    @staticmethod
+    def _now() -> datetime:
+        return datetime.now(timezone.utc).replace(tzinfo=None)
+
+    def append(self, group_id: int, name: str, data: Dict):
+        with self.engine.begin() as connection:
+            connection.execute(insert(self.table).values(
+                group_id=group_id, name=name,
+                data=json.dumps(data, default=str), created_at=self._now()))
+
+    def ensure_started(self, bus: EventBus):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, args=(bus,),
+                             name='event-poller', daemon=True).start()
+
+    def poll(self, after_id: Optional[int]) -> List[Event]:
+        """Events appended after `after_id`, all retained events if None."""
+        stmt = select(self.table).order_by(self.table.c.event_id)
+        if after_id is not None:
+            stmt = stmt.where(self.table.c.event_id > after_id)
+        with self.engine.connect() as connection:
+            return [Event(row.event_id, row.group_id, row.name,
+                          json.loads(row.data))
+                    for row in connection.execute(stmt)]
+
+    def last_id(self) -> int:
+        with self.engine.connect() as connection:
+            return connection.scalar(
+                select(func.max(self.table.c.event_id))) or 0
+
+    def purge(self) -> int:
+        """Delete events older than the retention. Returns the number."""
+        with self.engine.begin() as connection:
+            return connection.execute(
+                delete(self.table).where(
+                    self.table.c.created_at <
+                    self._now() - timedelta(seconds=self._retention))
+            ).rowcount
+
+    def _run(self, bus: EventBus):
+        last_id = None
+        next_purge = time.monotonic() + self._retention
+        while True:
+            time.sleep(self._poll_interval)
+            try:
+                # Events published while nobody listened are not replayed
+                if not bus.has_subscribers():
+                    last_id = None
+                    continue
+                if last_id is None:
+                    last_id = self.last_id()
+                    continue
+
+                for event in self.poll(last_id):
+                    bus.deliver(event)
+                    last_id = event.id
+
+                if time.monotonic() > next_purge:
+                    next_purge = time.monotonic() + self._retention
+                    self.purge()
+            except Exception as e:
+                logger.error("Failed to poll events - %s", e)
+
+
+# Shared by every route in the process
+event_bus = EventBus(DatabaseBroker(EVENTS_BROKER_URL)
+                     if EVENTS_BROKER_URL else None)
+
+
+def listened() -> bool:
+    """Whether any process may have subscribers to publish to."""
+    return event_bus.broker is not None or event_bus.has_subscribers()
+
+
+def publish_after_commit(session: Session, group_id: int, name: str,
+                         data: Dict):
+    """
+    Publish an event once the session commits, so clients never see changes
+    that are rolled back (or refetch before they are visible).
+    """
+    if listened():
+        session.info.setdefault('events', []).append((group_id, name, data))
+
+
+def publish_receipt_rows(session: Session, name: str, key: str,
+                         rows: List[Dict]):
+    """
+    Publish an event per receipt of `rows` (dictionaries with a "receipt_id")
+    to the receipt's group, carrying its rows under `key`.
+
+    Example Usage:
+        publish_receipt_rows(session, COST_UPDATED, "costs", costs)
+    """
+    if not rows or not listened():
+        return
+
+    by_receipt = defaultdict(list)
+    for row in rows:
+        by_receipt[row["receipt_id"]].append(row)
+
+    groups = receipt_groups(session, by_receipt)
+    for receipt_id, receipt_rows in by_receipt.items():
+        if receipt_id in groups:
+            publish_after_commit(session, groups[receipt_id], name,
+                                 {"receipt_id": receipt_id, key: receipt_rows})
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_pending(session: Session):
+    for group_id, name, data in session.info.pop('events', []):
+        try:
+            event_bus.publish(group_id, name, data)
+        except Exception as e:
+            logger.error("Failed to publish %s to group %s - %s",
+                         name, group_id, e)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session: Session):
+    session.info.pop('events', None)
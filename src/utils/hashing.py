@@ -0,0 +1,94 @@
+"""
+Shared password hashing service.
+
+bcrypt is deliberately slow and releases the GIL while hashing, so hashes and
+verifications run on a bounded thread pool shared by the whole process. This
+caps how many CPU-bound bcrypt operations run at once, regardless of how many
+requests are in flight. Callers must not hold a database session while
+waiting on the hasher.
+
+Configuration (environment variables):
+    BCRYPT_ROUNDS (int): bcrypt cost factor. Default 12. Hashes with a
+        different cost are rehashed on the next successful login
+    BCRYPT_WORKERS (int): Threads in the hashing pool. Default CPU count
+"""
+# Standard Imports
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+# Third-Party Imports
+from dotenv import load_dotenv
+from passlib.context import CryptContext
+
+# Project-Specific Imports
+from src.utils.profiling import profiled
+from src.utils.server_timing import span
+
+
+# Load environmental variables
+load_dotenv()
+
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', os.cpu_count() or 1))
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.hashing')
+
+
+class PasswordHasher():
+    """
+    Hash and verify passwords on a bounded thread pool.
+
+    Example Usage:
+        hashed_password = password_hasher.hash("password")
+        valid, new_hash = password_hasher.verify_and_update("password",
+                                                            hashed_password)
+    """
+
+    def __init__(self, rounds: int = BCRYPT_ROUNDS,
+                 workers: int = BCRYPT_WORKERS):
+
+        # Pinning the minimum and maximum rounds to the configured cost marks
+        # hashes of any other cost as needing an update
+        self._pwd_context = CryptContext(schemes=['bcrypt'],
+                                         deprecated='auto',
+                                         bcrypt__default_rounds=rounds,
+                                         bcrypt__min_rounds=rounds,
+                                         bcrypt__max_rounds=rounds)
+        self._pool = ThreadPoolExecutor(max_workers=workers,
+                                        thread_name_prefix='bcrypt')
+
+    def hash(self, plain_password: str) -> str:
+        with span('bcrypt'):
+            return self._pool.submit(profiled(self._pwd_context.hash),
+                                     plain_password).result()
+
+    def verify(self, plain_password: str, hashed_password: str) -> bool:
+        with span('bcrypt'):
+            return self._pool.submit(profiled(self._pwd_context.verify),
+                                     plain_password, hashed_password).result()
+
+    def verify_and_update(self, plain_password: str,
+                          hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verify a password and, if it is valid but hashed with a different
+        cost, return a new hash to be stored.
+
+        Returns
+        -------
+        (bool, str | None)
+            Whether the password is valid, and the new hash if one is needed
+        """
+        with span('bcrypt'):
+            return self._pool.submit(
+                profiled(self._pwd_context.verify_and_update),
+                plain_password, hashed_password).result()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+# Shared by every route in the process
+password_hasher = PasswordHasher()
@@ -0,0 +1,280 @@
+"""
+Idempotency keys for write routes that clients retry, e.g. receipt uploads
+from mobile clients on flaky connections.
+
+A request sent with an `Idempotency-Key` header claims the key (scoped to the
+user and route) before doing any work, and stores its response under it. A
+retry with the same key and body replays the stored response, marked with an
+`Idempotent-Replayed: true` header, without parsing or querying anything
+else. Reusing a key with a different body is answered with
+`422 Unprocessable Entity`, and retrying while the first request is still in
+progress with `409 Conflict`. A claim left in progress for longer than
+IDEMPOTENCY_CLAIM_TIMEOUT (e.g. by a worker killed mid-request) is taken over
+by the next retry, which runs the request again.
+
+Keys are stored in the `idempotency_keys` table, so a retry reaching another
+gunicorn worker is replayed too. Server errors are not stored, so that they
+can be retried. The store is bounded by expiring entries after
+IDEMPOTENCY_TTL seconds and by not storing bodies above IDEMPOTENCY_MAX_BODY
+bytes.
+
+Configuration (environment variables):
+    IDEMPOTENCY_TTL (float): Seconds responses are replayed for. Default 86400
+    IDEMPOTENCY_MAX_BODY (int): Largest response body stored, in bytes.
+        Default 65535
+    IDEMPOTENCY_PURGE_INTERVAL (float): Seconds between purges of expired
+        entries. Default 3600
+    IDEMPOTENCY_CLAIM_TIMEOUT (float): Seconds after which a request still in
+        progress is considered abandoned. Default 120
+
+Dependencies: models.py, database.py
+"""
+# Standard Imports
+import os
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from typing import Optional
+
+# Third-Party Imports
+from dotenv import load_dotenv
+from flask import request, jsonify, make_response, Response
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import insert, update, delete, func
+from sqlalchemy.exc import IntegrityError
+
+# Project-Specific Imports
+from src.utils.database import SessionLocal
+from src.utils.models import IdempotencyKey
+
+
+# Load environmental variables
+load_dotenv()
+
+IDEMPOTENCY_TTL = float(os.getenv('IDEMPOTENCY_TTL', 86400))
+IDEMPOTENCY_MAX_BODY = int(os.getenv('IDEMPOTENCY_MAX_BODY', 65535))
+IDEMPOTENCY_PURGE_INTERVAL = float(os.getenv('IDEMPOTENCY_PURGE_INTERVAL',
+                                             3600))
+IDEMPOTENCY_CLAIM_TIMEOUT = float(os.getenv('IDEMPOTENCY_CLAIM_TIMEOUT', 120))
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.idempotency')
+
+
+def _now() -> datetime:
+    """Naive UTC time, as stored in the database."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _hash(*parts) -> str:
+    return hashlib.sha256("\x1f".join(map(str, parts)).encode()).hexdigest()
+
+
+class IdempotencyStore():
+    """
+    Claims, completes and looks up idempotency keys.
+
+    Example Usage:
+        entry = idempotency_store.claim(key, fingerprint)
+        if entry is None:
+            response = view()
+            idempotency_store.complete(key, response)
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL,
+                 max_body: int = IDEMPOTENCY_MAX_BODY,
+                 purge_interval: float = IDEMPOTENCY_PURGE_INTERVAL,
+                 claim_timeout: float = IDEMPOTENCY_CLAIM_TIMEOUT):
+        self._ttl = ttl
+        self._claim_timeout = claim_timeout
+        self._max_body = max_body
+        self._purge_interval = purge_interval
+        self._lock = threading.Lock()
+        self._next_purge = time.monotonic() + purge_interval
+
+    def claim(self, key: str, fingerprint: str) -> Optional[IdempotencyKey]:
+        """
+        Claim a key for a new request. Returns None if claimed, otherwise the
+        existing (possibly in progress) entry of the key. An abandoned claim
+        of the same request is taken over.
+        """
+        self._maybe_purge()
+        with SessionLocal() as session:
+            for _ in range(2):
+                entry = session.get(IdempotencyKey, key)
+                if entry and entry.created_at < self._expired_before():
+                    session.delete(entry)
+                    session.flush()
+                    entry = None
+                if entry and entry.status is None \
+                        and entry.fingerprint == fingerprint \
+                        and self._take_over(session, key):
+                    return None
+                if entry:
+                    session.expunge(entry)
+                    return entry
+
+                try:
+                    now = _now()
+                    session.execute(insert(IdempotencyKey).values(
+                        key=key, fingerprint=fingerprint,
+                        created_at=now, claimed_at=now))
+                    session.commit()
+                    return None
+                # Claimed concurrently: return the winner's entry
+                except IntegrityError:
+                    session.rollback()
+        raise RuntimeError(f"Failed to claim idempotency key {key}")
+
+    def _take_over(self, session, key: str) -> bool:
+        """
+        Claim a key whose request has been in progress for longer than the
+        claim timeout. Conditional on the claim still being abandoned, so
+        only one of concurrent retries takes it over.
+        """
+        abandoned_before = _now() - timedelta(seconds=self._claim_timeout)
+        taken = session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.key == key,
+                   IdempotencyKey.status.is_(None),
+                   func.coalesce(IdempotencyKey.claimed_at,
+                                 IdempotencyKey.created_at)
+                   < abandoned_before)
+            .values(claimed_at=_now())).rowcount
+        if taken:
+            session.commit()
+            logger.warning("Took over abandoned idempotency key %s.", key)
+        return bool(taken)
+
+    def complete(self, key: str, response: Response):
+        """Store the response of a claimed key, or release the key."""
+        body = response.get_data()
+        if response.status_code >= 500 or response.status_code == 429 \
+                or len(body) > self._max_body:
+            return self.release(key)
+
+        with SessionLocal() as session:
+            session.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.key == key)
+                .values(status=response.status_code,
+                        content_type=response.content_type, body=body))
+
+    def release(self, key: str):
+        """Forget a claimed key, so the request can be retried."""
+        with SessionLocal() as session:
+            session.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.key == key))
+
+    def _expired_before(self) -> datetime:
+        return _now() - timedelta(seconds=self._ttl)
+
+    def _maybe_purge(self):
+        if time.monotonic() < self._next_purge:
+            return
+        with self._lock:
+            if time.monotonic() < self._next_purge:
+                return
+            self._next_purge = time.monotonic() + self._purge_interval
+        try:
+            with SessionLocal() as session:
+                purged = session.execute(
+                    delete(IdempotencyKey)
+                    .where(IdempotencyKey.created_at < self._expired_before())
+                ).rowcount
+            logger.debug("Purged %s expired idempotency keys.", purged)
+        except Exception as e:
+            logger.error("Failed to purge idempotency keys - %s", e)
+
+
+# Shared by every route in the process
+idempotency_store = IdempotencyStore()
+
+
+def fingerprint() -> str:
+    """
+    Hash of the request body. Multipart bodies are hashed by their fields and
+    file contents, as clients pick a new boundary for every attempt.
+    """
+    if request.mimetype != 'multipart/form-data':
+        return _hash(request.get_data(cache=True))
+
+    parts = sorted(request.form.items(multi=True))
+    for name, file in sorted(request.files.items(multi=True),
+                             key=lambda item: item[0]):
+        parts.append((name, file.filename,
+                      hashlib.sha256(file.stream.read()).hexdigest()))
+        file.stream.seek(0)
+    return _hash(*parts)
+
+
+def replay(entry: IdempotencyKey) -> Response:
+    response = make_response(entry.body, entry.status)
+    response.content_type = entry.content_type
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def idempotent(view):
+    """
+    Decorator replaying the stored response of requests retried with the
+    same `Idempotency-Key` header. Must be applied after the JWT check, as
+    keys are scoped to the user.
+
+    Example Usage:
+        @receipt_blueprint.route('/user-items', methods=['PUT'])
+        @jwt_required()
+        @idempotent
+        def update_user_item_associations():
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        header = request.headers.get(HEADER)
+        if header is None:
+            return view(*args, **kwargs)
+
+        if not header or len(header) > MAX_KEY_LENGTH:
+            return jsonify({
+                "error": "Bad Request",
+                "message": f"{HEADER} must be 1 to {MAX_KEY_LENGTH} "
+                           f"characters"}), 400
+
+        key = _hash(get_jwt_identity(), request.method, request.path, header)
+        request_fingerprint = fingerprint()
+
+        entry = idempotency_store.claim(key, request_fingerprint)
+        if entry is not None:
+            if entry.fingerprint != request_fingerprint:
+                return jsonify({
+                    "error": "Unprocessable Entity",
+                    "message": f"{HEADER} was already used for a different "
+                               f"request"}), 422
+            if entry.status is None:
+                response = jsonify({
+                    "error": "Conflict",
+                    "message": f"A request with this {HEADER} is still "
+                               f"in progress"})
+                response.headers['Retry-After'] = '1'
+                return response, 409
+
+            logger.info("Replaying response to %s %s for a retried %s.",
+                        request.method, request.path, HEADER)
+            return replay(entry)
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            idempotency_store.release(key)
+            raise
+
+        idempotency_store.complete(key, response)
+        return response
+
+    return wrapper
@@ -0,0 +1,240 @@
+"""
+Memory tracking of receipt uploads, to find what keeps workers growing in RSS
+after many uploads (e.g. pypdf objects or pandas frames kept alive).
+
+With MEMORY_TRACKING_ENABLED, allocations are traced with tracemalloc and
+every tracked request (`add_receipt_to_group`) is reported with:
+    peak_bytes          Highest traced memory above its start
+    retained_bytes      Memory still allocated when it returns, once garbage
+                        is collected, with retained_blocks. Includes the
+                        uploaded file, still held by the request
+    phases              Peak of its tracked phases, e.g. `parse` for
+                        `SainsburysReceipt`
+    top_sites           Allocation sites (file:line) retaining the most memory
+    rss_bytes           Resident memory of the process afterwards
+The report is logged as the `memory` field of a JSON log line and the latest
+are listed by `GET /memory`, which requires the `X-Profile` header (see
+PROFILE_TOKEN).
+
+tracemalloc traces the whole process, so only one request is tracked at a
+time (others are counted as skipped) and allocations of concurrent requests
+are included in its figures. Tracing slows every allocation down and each
+tracked request takes two snapshots: enable it on a canary worker only.
+
+Configuration (environment variables):
+    MEMORY_TRACKING_ENABLED: Track uploads. Default false
+    MEMORY_TRACKING_FRAMES (int): Frames traced per allocation. Default 1
+    MEMORY_TRACKING_TOP (int): Allocation sites per report. Default 10
+    MEMORY_TRACKING_HISTORY (int): Reports kept for `GET /memory`.
+        Default 50
+"""
+# Standard Imports
+import os
+import gc
+import logging
+import threading
+import tracemalloc
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+# Third-Party Imports
+from dotenv import load_dotenv
+from flask import Flask, has_request_context, request, jsonify
+
+# Project-Specific Imports
+from src.utils.app_logger import request_id
+from src.utils.profiling import authorized
+
+
+# Load environmental variables
+load_dotenv()
+
+MEMORY_TRACKING_ENABLED = os.getenv('MEMORY_TRACKING_ENABLED', 'false')\
+    .lower() in ('1', 'true', 'yes')
+MEMORY_TRACKING_FRAMES = int(os.getenv('MEMORY_TRACKING_FRAMES', 1))
+MEMORY_TRACKING_TOP = int(os.getenv('MEMORY_TRACKING_TOP', 10))
+MEMORY_TRACKING_HISTORY = int(os.getenv('MEMORY_TRACKING_HISTORY', 50))
+
+# Allocations of tracemalloc and of the import system are not the request's
+IGNORED_SITES = [tracemalloc.Filter(False, tracemalloc.__file__),
+                 tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                 tracemalloc.Filter(False, '<unknown>')]
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.memory_tracking')
+
+# Measurement of the request tracked by the current thread, if any
+_current = contextvars.ContextVar('memory_measurement', default=None)
+
+
+def rss_bytes() -> Optional[int]:
+    """Resident memory of the process, None if unknown (not Linux)."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def top_sites(stats: list, limit: int) -> list:
+    return [{"site": f"{stat.traceback[0].filename}:"
+                     f"{stat.traceback[0].lineno}",
+             "size_bytes": stat.size_diff, "count": stat.count_diff}
+            for stat in stats[:limit] if stat.size_diff > 0]
+
+
+class Measurement():
+    """Traced memory of a tracked request, and of its phases."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = tracemalloc.get_traced_memory()[0]
+        self.peak = self.start
+        self.phases = {}
+
+
+class MemoryTracker():
+    """
+    Reports the peak and retained allocations of tracked requests.
+
+    Example Usage:
+        @memory_tracker.track('upload')
+        def add_receipt_to_group(group_id: int):
+            ...
+
+        with memory_tracker.track('parse'):
+            receipt = SainsburysReceipt(pdf_file)
+    """
+
+    def __init__(self, enabled: bool = MEMORY_TRACKING_ENABLED,
+                 frames: int = MEMORY_TRACKING_FRAMES,
+                 top: int = MEMORY_TRACKING_TOP,
+                 history: int = MEMORY_TRACKING_HISTORY):
+        self.enabled = enabled
+        self.frames = frames
+        self.top = top
+        self.reports = deque(maxlen=history)
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._skipped_lock = threading.Lock()
+
+    @contextmanager
+    def track(self, name: str):
+        """
+        Track a request, or a phase of the tracked request of the current
+        thread.
+        """
+        measurement = _current.get()
+        if measurement is not None:
+            with self._phase(measurement, name):
+                yield
+            return
+        if not self.enabled:
+            yield
+            return
+
+        # Another request is being tracked
+        if not self._lock.acquire(blocking=False):
+            with self._skipped_lock:
+                self.skipped += 1
+            yield
+            return
+        try:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+            gc.collect()
+            before = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+            measurement = Measurement(name)
+            token = _current.set(measurement)
+            try:
+                yield
+            finally:
+                _current.reset(token)
+                measurement.peak = max(measurement.peak,
+                                       tracemalloc.get_traced_memory()[1])
+                self._report(measurement, before)
+        finally:
+            self._lock.release()
+
+    @contextmanager
+    def _phase(self, measurement: Measurement, name: str):
+        # Resetting the peak loses the request's peak so far: keep it
+        measurement.peak = max(measurement.peak,
+                               tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        try:
+            yield
+        finally:
+            peak = tracemalloc.get_traced_memory()[1]
+            measurement.peak = max(measurement.peak, peak)
+            measurement.phases[name] = {"peak_bytes": peak - start}
+
+    def _report(self, measurement: Measurement,
+                before: tracemalloc.Snapshot):
+        gc.collect()
+        after = tracemalloc.take_snapshot()
+        stats = after.filter_traces(IGNORED_SITES).compare_to(
+            before.filter_traces(IGNORED_SITES), 'lineno')
+
+        report = {
+            "time": datetime.now(timezone.utc).isoformat(
+                timespec='milliseconds'),
+            "name": measurement.name,
+            "request_id": request_id.get(),
+            "endpoint": request.endpoint if has_request_context() else None,
+            "peak_bytes": measurement.peak - measurement.start,
+            "retained_bytes": sum(stat.size_diff for stat in stats),
+            "retained_blocks": sum(stat.count_diff for stat in stats),
+            "phases": measurement.phases,
+            "top_sites": top_sites(stats, self.top),
+            "rss_bytes": rss_bytes(),
+        }
+        self.reports.append(report)
+        logger.info("Memory of %s: peak %.1f KiB, retained %.1f KiB",
+                    measurement.name, report["peak_bytes"] / 1024,
+                    report["retained_bytes"] / 1024,
+                    extra={"fields": {"memory": report}})
+
+
+def init_memory_tracking(app: Flask):
+    """Register the route listing the memory reports of tracked requests."""
+
+    @app.route('/memory', methods=['GET'])
+    def memory_report():
+        """
+        Latest reports of tracked requests, newest first, with the traced
+        and resident memory of the process. `?sites=N` adds the N sites
+        holding the most traced memory now.
+        """
+        if not authorized() or not memory_tracker.enabled:
+            return jsonify({"error": "Not Found"}), 404
+
+        tracing = tracemalloc.is_tracing()
+        traced, peak = tracemalloc.get_traced_memory()
+        response = {
+            "tracing": tracing,
+            "traced_bytes": traced,
+            "peak_traced_bytes": peak,
+            "rss_bytes": rss_bytes(),
+            "skipped": memory_tracker.skipped,
+            "reports": list(reversed(memory_tracker.reports)),
+        }
+
+        sites = request.args.get('sites', 0, type=int)
+        if sites and tracing:
+            snapshot = tracemalloc.take_snapshot().filter_traces(IGNORED_SITES)
+            response["top_sites"] = [
+                {"site": f"{stat.traceback[0].filename}:"
+                         f"{stat.traceback[0].lineno}",
+                 "size_bytes": stat.size, "count": stat.count}
+                for stat in snapshot.statistics('lineno')[:sites]]
+        return jsonify(response), 200
+
+
+# Shared by every route in the process
+memory_tracker = MemoryTracker()
@@ -0,0 +1,117 @@
+"""
+Prometheus metrics, exposed at `GET /metrics` in the Prometheus text format.
+
+Every request is recorded against its endpoint (e.g.
+`receipts.update_user_item_associations`, or `none` for unmatched paths):
+    http_request_duration_seconds   Histogram by method and endpoint
+    http_requests_in_progress       Gauge by method and endpoint
+    http_responses_total            Counter by method, endpoint and status
+along with application counters:
+    receipts_parsed_total, receipt_parse_failures_total
+    db_session_retries_total        Retries of `SessionLocal` blocks
+
+Each gunicorn worker keeps its own metrics, so a scrape reaching one worker
+would only see its share. With PROMETHEUS_MULTIPROC_DIR set (done by
+`gunicorn.conf.py`), workers write their metrics to memory-mapped files in
+that directory, which `/metrics` aggregates across all workers.
+
+Configuration (environment variables):
+    METRICS_ENABLED: Record requests and serve `/metrics`. Default true
+    PROMETHEUS_MULTIPROC_DIR: Directory shared by the worker processes.
+        Must be set before the app is imported. Default unset (single process)
+"""
+# Standard Imports
+import os
+import time
+import logging
+
+# Third-Party Imports
+from dotenv import load_dotenv
+from flask import Flask, Response, request, g
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, \
+                              REGISTRY, CONTENT_TYPE_LATEST, generate_latest, \
+                              multiprocess
+
+
+# Load environmental variables
+load_dotenv()
+
+PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+# Endpoint label of requests not matching any route
+UNMATCHED = 'none'
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.metrics')
+
+# Created once per process, however many apps are created
+request_duration = Histogram(
+    'http_request_duration_seconds', "Time to serve a request",
+    ['method', 'endpoint'])
+requests_in_progress = Gauge(
+    'http_requests_in_progress', "Requests being served",
+    ['method', 'endpoint'], multiprocess_mode='livesum')
+responses = Counter(
+    'http_responses', "Responses sent",
+    ['method', 'endpoint', 'status'])
+receipts_parsed = Counter(
+    'receipts_parsed', "Receipt PDFs parsed successfully")
+receipt_parse_failures = Counter(
+    'receipt_parse_failures', "Receipt PDFs that failed to parse")
+db_session_retries = Counter(
+    'db_session_retries', "Retries of database session blocks")
+
+
+def observe_request(method: str, endpoint: str, status: int,
+                    duration: float):
+    """Record a served request. Also used by the ASGI entry point."""
+    request_duration.labels(method, endpoint).observe(duration)
+    responses.labels(method, endpoint, str(status)).inc()
+
+
+def collect() -> bytes:
+    """Metrics of this process, or of every worker in multiprocess mode."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def init_metrics(app: Flask):
+    """
+    Record every request of the app and serve `/metrics`. Should be called
+    before other hooks are registered, so that the recorded durations include
+    them.
+    """
+    app.config.setdefault('METRICS_ENABLED', os.getenv(
+        'METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes'))
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_endpoint = request.endpoint or UNMATCHED
+        g.metrics_start = time.perf_counter()
+        requests_in_progress.labels(request.method, g.metrics_endpoint).inc()
+
+    # after_request hooks run in reverse order of registration, so this one
+    # runs last, after e.g. compression
+    @app.after_request
+    def record_request_metrics(response):
+        if 'metrics_start' in g:
+            observe_request(request.method, g.metrics_endpoint,
+                            response.status_code,
+                            time.perf_counter() - g.metrics_start)
+        return response
+
+    # Unlike after_request, also runs when a request fails with an exception
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        if 'metrics_start' in g:
+            requests_in_progress.labels(request.method,
+                                        g.metrics_endpoint).dec()
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(collect(), content_type=CONTENT_TYPE_LATEST)
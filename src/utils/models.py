@@ -3,12 +3,12 @@ Define the database metadata.
 """
 # Standard Imports
 from __future__ import annotations
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Tuple, Optional
 
 # Third Party Imports
 from sqlalchemy import Table, ForeignKey, Column, Integer, Float, DECIMAL, \
-                       VARCHAR, DateTime
+                       VARCHAR, Date, DateTime, LargeBinary
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -32,7 +32,10 @@ UserItems = Table(
     Column('user_id', Integer, ForeignKey('users.user_id', ondelete='CASCADE'), primary_key=True),
     Column('item_id', Integer, ForeignKey('items.item_id', ondelete='CASCADE'), primary_key=True),
     # Units can refer to quantity or weight, depending on the item
-    Column('unit', Integer, nullable=True)
+    Column('unit', Integer, nullable=True),
+    # Incremented on every update of `unit`, for optimistic concurrency
+    # control: an update is conditional on the version the client last read
+    Column('version', Integer, nullable=False, default=1, server_default='1')
 )
 
 class UserSpending(Base):
@@ -40,11 +43,96 @@ class UserSpending(Base):
     user_id: Mapped[int] = mapped_column(ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True)
     receipt_id: Mapped[int] = mapped_column(ForeignKey("receipts.receipt_id", ondelete="CASCADE"), primary_key=True)
     cost: Mapped[float] = mapped_column(Float, nullable=True)
+    # Incremented by the ORM on every update, which raises `StaleDataError`
+    # if the row was updated since it was loaded
+    version: Mapped[int] = mapped_column(Integer, nullable=False, server_default='1')
+
+    __mapper_args__ = {"version_id_col": version}
 
     # Relationships to User and Receipt
     user: Mapped["User"] = relationship("User", back_populates="spending")
     receipt: Mapped["Receipt"] = relationship("Receipt", back_populates="spending")
 
+class SpendingRollup(Base):
+    """
+    Total cost of a user in a group over a week or a month, maintained
+    incrementally with every write of `UserSpending` (see
+    `spending_rollups.py`).
+
+    Args:
+        user_id (int): User who spent
+        group_id (int): Group of the receipts
+        period (VARCHAR(5)): 'week' or 'month'
+        bucket_start (Date): First day of the period, a Monday for weeks
+        cost (float): Total cost of the user's receipts in the period
+        receipts (int): Number of receipts with a cost for the user
+    """
+    __tablename__ = "spending_rollups"
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True)
+    group_id: Mapped[int] = mapped_column(ForeignKey("groups.group_id", ondelete="CASCADE"), primary_key=True)
+    period: Mapped[str] = mapped_column(VARCHAR(5), primary_key=True)
+    bucket_start: Mapped[date] = mapped_column(Date, primary_key=True)
+    cost: Mapped[float] = mapped_column(Float, default=0)
+    receipts: Mapped[int] = mapped_column(Integer, default=0)
+
+class ResourceVersion(Base):
+    """
+    Monotonically increasing version of a group or receipt, bumped on every
+    write. Used as the ETag of read endpoints.
+
+    Args:
+        resource (VARCHAR(20)): Type of the resource, e.g. 'group', 'receipt'
+        resource_id (int): ID of the resource
+        version (int): Current version of the resource
+    """
+    __tablename__ = "resource_versions"
+    resource: Mapped[str] = mapped_column(VARCHAR(20), primary_key=True)
+    resource_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    version: Mapped[int] = mapped_column(Integer, default=1)
+
+class RevokedToken(Base):
+    """
+    JWT revoked before its expiry, e.g. on logout.
+
+    Args:
+        jti (VARCHAR(36)): Unique identifier of the token
+        revoked_at (DateTime): Time of revocation (UTC)
+        expires_at (DateTime): Time the token would have expired (UTC). The
+            entry can be removed afterwards
+    """
+    __tablename__ = "revoked_tokens"
+    jti: Mapped[str] = mapped_column(VARCHAR(36), primary_key=True)
+    revoked_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+
+class IdempotencyKey(Base):
+    """
+    Response to a request sent with an `Idempotency-Key` header, replayed
+    when the request is retried.
+
+    Args:
+        key (VARCHAR(64)): Hash of the user ID, route and header value
+        fingerprint (VARCHAR(64)): Hash of the request body, which retries
+            must match
+        status (int): Status code of the response, NULL while the request is
+            in progress
+        content_type (VARCHAR(100)): Content type of the response
+        body (LargeBinary): Body of the response
+        created_at (DateTime): Time of the first request (UTC). The entry is
+            removed once it expires
+        claimed_at (DateTime): Time the request in progress claimed the key
+            (UTC). A retry takes over a claim older than
+            IDEMPOTENCY_CLAIM_TIMEOUT, e.g. of a worker that was killed
+    """
+    __tablename__ = "idempotency_keys"
+    key: Mapped[str] = mapped_column(VARCHAR(64), primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(VARCHAR(64))
+    status: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    content_type: Mapped[Optional[str]] = mapped_column(VARCHAR(100), nullable=True)
+    body: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+    claimed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
 # Data Tables -----------------------------------------------------------------
 class Group(Base):
     """
@@ -0,0 +1,248 @@
+"""
+On-demand request profiling, to find where slow requests that are hard to
+reproduce locally (e.g. receipt uploads) spend their time: pypdf, pandas,
+bcrypt or SQL.
+
+A request is profiled with cProfile when it carries an `X-Profile` header
+equal to PROFILE_TOKEN, or when sampled at PROFILE_SAMPLE_RATE. Work a
+request hands to a thread pool (receipt parsing, password hashing) is
+profiled on the pool thread with `profiled` and merged into the request's
+profile. Each profile is written to PROFILE_DIR as `<id>.prof` (pstats
+format, e.g. for `snakeviz`) next to `<id>.json` with the route and timing,
+and its ID is returned in the `X-Profile-Id` response header. Only the newest
+PROFILE_MAX_FILES profiles are kept.
+
+Profiles are listed by `GET /profiles` and fetched by
+`GET /profiles/<id>` (add `?format=text` for the top functions by cumulative
+time), both requiring the `X-Profile` header.
+
+Configuration (environment variables):
+    PROFILE_TOKEN: Value of the `X-Profile` header. Default unset, which
+        disables profiling on demand and the profile routes
+    PROFILE_SAMPLE_RATE (float): Share of requests profiled. Default 0
+    PROFILE_DIR: Directory of the profiles. Default `profiles`
+    PROFILE_MAX_FILES (int): Profiles kept. Default 100
+"""
+# Standard Imports
+import io
+import os
+import re
+import hmac
+import json
+import time
+import pstats
+import random
+import cProfile
+import logging
+import threading
+import contextvars
+from datetime import datetime, timezone
+from functools import wraps
+from pathlib import Path
+from typing import Callable
+
+# Third-Party Imports
+from dotenv import load_dotenv
+from flask import Flask, current_app, request, jsonify, send_file, g
+
+
+# Load environmental variables
+load_dotenv()
+
+HEADER = 'X-Profile'
+ID_HEADER = 'X-Profile-Id'
+
+# Profile IDs, so that fetching one cannot escape the profile directory
+PROFILE_ID = re.compile(r'[\w.-]+')
+
+# Monitoring routes authorized by the same token, which are not profiled
+UNPROFILED_ENDPOINTS = ('list_profiles', 'get_profile', 'memory_report')
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.profiling')
+
+
+class RequestProfile():
+    """
+    cProfile profiler of a request's thread, plus those of work it ran on
+    other threads.
+    """
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self._lock = threading.Lock()
+        self._others = []
+
+    def add(self, profiler: cProfile.Profile):
+        with self._lock:
+            self._others.append(profiler)
+
+    def stats(self) -> pstats.Stats:
+        stats = pstats.Stats(self.profiler)
+        with self._lock:
+            for profiler in self._others:
+                stats.add(profiler)
+        return stats
+
+
+# Profile of the request being served by the current thread, if any
+_active = contextvars.ContextVar('active_profile', default=None)
+
+
+def profiled(fn: Callable) -> Callable:
+    """
+    Wrap a function about to be submitted to a thread pool, so that its time
+    is included in the profile of the current request (if it is profiled).
+
+    Example Usage:
+        self._pool.submit(profiled(SainsburysReceipt), pdf_file)
+    """
+    profile = _active.get()
+    if profile is None:
+        return fn
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+            profile.add(profiler)
+
+    return wrapper
+
+
+def authorized() -> bool:
+    """Whether the request carries the `X-Profile` token."""
+    token = current_app.config['PROFILE_TOKEN']
+    header = request.headers.get(HEADER)
+    return bool(token and header) and hmac.compare_digest(header, token)
+
+
+def _profile_dir() -> Path:
+    return Path(current_app.config['PROFILE_DIR'])
+
+
+def save_profile(profile: RequestProfile, metadata: dict) -> str:
+    """Write a profile and its metadata. Returns the profile's ID."""
+    directory = _profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+
+    started = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+    profile_id = f"{started}-{metadata['endpoint']}-{os.getpid()}"
+    profile.stats().dump_stats(directory / f"{profile_id}.prof")
+    (directory / f"{profile_id}.json").write_text(
+        json.dumps({"id": profile_id, **metadata}))
+
+    # IDs start with the time, so sort by age
+    expired = sorted(directory.glob('*.json'))[
+        :-current_app.config['PROFILE_MAX_FILES']]
+    for path in expired:
+        path.unlink(missing_ok=True)
+        path.with_suffix('.prof').unlink(missing_ok=True)
+
+    return profile_id
+
+
+def init_profiling(app: Flask):
+    """
+    Register the profiling hooks and the routes listing and fetching
+    profiles.
+    """
+    app.config.setdefault('PROFILE_TOKEN', os.getenv('PROFILE_TOKEN'))
+    app.config.setdefault('PROFILE_SAMPLE_RATE',
+                          float(os.getenv('PROFILE_SAMPLE_RATE', 0)))
+    app.config.setdefault('PROFILE_DIR', os.getenv('PROFILE_DIR', 'profiles'))
+    app.config.setdefault('PROFILE_MAX_FILES',
+                          int(os.getenv('PROFILE_MAX_FILES', 100)))
+
+    @app.before_request
+    def start_profile():
+        if request.endpoint in UNPROFILED_ENDPOINTS:
+            return
+        if authorized():
+            trigger = 'header'
+        elif random.random() < app.config['PROFILE_SAMPLE_RATE']:
+            trigger = 'sample'
+        else:
+            return
+
+        profile = RequestProfile()
+        g.profile = (profile, trigger, _active.set(profile),
+                     time.perf_counter())
+        profile.profiler.enable()
+
+    @app.after_request
+    def finish_profile(response):
+        if 'profile' not in g:
+            return response
+        profile, trigger, token, start = g.pop('profile')
+        profile.profiler.disable()
+        _active.reset(token)
+
+        try:
+            profile_id = save_profile(profile, {
+                "method": request.method,
+                "path": request.path,
+                "endpoint": request.endpoint or 'none',
+                "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+                "trigger": trigger,
+            })
+            response.headers[ID_HEADER] = profile_id
+        except Exception as e:
+            logger.error("Failed to save profile of %s - %s", request.path, e)
+        return response
+
+    # The request failed with an exception, so after_request did not run
+    @app.teardown_request
+    def discard_profile(exc):
+        if 'profile' in g:
+            profile, _, token, _ = g.pop('profile')
+            profile.profiler.disable()
+            _active.reset(token)
+
+    @app.route('/profiles', methods=['GET'])
+    def list_profiles():
+        """Metadata of the stored profiles, newest first."""
+        if not authorized():
+            return jsonify({"error": "Not Found"}), 404
+
+        profiles = []
+        for path in sorted(_profile_dir().glob('*.json'), reverse=True):
+            try:
+                profiles.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+
+        endpoint = request.args.get('endpoint')
+        if endpoint:
+            profiles = [p for p in profiles if p["endpoint"] == endpoint]
+        return jsonify(profiles), 200
+
+    @app.route('/profiles/<profile_id>', methods=['GET'])
+    def get_profile(profile_id: str):
+        """
+        A stored profile, in pstats format, or with `?format=text` as the
+        top `limit` (default 40) functions by cumulative time.
+        """
+        if not authorized():
+            return jsonify({"error": "Not Found"}), 404
+
+        path = _profile_dir() / f"{profile_id}.prof"
+        if not PROFILE_ID.fullmatch(profile_id) or not path.is_file():
+            return jsonify({"error": "Not Found",
+                            "message": "No profile with this ID"}), 404
+
+        if request.args.get('format') == 'text':
+            output = io.StringIO()
+            pstats.Stats(str(path), stream=output)\
+                .sort_stats('cumulative')\
+                .print_stats(request.args.get('limit', 40, type=int))
+            return output.getvalue(), 200, {"Content-Type": "text/plain"}
+
+        return send_file(path.resolve(), mimetype='application/octet-stream',
+                         as_attachment=True,
+                         download_name=f"{profile_id}.prof")
@@ -0,0 +1,180 @@
+"""
+In-memory token-bucket rate limiting for login and registration.
+
+Buckets are keyed by client IP and by username and spread over independently
+locked shards, so checking a request is O(1) and requests for different keys
+rarely contend. A rejected request is answered with `429 Too Many Requests`
+before any database query or bcrypt work is done.
+
+Limits are read from app.config on every request, as "<requests>/<seconds>",
+e.g. "5/60" allows bursts of 5 requests refilled at 5 per minute. An empty
+value disables the rule. Defaults come from environment variables:
+    RATE_LIMIT_ENABLED: Default true
+    RATE_LIMIT_LOGIN_USER: Per username logins. Default "5/60"
+    RATE_LIMIT_LOGIN_IP: Per client IP logins. Default "30/60"
+    RATE_LIMIT_REGISTER_USER: Per username registrations. Default "3/600"
+    RATE_LIMIT_REGISTER_IP: Per client IP registrations. Default "20/3600"
+    RATE_LIMIT_TRUSTED_PROXIES: Number of reverse proxies appending to
+        X-Forwarded-For in front of the app. Default 0
+"""
+# Standard Imports
+import os
+import math
+import time
+import logging
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Hashable, Optional, Tuple
+
+# Third-Party Imports
+from flask import Flask, current_app, request, jsonify
+
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.rate_limit')
+
+DEFAULT_LIMITS = {
+    'RATE_LIMIT_LOGIN_USER': '5/60',
+    'RATE_LIMIT_LOGIN_IP': '30/60',
+    'RATE_LIMIT_REGISTER_USER': '3/600',
+    'RATE_LIMIT_REGISTER_IP': '20/3600',
+}
+
+
+def parse_limit(limit: Optional[str]) -> Optional[Tuple[float, float]]:
+    """Parse "<requests>/<seconds>" into (capacity, seconds)."""
+    if not limit:
+        return None
+    capacity, period = limit.split('/')
+    return float(capacity), float(period)
+
+
+class TokenBucketLimiter():
+    """
+    Sharded token buckets. Each shard holds at most `max_keys_per_shard`
+    buckets, evicting the least recently used.
+
+    Example Usage:
+        limiter = TokenBucketLimiter()
+        retry_after = limiter.consume(("login", "ip", "1.2.3.4"), 5, 60)
+        if retry_after:
+            ...  # Rejected, retry in `retry_after` seconds
+    """
+
+    def __init__(self, shards: int = 64, max_keys_per_shard: int = 4096,
+                 timer: Callable[[], float] = time.monotonic):
+        self._max_keys = max_keys_per_shard
+        self._timer = timer
+        self._shards = [(threading.Lock(), OrderedDict())
+                        for _ in range(shards)]
+
+    def consume(self, key: Hashable, capacity: float, period: float) -> float:
+        """
+        Take a token from the bucket of `key`.
+
+        Returns
+        -------
+        float
+            0 if the request is allowed, otherwise the seconds until a token
+            is available
+        """
+        rate = capacity / period
+        lock, buckets = self._shards[hash(key) % len(self._shards)]
+
+        with lock:
+            now = self._timer()
+            tokens, updated = buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+
+            if tokens >= 1:
+                buckets[key] = (tokens - 1, now)
+                retry_after = 0.0
+            else:
+                buckets[key] = (tokens, now)
+                retry_after = (1 - tokens) / rate
+
+            buckets.move_to_end(key)
+            if len(buckets) > self._max_keys:
+                buckets.popitem(last=False)
+
+        return retry_after
+
+    def reset(self):
+        for lock, buckets in self._shards:
+            with lock:
+                buckets.clear()
+
+
+def init_rate_limits(app: Flask):
+    """
+    Set the default limits and attach the limiter to the app.
+    """
+    app.config.setdefault('RATE_LIMIT_ENABLED', os.getenv(
+        'RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes'))
+    app.config.setdefault('RATE_LIMIT_TRUSTED_PROXIES',
+                          int(os.getenv('RATE_LIMIT_TRUSTED_PROXIES', 0)))
+    for name, default in DEFAULT_LIMITS.items():
+        app.config.setdefault(name, os.getenv(name, default))
+
+    app.extensions['rate_limiter'] = TokenBucketLimiter()
+
+
+def client_ip() -> str:
+    """Client IP, skipping the configured number of trusted proxies."""
+    proxies = current_app.config['RATE_LIMIT_TRUSTED_PROXIES']
+    route = request.access_route
+    if proxies and len(route) >= proxies:
+        return route[-proxies]
+    return request.remote_addr or ''
+
+
+def rate_limited(scope: str):
+    """
+    Decorator rejecting requests over the RATE_LIMIT_<scope>_IP and
+    RATE_LIMIT_<scope>_USER limits. The username is read from the JSON body.
+
+    Example Usage:
+        @users_blueprint.route('/login', methods=['POST'])
+        @rate_limited('LOGIN')
+        def login():
+            ...
+    """
+    def decorator(view):
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            config = current_app.config
+            if not config['RATE_LIMIT_ENABLED']:
+                return view(*args, **kwargs)
+
+            limiter = current_app.extensions['rate_limiter']
+            data = request.get_json(silent=True)
+            username = data.get('username') if isinstance(data, dict) else None
+
+            keys = [('IP', client_ip())]
+            if isinstance(username, str):
+                keys.append(('USER', username.lower()))
+
+            for kind, value in keys:
+                limit = parse_limit(config[f'RATE_LIMIT_{scope}_{kind}'])
+                if not limit:
+                    continue
+
+                retry_after = limiter.consume((scope, kind, value), *limit)
+                if retry_after:
+                    logger.warning("Rate limit %s_%s exceeded.", scope, kind)
+                    response = jsonify({
+                        "error": "Too Many Requests",
+                        "message": "Too many attempts, please try again later"
+                    })
+                    response.status_code = 429
+                    response.headers['Retry-After'] = \
+                        str(math.ceil(retry_after))
+                    return response
+
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
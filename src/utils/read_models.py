@@ -0,0 +1,202 @@
+"""
+Read models for the GET routes.
+
+Each function selects only the columns a route serializes and returns
+lightweight `Row` tuples instead of ORM entities, so reads neither load unused
+columns (e.g. `hashed_password`) nor pay for identity-map bookkeeping.
+
+Example Usage:
+    with SessionLocal() as session:
+        groups = to_dicts(list_groups(session))
+
+Dependencies: models.py
+"""
+# Standard Imports
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+# Third-Party Imports
+from sqlalchemy import select, desc, exists, tuple_
+from sqlalchemy.engine import Row
+
+# Project-Specific Imports
+from src.utils.models import Group, User, Receipt, Item, UserGroups, \
+                             UserItems, UserSpending, SpendingRollup
+
+
+def to_dicts(rows: Iterable[Row]) -> List[Dict]:
+    """Convert result rows into JSON-serializable dictionaries."""
+    return [row._asdict() for row in rows]
+
+
+# Groups ----------------------------------------------------------------------
+def list_groups(session) -> List[Row]:
+    return session.execute(
+        select(Group.group_id, Group.group_name, Group.description)).all()
+
+
+def get_group(session, group_id: int) -> Optional[Row]:
+    return session.execute(
+        select(Group.group_id, Group.group_name, Group.description)
+        .where(Group.group_id == group_id)).one_or_none()
+
+
+def list_group_members(session, group_id: int) -> List[Row]:
+    return session.execute(
+        select(User.user_id, User.username)
+        .join(UserGroups, User.user_id == UserGroups.c.user_id)
+        .where(UserGroups.c.group_id == group_id)).all()
+
+
+def find_groups(session, group_names: Iterable[str]) -> List[Row]:
+    """Groups with any of the given names."""
+    return session.execute(
+        select(Group.group_id, Group.group_name)
+        .where(Group.group_name.in_(group_names))).all()
+
+
+def list_group_rollups(session, group_id: int, period: str,
+                       since: Optional[date] = None,
+                       until: Optional[date] = None) -> List[Row]:
+    """
+    Weekly or monthly spending of each user in a group, with buckets starting
+    between `since` and `until`.
+    """
+    return session.execute(
+        select(SpendingRollup.user_id, User.username,
+               SpendingRollup.bucket_start, SpendingRollup.cost,
+               SpendingRollup.receipts)
+        .join(User, User.user_id == SpendingRollup.user_id)
+        .where(SpendingRollup.group_id == group_id,
+               SpendingRollup.period == period,
+               *_bucket_range(since, until))).all()
+
+
+def list_group_receipts(session, group_id: int) -> List[Row]:
+    """Receipts of a group, most recent first."""
+    return session.execute(
+        select(Receipt.receipt_id, Receipt.order_id, Receipt.slot_time,
+               Receipt.total_price, Receipt.payment_card)
+        .where(Receipt.group_id == group_id)
+        .order_by(desc(Receipt.slot_time))).all()
+
+
+# Receipts --------------------------------------------------------------------
+def receipt_exists(session, receipt_id: int) -> bool:
+    return session.scalar(
+        select(exists().where(Receipt.receipt_id == receipt_id)))
+
+
+def list_receipt_items(session, receipt_id: int) -> List[Row]:
+    return session.execute(
+        select(Item.item_id, Item.item_name, Item.quantity, Item.weight,
+               Item.price)
+        .where(Item.receipt_id == receipt_id)).all()
+
+
+def list_user_items(session, receipt_id: int) -> List[Row]:
+    """User-item unit associations of all items in a receipt."""
+    return session.execute(
+        select(UserItems.c.user_id, UserItems.c.item_id, UserItems.c.unit,
+               UserItems.c.version)
+        .join(Item, Item.item_id == UserItems.c.item_id)
+        .where(Item.receipt_id == receipt_id)).all()
+
+
+def receipt_groups(session, receipt_ids: Iterable[int]) -> Dict[int, int]:
+    """Group ID of each of the given receipts."""
+    return dict(session.execute(
+        select(Receipt.receipt_id, Receipt.group_id)
+        .where(Receipt.receipt_id.in_(list(receipt_ids)))).tuples().all())
+
+
+def item_receipts(session, item_ids: Iterable[int]) -> Dict[int, int]:
+    """Receipt ID of each of the given items."""
+    return dict(session.execute(
+        select(Item.item_id, Item.receipt_id)
+        .where(Item.item_id.in_(list(item_ids)))).tuples().all())
+
+
+def find_user_items(session, keys: Iterable[tuple]) -> List[Row]:
+    """User-item associations with any of the given (user ID, item ID)."""
+    return session.execute(
+        select(UserItems.c.user_id, UserItems.c.item_id, UserItems.c.unit,
+               UserItems.c.version)
+        .where(tuple_(UserItems.c.user_id, UserItems.c.item_id)
+               .in_(list(keys)))).all()
+
+
+# Users -----------------------------------------------------------------------
+def get_user(session, user_id: int) -> Optional[Row]:
+    return session.execute(
+        select(User.user_id, User.username, User.email)
+        .where(User.user_id == user_id)).one_or_none()
+
+
+def find_users(session, user_ids: Iterable[int],
+               usernames: Iterable[str]) -> List[Row]:
+    """Users with any of the given IDs or usernames."""
+    return session.execute(
+        select(User.user_id, User.username)
+        .where(User.user_id.in_(user_ids) |
+               User.username.in_(usernames))).all()
+
+
+def list_user_groups(session, user_id: int) -> List[Row]:
+    return session.execute(
+        select(Group.group_id, Group.group_name, Group.description)
+        .join(UserGroups, Group.group_id == UserGroups.c.group_id)
+        .where(UserGroups.c.user_id == user_id)).all()
+
+
+def list_user_costs(session, user_id: int) -> List[Row]:
+    """Cost spent by a user on each receipt, with the receipt's slot time."""
+    return session.execute(
+        select(Receipt.receipt_id, Receipt.slot_time, UserSpending.cost,
+               UserSpending.version)
+        .join(UserSpending, UserSpending.receipt_id == Receipt.receipt_id)
+        .where(UserSpending.user_id == user_id)).all()
+
+
+def list_user_rollups(session, user_id: int, period: str,
+                      since: Optional[date] = None,
+                      until: Optional[date] = None) -> List[Row]:
+    """
+    Weekly or monthly spending of a user in each group, with buckets starting
+    between `since` and `until`.
+    """
+    return session.execute(
+        select(SpendingRollup.group_id, Group.group_name,
+               SpendingRollup.bucket_start, SpendingRollup.cost,
+               SpendingRollup.receipts)
+        .join(Group, Group.group_id == SpendingRollup.group_id)
+        .where(SpendingRollup.user_id == user_id,
+               SpendingRollup.period == period,
+               *_bucket_range(since, until))).all()
+
+
+def _bucket_range(since: Optional[date], until: Optional[date]) -> list:
+    """Conditions on the start of rollup buckets."""
+    conditions = []
+    if since is not None:
+        conditions.append(SpendingRollup.bucket_start >= since)
+    if until is not None:
+        conditions.append(SpendingRollup.bucket_start <= until)
+    return conditions
+
+
+def find_user_costs(session, keys: Iterable[tuple]) -> List[Row]:
+    """User costs with any of the given (user ID, receipt ID)."""
+    return session.execute(
+        select(UserSpending.user_id, UserSpending.receipt_id,
+               UserSpending.cost, UserSpending.version)
+        .where(tuple_(UserSpending.user_id, UserSpending.receipt_id)
+               .in_(list(keys)))).all()
+
+
+def find_receipt_costs(session, receipt_ids: Iterable[int]) -> List[Row]:
+    """User costs of any of the given receipts."""
+    return session.execute(
+        select(UserSpending.user_id, UserSpending.receipt_id,
+               UserSpending.cost, UserSpending.version)
+        .where(UserSpending.receipt_id.in_(list(receipt_ids)))).all()
@@ -0,0 +1,193 @@
+"""
+Lease-based receipt locks, so group members do not overwrite each other's
+unit assignments while editing the same receipt.
+
+A lease is `Receipt.locked_by` (0 when unlocked) and `Receipt.lock_timestamp`
+(when it was last acquired or renewed). Each operation is a single
+conditional UPDATE whose row count says whether it won, e.g. acquiring is
+    UPDATE receipts SET locked_by = :me, lock_timestamp = :now
+    WHERE receipt_id = :id
+      AND (locked_by IN (0, :me) OR lock_timestamp < :now - lease)
+so no row locks or transactions are held between requests, and a lease
+abandoned by a closed browser tab simply expires. A background sweeper resets
+expired leases so that reads show them as unlocked.
+
+Configuration (environment variables):
+    RECEIPT_LEASE_SECONDS (float): Lease duration. Default 120
+    RECEIPT_LEASE_SWEEP_INTERVAL (float): Seconds between sweeps of expired
+        leases, 0 to disable the sweeper. Default 60
+
+Dependencies: models.py, database.py
+"""
+# Standard Imports
+import os
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional
+
+# Third-Party Imports
+from dotenv import load_dotenv
+from flask import Flask
+from sqlalchemy import select, update, or_
+from sqlalchemy.engine import Row
+
+# Project-Specific Imports
+from src.utils.database import SessionLocal
+from src.utils.models import Receipt
+
+
+# Load environmental variables
+load_dotenv()
+
+RECEIPT_LEASE_SECONDS = float(os.getenv('RECEIPT_LEASE_SECONDS', 120))
+RECEIPT_LEASE_SWEEP_INTERVAL = float(os.getenv('RECEIPT_LEASE_SWEEP_INTERVAL',
+                                               60))
+
+# `locked_by` of a receipt nobody is editing
+UNLOCKED = 0
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.receipt_locks')
+
+
+def _now() -> datetime:
+    """Naive UTC time, as stored in the database."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _expired_before(now: datetime) -> datetime:
+    """Leases last renewed before this time have expired."""
+    return now - timedelta(seconds=RECEIPT_LEASE_SECONDS)
+
+
+def lease_expiry(lock_timestamp: datetime) -> datetime:
+    return lock_timestamp + timedelta(seconds=RECEIPT_LEASE_SECONDS)
+
+
+# Lease operations ------------------------------------------------------------
+def acquire_lease(session, receipt_id: int, user_id: int) -> Optional[datetime]:
+    """
+    Take the lease of a receipt if it is free, expired or already held by the
+    user (which renews it).
+
+    Returns
+    -------
+    datetime | None
+        Expiry of the lease, None if another user holds it (or the receipt
+        does not exist)
+    """
+    now = _now()
+    result = session.execute(
+        update(Receipt)
+        .where(Receipt.receipt_id == receipt_id,
+               or_(Receipt.locked_by.in_((UNLOCKED, user_id)),
+                   Receipt.lock_timestamp < _expired_before(now)))
+        .values(locked_by=user_id, lock_timestamp=now)
+        .execution_options(synchronize_session=False))
+    return lease_expiry(now) if result.rowcount == 1 else None
+
+
+def renew_lease(session, receipt_id: int, user_id: int) -> Optional[datetime]:
+    """
+    Extend a lease held by the user. Returns the new expiry, None if the user
+    does not hold the lease (e.g. it expired and was taken by someone else).
+    """
+    now = _now()
+    result = session.execute(
+        update(Receipt)
+        .where(Receipt.receipt_id == receipt_id,
+               Receipt.locked_by == user_id)
+        .values(lock_timestamp=now)
+        .execution_options(synchronize_session=False))
+    return lease_expiry(now) if result.rowcount == 1 else None
+
+
+def release_lease(session, receipt_id: int, user_id: int) -> bool:
+    """Give up a lease held by the user. Returns whether it was held."""
+    result = session.execute(
+        update(Receipt)
+        .where(Receipt.receipt_id == receipt_id,
+               Receipt.locked_by == user_id)
+        .values(locked_by=UNLOCKED)
+        .execution_options(synchronize_session=False))
+    return result.rowcount == 1
+
+
+def active_leases(session, receipt_ids: Iterable[int],
+                  excluding_user: Optional[int] = None) -> List[Row]:
+    """
+    Unexpired leases on the given receipts as (receipt_id, locked_by,
+    lock_timestamp) rows, optionally ignoring those of a user.
+    """
+    stmt = select(Receipt.receipt_id, Receipt.locked_by,
+                  Receipt.lock_timestamp)\
+        .where(Receipt.receipt_id.in_(receipt_ids),
+               Receipt.locked_by != UNLOCKED,
+               Receipt.lock_timestamp >= _expired_before(_now()))
+    if excluding_user is not None:
+        stmt = stmt.where(Receipt.locked_by != excluding_user)
+    return session.execute(stmt).all()
+
+
+def sweep_expired_leases(session) -> int:
+    """Reset expired leases. Returns the number of leases reset."""
+    result = session.execute(
+        update(Receipt)
+        .where(Receipt.locked_by != UNLOCKED,
+               Receipt.lock_timestamp < _expired_before(_now()))
+        .values(locked_by=UNLOCKED)
+        .execution_options(synchronize_session=False))
+    return result.rowcount
+
+
+# Sweeper ---------------------------------------------------------------------
+class LeaseSweeper():
+    """
+    Daemon thread resetting expired leases every `interval` seconds.
+
+    Threads do not survive a fork, so the sweeper is started lazily by the
+    first request of each (gunicorn worker) process rather than at import.
+    """
+
+    def __init__(self, interval: float = RECEIPT_LEASE_SWEEP_INTERVAL):
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pid = None
+
+    def ensure_started(self):
+        if self._pid == os.getpid() or self._interval <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='lease-sweeper',
+                             daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            try:
+                with SessionLocal() as session:
+                    swept = sweep_expired_leases(session)
+                if swept:
+                    logger.info("Released %s expired receipt leases.", swept)
+            except Exception as e:
+                logger.error("Failed to sweep receipt leases - %s", e)
+
+
+# Shared by every route in the process
+lease_sweeper = LeaseSweeper()
+
+
+def init_receipt_locks(app: Flask):
+    """
+    Start the lease sweeper with the first request of each process.
+    """
+    @app.before_request
+    def start_lease_sweeper():
+        lease_sweeper.ensure_started()
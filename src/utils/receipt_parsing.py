@@ -0,0 +1,70 @@
+"""
+Shared receipt parsing pool.
+
+Parsing a receipt PDF is CPU-bound and can take hundreds of milliseconds, so
+uploads are parsed on a bounded pool shared by the whole process. This caps
+how many parses (and their memory) run at once, so a burst of uploads does not
+have every thread contending for the GIL.
+
+Parsing stays synchronous: the request thread waits for its parse, queued
+behind the others, so uploads still hold a request thread (a WSGI thread
+behind the ASGI entry point too) until they are parsed.
+
+Configuration (environment variables):
+    RECEIPT_PARSE_WORKERS (int): Threads in the parsing pool. Default 2
+"""
+# Standard Imports
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO
+
+# Third-Party Imports
+from dotenv import load_dotenv
+
+# Project-Specific Imports
+from src.receipt_reader.SainsburysReceipt import SainsburysReceipt
+from src.utils.memory_tracking import memory_tracker
+from src.utils.metrics import receipts_parsed, receipt_parse_failures
+from src.utils.profiling import profiled
+from src.utils.server_timing import span
+
+
+# Load environmental variables
+load_dotenv()
+
+RECEIPT_PARSE_WORKERS = int(os.getenv('RECEIPT_PARSE_WORKERS', 2))
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.receipt_parsing')
+
+
+class ReceiptParser():
+    """
+    Parse receipts on a bounded thread pool.
+
+    Example Usage:
+        receipt = receipt_parser.parse(file)
+    """
+
+    def __init__(self, workers: int = RECEIPT_PARSE_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=workers,
+                                        thread_name_prefix='receipt-parser')
+
+    def parse(self, pdf_file: BinaryIO) -> SainsburysReceipt:
+        try:
+            with span('parse'), memory_tracker.track('parse'):
+                receipt = self._pool.submit(profiled(SainsburysReceipt),
+                                            pdf_file).result()
+        except Exception:
+            receipt_parse_failures.inc()
+            raise
+        receipts_parsed.inc()
+        return receipt
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+# Shared by every route in the process
+receipt_parser = ReceiptParser()
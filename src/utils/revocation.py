@@ -0,0 +1,207 @@
+"""
+Revocation of JWTs, checked by JWTManager's blocklist loader on every
+`@jwt_required` route.
+
+Revoked token IDs (`jti`) are stored in the `revoked_tokens` table and added to
+an in-memory Bloom filter. Most tokens were never revoked, and the filter
+answers those without touching the database; only filter hits are confirmed
+with a primary key lookup. Each worker process refreshes its filter with the
+tokens revoked elsewhere at most every REVOCATION_SYNC_INTERVAL seconds.
+Entries are purged once the token would have expired anyway.
+
+Configuration (environment variables):
+    REVOCATION_BLOOM_CAPACITY (int): Expected revoked, unexpired tokens.
+        Default 100000
+    REVOCATION_BLOOM_ERROR_RATE (float): False positive rate. Default 0.001
+    REVOCATION_SYNC_INTERVAL (float): Seconds between filter refreshes.
+        Default 5
+    REVOCATION_PURGE_INTERVAL (float): Seconds between purges of expired
+        entries. Default 3600
+"""
+# Standard Imports
+import os
+import math
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+# Third-Party Imports
+from dotenv import load_dotenv
+from flask_jwt_extended import JWTManager
+from sqlalchemy import select, delete, exists
+
+# Project-Specific Imports
+from src.utils.database import SessionLocal
+from src.utils.models import RevokedToken
+
+
+# Load environmental variables
+load_dotenv()
+
+REVOCATION_BLOOM_CAPACITY = int(os.getenv('REVOCATION_BLOOM_CAPACITY', 100000))
+REVOCATION_BLOOM_ERROR_RATE = float(os.getenv('REVOCATION_BLOOM_ERROR_RATE',
+                                              0.001))
+REVOCATION_SYNC_INTERVAL = float(os.getenv('REVOCATION_SYNC_INTERVAL', 5))
+REVOCATION_PURGE_INTERVAL = float(os.getenv('REVOCATION_PURGE_INTERVAL', 3600))
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.revocation')
+
+
+def utcnow() -> datetime:
+    """Naive UTC time, as stored in the database."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class BloomFilter():
+    """
+    Fixed-size Bloom filter of strings. May return false positives, never
+    false negatives.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self._size = max(8, int(-capacity * math.log(error_rate)
+                                / math.log(2) ** 2))
+        self._hashes = max(1, round(self._size / capacity * math.log(2)))
+        self._bits = bytearray((self._size + 7) // 8)
+
+    def _positions(self, value: str):
+        # Derive all positions from two 64-bit hashes (Kirsch-Mitzenmacher)
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self._size for i in range(self._hashes))
+
+    def add(self, value: str):
+        for position in self._positions(value):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(value))
+
+
+class RevocationStore():
+    """
+    Revoked JWT IDs backed by the `revoked_tokens` table with a Bloom filter
+    fast path.
+
+    Example Usage:
+        revocation_store.revoke(jwt["jti"], jwt["exp"])
+        revocation_store.is_revoked(jwt["jti"])
+    """
+
+    def __init__(self, capacity: int = REVOCATION_BLOOM_CAPACITY,
+                 error_rate: float = REVOCATION_BLOOM_ERROR_RATE,
+                 sync_interval: float = REVOCATION_SYNC_INTERVAL,
+                 purge_interval: float = REVOCATION_PURGE_INTERVAL):
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._sync_interval = sync_interval
+        self._purge_interval = purge_interval
+        self._lock = threading.Lock()
+
+        self._filter = BloomFilter(capacity, error_rate)
+        self._synced_at = None      # Lower bound of `revoked_at` to sync
+        self._next_sync = 0.0       # Monotonic time of the next sync
+        self._next_purge = time.monotonic() + purge_interval
+
+    def revoke(self, jti: str, expires: int):
+        """
+        Revoke a token given its ID and expiry (UNIX timestamp, the `exp`
+        claim).
+        """
+        expires_at = datetime.fromtimestamp(expires, timezone.utc)\
+            .replace(tzinfo=None)
+        with SessionLocal() as session:
+            already_revoked = session.scalar(
+                select(exists().where(RevokedToken.jti == jti)))
+            if not already_revoked:
+                session.add(RevokedToken(jti=jti, revoked_at=utcnow(),
+                                         expires_at=expires_at))
+        self._filter.add(jti)
+
+    def is_revoked(self, jti: str) -> bool:
+        self._maybe_sync()
+
+        # Fast path: definitely not revoked
+        if jti not in self._filter:
+            return False
+
+        # Possible false positive - confirm with the database
+        with SessionLocal() as session:
+            return session.scalar(select(exists().where(
+                RevokedToken.jti == jti,
+                RevokedToken.expires_at > utcnow())))
+
+    def may_be_revoked(self, jti: str) -> bool:
+        """
+        Check without any I/O. False means the token is certainly not revoked;
+        True means `is_revoked` has to query the database.
+        """
+        return time.monotonic() >= self._next_sync or jti in self._filter
+
+    def _maybe_sync(self):
+        """Add tokens revoked by other workers since the last sync."""
+        if time.monotonic() < self._next_sync:
+            return
+        if not self._lock.acquire(blocking=False):
+            return  # Another thread is already syncing
+
+        try:
+            if time.monotonic() >= self._next_purge:
+                self._purge()
+
+            now = utcnow()
+            stmt = select(RevokedToken.jti)\
+                .where(RevokedToken.expires_at > now)
+            if self._synced_at:
+                # Overlap with the previous sync to tolerate commit delays
+                stmt = stmt.where(RevokedToken.revoked_at >= self._synced_at)
+            with SessionLocal() as session:
+                self._add_all(session.scalars(stmt))
+
+            self._synced_at = now - timedelta(seconds=self._sync_interval)
+            self._next_sync = time.monotonic() + self._sync_interval
+        finally:
+            self._lock.release()
+
+    def _purge(self):
+        """
+        Delete entries of expired tokens and rebuild the filter, since a
+        Bloom filter cannot forget values.
+        """
+        with SessionLocal() as session:
+            session.execute(delete(RevokedToken)
+                            .where(RevokedToken.expires_at <= utcnow()))
+            jtis = session.scalars(select(RevokedToken.jti)).all()
+
+        # Filled before it replaces the current filter, which must keep
+        # answering `is_revoked` meanwhile
+        bloom = BloomFilter(self._capacity, self._error_rate)
+        self._add_all(jtis, bloom)
+        self._filter = bloom
+        self._next_purge = time.monotonic() + self._purge_interval
+        logger.info("Purged expired revoked tokens, %s remain.", len(jtis))
+
+    def _add_all(self, jtis: Iterable[str],
+                 bloom: Optional[BloomFilter] = None):
+        bloom = self._filter if bloom is None else bloom
+        for jti in jtis:
+            bloom.add(jti)
+
+
+# Shared by every route in the process
+revocation_store = RevocationStore()
+
+
+def init_revocation(jwt: JWTManager):
+    """
+    Register the revocation store as the JWT blocklist.
+    """
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload) -> bool:
+        return revocation_store.is_revoked(jwt_payload["jti"])
@@ -0,0 +1,149 @@
+"""
+Server-Timing breakdown of requests, shown by browser devtools next to each
+request without any tracing backend.
+
+The main stages of a request are timed as spans:
+    jwt     Decoding the access token
+    db      `SessionLocal` blocks, including their commit
+    parse   Parsing an uploaded receipt, including the wait for the pool
+    bcrypt  Hashing or verifying a password, including the wait for the pool
+    json    Serializing the JSON response
+    total   From the first to the last hook of the app
+Spans of the same name are summed, e.g.
+    Server-Timing: jwt;dur=0.41, db;dur=3.12;desc="3 spans", json;dur=0.2,
+                   total;dur=6.03
+The timings are also logged, with the request's ID, as the `timings` field of
+a JSON log line per request.
+
+Configuration (environment variables):
+    SERVER_TIMING_ENABLED: Time requests and add the header. Default true
+"""
+# Standard Imports
+import os
+import time
+import logging
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+# Third-Party Imports
+from dotenv import load_dotenv
+from flask import Flask, request, g
+from flask.json.provider import DefaultJSONProvider
+from flask_jwt_extended import JWTManager
+
+
+# Load environmental variables
+load_dotenv()
+
+HEADER = 'Server-Timing'
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.server_timing')
+
+# Spans of the request being served by the current thread, if timed
+_spans = contextvars.ContextVar('server_timing_spans', default=None)
+
+
+@contextmanager
+def span(name: str):
+    """
+    Time a stage of the current request, if it is timed.
+
+    Example Usage:
+        with span('parse'):
+            receipt = SainsburysReceipt(pdf_file)
+    """
+    spans = _spans.get()
+    if spans is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans.append((name, time.perf_counter() - start))
+
+
+def summarize(spans: list) -> dict:
+    """Total duration (ms) and count of the spans of each name."""
+    timings = defaultdict(lambda: {"dur": 0.0, "count": 0})
+    for name, duration in spans:
+        timings[name]["dur"] += duration * 1000
+        timings[name]["count"] += 1
+    return {name: {"dur": round(timing["dur"], 3), "count": timing["count"]}
+            for name, timing in timings.items()}
+
+
+def header_value(timings: dict) -> str:
+    metrics = []
+    for name, timing in timings.items():
+        metric = f"{name};dur={timing['dur']:.2f}"
+        if timing["count"] > 1:
+            metric += f';desc="{timing["count"]} spans"'
+        metrics.append(metric)
+    return ', '.join(metrics)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, timing the serialization of responses."""
+
+    def response(self, *args, **kwargs):
+        with span('json'):
+            return super().response(*args, **kwargs)
+
+
+def init_server_timing(app: Flask, jwt: JWTManager):
+    """
+    Time the stages of every request of the app, returned in the
+    `Server-Timing` header and logged with the request's ID.
+    """
+    app.config.setdefault('SERVER_TIMING_ENABLED', os.getenv(
+        'SERVER_TIMING_ENABLED', 'true').lower() in ('1', 'true', 'yes'))
+    if not app.config['SERVER_TIMING_ENABLED']:
+        return
+
+    app.json = TimedJSONProvider(app)
+
+    # flask_jwt_extended decodes every token through this method of the
+    # manager, whether from @jwt_required or decode_token
+    decode = jwt._decode_jwt_from_config
+
+    @wraps(decode)
+    def timed_decode(*args, **kwargs):
+        with span('jwt'):
+            return decode(*args, **kwargs)
+
+    jwt._decode_jwt_from_config = timed_decode
+
+    @app.before_request
+    def start_server_timing():
+        g.server_timing = (_spans.set([]), time.perf_counter())
+
+    @app.after_request
+    def add_server_timing(response):
+        if 'server_timing' not in g:
+            return response
+        token, start = g.pop('server_timing')
+        spans = _spans.get()
+        _spans.reset(token)
+        spans.append(('total', time.perf_counter() - start))
+
+        timings = summarize(spans)
+        response.headers[HEADER] = header_value(timings)
+        logger.info("%s %s %s in %.2f ms", request.method, request.path,
+                    response.status_code, timings['total']['dur'],
+                    extra={"fields": {
+                        "method": request.method,
+                        "path": request.path,
+                        "endpoint": request.endpoint,
+                        "status": response.status_code,
+                        "timings": timings}})
+        return response
+
+    # The request failed with an exception, so after_request did not run
+    @app.teardown_request
+    def discard_server_timing(exc):
+        if 'server_timing' in g:
+            _spans.reset(g.pop('server_timing')[0])
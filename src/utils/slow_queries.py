@@ -0,0 +1,213 @@
+"""
+Slow-query log, to catch queries that regress as tables grow.
+
+Every statement run by an engine passed to `slow_query_log.install` is timed
+through SQLAlchemy's cursor events. Statements taking SLOW_QUERY_MS or longer
+are written as JSON lines to their own size-rotated file (SLOW_QUERY_LOG),
+through a queue like the app's log, with:
+    statement       SQL normalized for grouping (literals and IN lists folded)
+    fingerprint     Hash of the normalized SQL
+    params          Types of the bind parameters, never their values
+    duration_ms, rowcount
+    endpoint, method, path, request_id  of the originating request, if any
+    plan            `EXPLAIN` (`EXPLAIN QUERY PLAN` on SQLite) of the
+                    statement, with SLOW_QUERY_EXPLAIN
+A warning is also logged to the app's log.
+
+Summarize the log into the top offenders with `slow_query_report.py`.
+
+Configuration (environment variables):
+    SLOW_QUERY_MS (float): Duration from which a query is logged. Default 200
+    SLOW_QUERY_LOG: File of the slow-query log, empty to disable it.
+        Default `slow_queries.log`
+    SLOW_QUERY_MAX_BYTES (int): Size at which the file is rotated.
+        Default 10485760
+    SLOW_QUERY_BACKUP_COUNT (int): Rotated files kept. Default 5
+    SLOW_QUERY_EXPLAIN: Capture the plan of slow queries. Default false
+"""
+# Standard Imports
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+from typing import Optional
+
+# Third-Party Imports
+from dotenv import load_dotenv
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Project-Specific Imports
+from src.utils.app_logger import queued, request_id
+
+
+# Load environmental variables
+load_dotenv()
+
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 200))
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', 'slow_queries.log')
+SLOW_QUERY_MAX_BYTES = int(os.getenv('SLOW_QUERY_MAX_BYTES',
+                                     10 * 1024 * 1024))
+SLOW_QUERY_BACKUP_COUNT = int(os.getenv('SLOW_QUERY_BACKUP_COUNT', 5))
+SLOW_QUERY_EXPLAIN = os.getenv('SLOW_QUERY_EXPLAIN', 'false').lower() \
+    in ('1', 'true', 'yes')
+
+# Statements whose plan can be explained without running them
+EXPLAINABLE = ('select', 'update', 'delete', 'with')
+
+# Bind parameter lists longer than this are summarized by their types
+MAX_PARAM_SHAPE = 20
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.slow_queries')
+
+# Normalization of statements, applied in order
+NORMALIZE = [
+    (re.compile(r'\s+'), ' '),
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'%\(\w+\)s|%s|\$\d+'), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\(\?(?:, \?)+\)'), '(?, ...)'),
+    (re.compile(r'\(\?, \.\.\.\)(?:, \(\?, \.\.\.\))+'), '(?, ...), ...'),
+]
+
+
+def normalize(statement: str) -> str:
+    """
+    Statement with its literals and placeholders replaced by `?` and its
+    lists of placeholders (e.g. of `IN`) folded, so that executions differing
+    only by their values are grouped together.
+    """
+    statement = statement.strip()
+    for pattern, replacement in NORMALIZE:
+        statement = pattern.sub(replacement, statement)
+    return statement
+
+
+def _shape(parameters):
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__
+                for name, value in parameters.items()}
+    types = [type(value).__name__ for value in parameters or ()]
+    if len(types) > MAX_PARAM_SHAPE:
+        return {"count": len(types), "types": sorted(set(types))}
+    return types
+
+
+def param_shape(parameters, executemany: bool):
+    """Types of the bind parameters of a statement, without their values."""
+    if executemany:
+        return {"rows": len(parameters),
+                "row": _shape(parameters[0]) if parameters else None}
+    return _shape(parameters)
+
+
+class SlowQueryLog():
+    """
+    Times the statements of engines and logs the slow ones.
+
+    Example Usage:
+        slow_query_log.install(engine)
+    """
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS,
+                 explain: bool = SLOW_QUERY_EXPLAIN,
+                 path: str = SLOW_QUERY_LOG):
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self.path = path
+
+        # Kept out of the app's log
+        self._log = logging.getLogger('slow_queries')
+        self._log.propagate = False
+        self._log.setLevel(logging.INFO)
+        if path:
+            file_handler = RotatingFileHandler(
+                path, maxBytes=SLOW_QUERY_MAX_BYTES,
+                backupCount=SLOW_QUERY_BACKUP_COUNT, delay=True)
+            self._log.addHandler(queued([file_handler]))
+
+    def install(self, engine: Engine):
+        """Time the statements of an engine (the sync engine if async)."""
+        if not self.path:
+            return
+        engine = getattr(engine, 'sync_engine', engine)
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+        event.listen(engine, 'handle_error', self._failed)
+
+    def _before(self, conn, cursor, statement, parameters, context,
+                executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _failed(self, context):
+        starts = context.connection.info.get('query_start') \
+            if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+    def _after(self, conn, cursor, statement, parameters, context,
+               executemany):
+        start = conn.info['query_start'].pop()
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms < self.threshold_ms:
+            return
+
+        normalized = normalize(statement)
+        entry = {
+            "time": datetime.now(timezone.utc).isoformat(
+                timespec='milliseconds'),
+            "duration_ms": round(duration_ms, 3),
+            "fingerprint": hashlib.sha1(normalized.encode()).hexdigest()[:12],
+            "statement": normalized,
+            "params": param_shape(parameters, executemany),
+            "rowcount": cursor.rowcount,
+            "request_id": request_id.get(),
+            "endpoint": None,
+            "method": None,
+            "path": None,
+        }
+        if has_request_context():
+            entry.update(endpoint=request.endpoint, method=request.method,
+                         path=request.path)
+        if self.explain and not executemany:
+            entry["plan"] = self._explain(conn, statement, parameters)
+
+        self._log.info(json.dumps(entry, default=str))
+        logger.warning("Slow query (%.1f ms) on %s: %s", duration_ms,
+                       entry["endpoint"], entry["fingerprint"])
+
+    def _explain(self, conn, statement: str,
+                 parameters) -> Optional[list]:
+        """
+        Plan of a statement, run on the statement's connection without
+        emitting cursor events. None if it cannot be explained.
+        """
+        if not statement.lstrip().lower().startswith(EXPLAINABLE):
+            return None
+        sqlite = conn.dialect.name == 'sqlite'
+        prefix = 'EXPLAIN QUERY PLAN ' if sqlite else 'EXPLAIN '
+
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            rows = cursor.fetchall()
+        except Exception as e:
+            logger.debug("Failed to explain slow query - %s", e)
+            return None
+        finally:
+            cursor.close()
+
+        # SQLite rows are (id, parent, notused, detail)
+        if sqlite:
+            return [row[-1] for row in rows]
+        return [' | '.join(map(str, row)) for row in rows]
+
+
+# Shared by the sync and async engines
+slow_query_log = SlowQueryLog()
@@ -0,0 +1,101 @@
+"""
+Summarizes slow-query logs (see `slow_queries.py`) into the top offenders:
+queries grouped by fingerprint and ranked by their total, count, mean, p95 or
+max duration, with the endpoints running them and their latest plan.
+
+Usage (importing `src` requires `MODE` and its database URL, e.g. in `.env`):
+    python -m src.utils.slow_query_report slow_queries.log* --top 10 --by total
+"""
+# Standard Imports
+import sys
+import json
+import glob
+import argparse
+from collections import defaultdict
+from statistics import quantiles
+from typing import Optional
+
+# Project-Specific Imports
+from src.utils.slow_queries import SLOW_QUERY_LOG
+
+
+def read_entries(paths: list) -> list:
+    """Entries of slow-query logs, skipping lines that are not entries."""
+    entries = []
+    for path in paths:
+        with open(path) as log_file:
+            for line in log_file:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    return entries
+
+
+def summarize(entries: list, by: str = 'total') -> list:
+    """
+    Entries grouped by fingerprint, sorted by total, count, mean, p95 or max
+    duration, with the endpoints running them and the latest plan.
+    """
+    groups = defaultdict(list)
+    for entry in entries:
+        groups[entry["fingerprint"]].append(entry)
+
+    summary = []
+    for fingerprint, group in groups.items():
+        durations = sorted(entry["duration_ms"] for entry in group)
+        plans = [entry["plan"] for entry in group if entry.get("plan")]
+        endpoints = defaultdict(int)
+        for entry in group:
+            endpoints[entry["endpoint"]] += 1
+        summary.append({
+            "fingerprint": fingerprint,
+            "statement": group[-1]["statement"],
+            "count": len(durations),
+            "total": sum(durations),
+            "mean": sum(durations) / len(durations),
+            "p95": quantiles(durations, n=20, method='inclusive')[18]
+                   if len(durations) > 1 else durations[0],
+            "max": durations[-1],
+            "endpoints": dict(endpoints),
+            "plan": plans[-1] if plans else None,
+        })
+    return sorted(summary, key=lambda query: query[by], reverse=True)
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(
+        description="Summarize slow-query logs into the top offenders.")
+    parser.add_argument('logs', nargs='*',
+                        help="Log files. Default SLOW_QUERY_LOG and its "
+                             "rotated files")
+    parser.add_argument('--top', type=int, default=10,
+                        help="Queries listed")
+    parser.add_argument('--by', default='total',
+                        choices=['total', 'count', 'mean', 'p95', 'max'],
+                        help="Duration ranking the queries")
+    args = parser.parse_args(argv)
+
+    paths = args.logs or sorted(glob.glob(f"{glob.escape(SLOW_QUERY_LOG)}*"))
+    entries = read_entries(paths)
+    if not entries:
+        print("No slow queries logged.", file=sys.stderr)
+        return
+
+    print(f"{len(entries)} slow queries in {len(paths)} file(s), "
+          f"top {args.top} by {args.by} (ms)")
+    for rank, query in enumerate(summarize(entries, args.by)[:args.top], 1):
+        endpoints = ', '.join(f"{endpoint} ({count})" for endpoint, count
+                              in sorted(query["endpoints"].items(),
+                                        key=lambda item: -item[1]))
+        print(f"\n#{rank} [{query['fingerprint']}] count {query['count']}, "
+              f"total {query['total']:.1f}, mean {query['mean']:.1f}, "
+              f"p95 {query['p95']:.1f}, max {query['max']:.1f}")
+        print(f"  {query['statement']}")
+        print(f"  endpoints: {endpoints}")
+        for line in query["plan"] or []:
+            print(f"  plan: {line}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,341 @@
+"""
+Weekly and monthly spending of every user in every group (`SpendingRollup`),
+so that spending over time is served without reading every `UserSpending`
+row of a user and aggregating them on the client.
+
+Rollups are maintained incrementally: every write of `UserSpending` (updated
+costs, settled receipts, deleted receipts) passes the costs it replaces and
+their new values to `record_spending`, in the same session, which adds the
+difference to the week and the month of each receipt. `rebuild_rollups`
+recomputes them from `UserSpending`. It runs on startup when there are costs
+but no rollups (`backfill_rollups`), e.g. once the table is created on an
+existing database. Costs inserted directly into the database afterwards need
+a rebuild by hand (of the database configured by `MODE`):
+    python -m src.utils.spending_rollups
+
+Summaries are resampled with NumPy onto every week or month of a range, empty
+ones included, so that they can be charted as they are.
+
+Dependencies: models.py
+"""
+# Standard Imports
+import logging
+import argparse
+from collections import defaultdict
+from datetime import date
+from typing import Iterable, List, Optional, Tuple
+
+# Third-Party Imports
+import numpy as np
+from sqlalchemy import select, insert, delete, exists, tuple_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+
+# Project-Specific Imports
+from src.utils.models import Receipt, UserSpending, SpendingRollup
+
+
+PERIODS = ('week', 'month')
+
+# Longest summary served, about ten years of weeks
+MAX_BUCKETS = 520
+
+# Rows inserted per statement when rebuilding
+REBUILD_BATCH_SIZE = 10000
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.spending_rollups')
+
+
+def bucket_starts(days: np.ndarray, period: str) -> np.ndarray:
+    """
+    First day of the week (Monday) or month of each day, as `datetime64[D]`.
+    """
+    days = days.astype('datetime64[D]')
+    if period == 'week':
+        # Day 0 of the epoch, 1970-01-01, was a Thursday
+        weekdays = (days.astype(np.int64) + 3) % 7
+        return days - weekdays.astype('timedelta64[D]')
+    return days.astype('datetime64[M]').astype('datetime64[D]')
+
+
+def bucket_start(day: date, period: str) -> date:
+    """First day of the week or month of a single day."""
+    return bucket_starts(np.array([day], dtype='datetime64[D]'),
+                         period)[0].item()
+
+
+def record_spending(session,
+                    changes: Iterable[Tuple[int, int, Optional[float],
+                                            Optional[float]]]):
+    """
+    Apply changes of user costs to the rollups of their receipts' weeks and
+    months. Must be called inside the session writing the costs so that both
+    are committed (or rolled back) together.
+
+    Inputs
+    ------
+    changes
+        (user ID, receipt ID, previous cost, new cost), with None for a cost
+        that did not exist before, or no longer exists
+
+    Example Usage:
+        record_spending(session, [(1, 2, 9.10, 12.78), (2, 2, None, 4.50)])
+    """
+    changes = [change for change in changes if change[2] != change[3]]
+    if not changes:
+        return
+
+    receipts = {receipt_id: (group_id, slot_time)
+                for receipt_id, group_id, slot_time in session.execute(
+        select(Receipt.receipt_id, Receipt.group_id, Receipt.slot_time)
+        .where(Receipt.receipt_id.in_(
+            {change[1] for change in changes})))}
+    changes = [change for change in changes
+               if receipts.get(change[1], (None, None))[1] is not None]
+    if not changes:
+        return
+
+    days = np.array([receipts[receipt_id][1]
+                     for _, receipt_id, _, _ in changes],
+                    dtype='datetime64[D]')
+    # Cost and number of receipts added to each rollup
+    deltas = defaultdict(lambda: [0.0, 0])
+    for period in PERIODS:
+        starts = bucket_starts(days, period).tolist()
+        for (user_id, receipt_id, old, new), start in zip(changes, starts):
+            delta = deltas[(user_id, receipts[receipt_id][0], period, start)]
+            delta[0] += (new or 0) - (old or 0)
+            delta[1] += (new is not None) - (old is not None)
+
+    _apply(session, deltas)
+
+
+def _apply(session, deltas: dict):
+    """
+    Add cost and receipt deltas to rollups, creating missing ones. Upserts
+    increment rather than overwrite, so concurrent writes of the same rollup
+    (even its first ones) add up.
+    """
+    table = SpendingRollup.__table__
+    rows = [{"user_id": key[0], "group_id": key[1], "period": key[2],
+             "bucket_start": key[3], "cost": cost, "receipts": receipts}
+            for key, (cost, receipts) in deltas.items()]
+
+    dialect = session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        upsert = (sqlite_insert if dialect == 'sqlite'
+                  else postgresql_insert)(table)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[column.name for column in table.primary_key],
+            set_={"cost": table.c.cost + upsert.excluded.cost,
+                  "receipts": table.c.receipts + upsert.excluded.receipts})
+    elif dialect in ('mysql', 'mariadb'):
+        upsert = mysql_insert(table)
+        upsert = upsert.on_duplicate_key_update(
+            cost=table.c.cost + upsert.inserted.cost,
+            receipts=table.c.receipts + upsert.inserted.receipts)
+    else:
+        raise NotImplementedError(f"No upsert for the {dialect} dialect")
+    session.execute(upsert, rows)
+
+    # Drop the rollups whose receipts were all deleted
+    if any(receipts < 0 for _, receipts in deltas.values()):
+        session.execute(
+            delete(table)
+            .where(tuple_(table.c.user_id, table.c.group_id, table.c.period,
+                          table.c.bucket_start).in_(list(deltas)),
+                   table.c.receipts <= 0))
+
+
+def rebuild_rollups(session) -> int:
+    """
+    Recompute every rollup from `UserSpending`. Accepts a session or a
+    connection, and returns the number of rollups written.
+    """
+    rows = session.execute(
+        select(UserSpending.user_id, Receipt.group_id, Receipt.slot_time,
+               UserSpending.cost)
+        .join(Receipt, Receipt.receipt_id == UserSpending.receipt_id)
+        .where(UserSpending.cost.isnot(None),
+               Receipt.slot_time.isnot(None))).all()
+    session.execute(delete(SpendingRollup))
+    if not rows:
+        return 0
+
+    user_ids, group_ids, slot_times, costs = zip(*rows)
+    days = np.array(slot_times, dtype='datetime64[D]')
+    costs = np.asarray(costs, dtype=float)
+
+    written = 0
+    for period in PERIODS:
+        starts = bucket_starts(days, period)
+        keys, inverse = np.unique(
+            np.column_stack([np.asarray(user_ids, dtype=np.int64),
+                             np.asarray(group_ids, dtype=np.int64),
+                             starts.astype(np.int64)]),
+            axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        totals = np.bincount(inverse, weights=costs)
+        counts = np.bincount(inverse)
+
+        rollups = [{"user_id": user_id, "group_id": group_id,
+                    "period": period, "bucket_start": start, "cost": cost,
+                    "receipts": count}
+                   for (user_id, group_id), start, cost, count in zip(
+                       keys[:, :2].tolist(),
+                       keys[:, 2].astype('datetime64[D]').tolist(),
+                       totals.tolist(), counts.tolist())]
+        for offset in range(0, len(rollups), REBUILD_BATCH_SIZE):
+            session.execute(insert(SpendingRollup),
+                            rollups[offset:offset + REBUILD_BATCH_SIZE])
+        written += len(rollups)
+
+    logger.info("Rebuilt %s spending rollups from %s user costs",
+                written, len(rows))
+    return written
+
+
+def backfill_rollups(bind) -> int:
+    """
+    Rebuild the rollups if there are none but there are costs, e.g. when
+    the table has just been created on an existing database. Returns the
+    number of rollups written.
+    """
+    try:
+        with bind.begin() as connection:
+            if connection.scalar(select(exists().select_from(SpendingRollup)))\
+                    or not connection.scalar(
+                        select(exists().select_from(UserSpending))):
+                return 0
+            written = rebuild_rollups(connection)
+    # Backfilled concurrently by another worker
+    except IntegrityError:
+        return 0
+    logger.warning("Backfilled %s spending rollups", written)
+    return written
+
+
+def bucket_range(period: str, start: date, end: date) -> np.ndarray:
+    """Every week or month from the one of `start` to the one of `end`."""
+    first = bucket_start(start, period)
+    last = bucket_start(end, period)
+    if period == 'week':
+        return np.arange(np.datetime64(first, 'D'),
+                         np.datetime64(last, 'D') + 1,
+                         np.timedelta64(7, 'D'))
+    return np.arange(np.datetime64(first, 'M'),
+                     np.datetime64(last, 'M') + 1).astype('datetime64[D]')
+
+
+def summary_args(args) -> Tuple[str, Optional[date], Optional[date]]:
+    """
+    Bucket (`week` or `month`, default `month`) and optional `start` and
+    `end` days (YYYY-MM-DD) of a summary, from a request's query arguments.
+    Raises ValueError if any is invalid.
+    """
+    period = args.get('bucket', 'month')
+    if period not in PERIODS:
+        raise ValueError(f"bucket must be one of {', '.join(PERIODS)}")
+
+    days = {}
+    for arg in ('start', 'end'):
+        try:
+            days[arg] = date.fromisoformat(args[arg]) if args.get(arg) \
+                else None
+        except ValueError:
+            raise ValueError(f"{arg} must be a date (YYYY-MM-DD)")
+    if days['start'] and days['end'] and days['start'] > days['end']:
+        raise ValueError("start must not be after end")
+    return period, days['start'], days['end']
+
+
+def summarize(rows: List, period: str, by: str, name: str, series: str,
+              start: Optional[date] = None,
+              end: Optional[date] = None) -> dict:
+    """
+    Resample rollups onto every bucket from `start` to `end` (by default,
+    those of the first and last rollups), with zeros for empty buckets.
+
+    Inputs
+    ------
+    rows
+        Rollups with their `bucket_start`, `cost` and `receipts`, the ID of
+        the series they belong to (`by`, e.g. 'group_id') and its `name`
+    series
+        Key of the series in the summary, e.g. 'groups'
+    start, end
+        Days whose buckets start and end the summary
+
+    Returns
+    -------
+    dict
+        {"bucket": "week", "buckets": ["2024-06-10", ...], "costs": [...],
+         "receipts": [...], "total": 22.68,
+         <series>: [{<by>: 1, <name>: "Flat", "costs": [...],
+                     "receipts": [...], "total": 22.68}]}
+        with one cost and receipt count per bucket, in total and per series
+    """
+    if start is None or end is None:
+        if not rows:
+            buckets = np.array([], dtype='datetime64[D]')
+        else:
+            starts = [row.bucket_start for row in rows]
+            buckets = bucket_range(period, start or min(starts),
+                                   end or max(starts))
+    else:
+        buckets = bucket_range(period, start, end)
+    if len(buckets) > MAX_BUCKETS:
+        raise ValueError(f"Summaries span at most {MAX_BUCKETS} buckets, "
+                         f"this one spans {len(buckets)}")
+
+    # Series x buckets matrices, rows outside the range are left out
+    series_ids = sorted({getattr(row, by) for row in rows})
+    names = {getattr(row, by): getattr(row, name) for row in rows}
+    costs = np.zeros((len(series_ids), len(buckets)))
+    receipts = np.zeros((len(series_ids), len(buckets)), dtype=np.int64)
+    if rows and len(buckets):
+        row_starts = np.array([row.bucket_start for row in rows],
+                              dtype='datetime64[D]')
+        columns = np.searchsorted(buckets, row_starts)
+        inside = (columns < len(buckets)) & \
+            (buckets[np.minimum(columns, len(buckets) - 1)] == row_starts)
+        indices = np.searchsorted(series_ids,
+                                  [getattr(row, by) for row in rows])
+        np.add.at(costs, (indices[inside], columns[inside]),
+                  np.array([row.cost for row in rows], dtype=float)[inside])
+        np.add.at(receipts, (indices[inside], columns[inside]),
+                  np.array([row.receipts for row in rows])[inside])
+
+    costs = np.round(costs, 2)
+    return {
+        "bucket": period,
+        "buckets": [str(bucket) for bucket in buckets],
+        "costs": np.round(costs.sum(axis=0), 2).tolist(),
+        "receipts": receipts.sum(axis=0).tolist(),
+        "total": round(float(costs.sum()), 2),
+        series: [{by: series_id, name: names[series_id],
+                    "costs": costs[index].tolist(),
+                    "receipts": receipts[index].tolist(),
+                    "total": round(float(costs[index].sum()), 2)}
+                   for index, series_id in enumerate(series_ids)],
+    }
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(
+        description="Rebuild the spending rollups from the user costs.")
+    parser.parse_args(argv)
+
+    # database.py backfills the rollups on import, and so imports this module
+    from src.utils.database import SessionLocal
+
+    with SessionLocal() as session:
+        written = rebuild_rollups(session)
+    print(f"Rebuilt {written} spending rollups.")
+
+
+if __name__ == '__main__':
+    main()
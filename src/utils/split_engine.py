@@ -0,0 +1,170 @@
+"""
+Server-side computation of how much each user owes for a receipt.
+
+The cost of an item is split between the users associated with it in
+proportion to the units each user claimed (see `UserItems.unit`). Items nobody
+has claimed are not charged to anyone. The computation is done on NumPy arrays
+so that a whole group's history can be settled in a single pass.
+
+Dependencies: models.py
+"""
+# Standard Imports
+import logging
+from typing import Dict, List, Sequence
+
+# Third-Party Imports
+import numpy as np
+from sqlalchemy import select, insert, update, tuple_
+
+# Project-Specific Imports
+from src.utils.models import Receipt, Item, UserItems, UserSpending
+from src.utils.spending_rollups import record_spending
+
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.split_engine')
+
+
+def compute_shares(user_ids: np.ndarray,
+                   unit_item_ids: np.ndarray,
+                   units: np.ndarray,
+                   item_ids: np.ndarray,
+                   item_receipt_ids: np.ndarray,
+                   prices: np.ndarray) -> List[Dict]:
+    """
+    Compute the cost of every user on every receipt.
+
+    Inputs
+    ------
+    user_ids, unit_item_ids, units: np.ndarray
+        One entry per user-item association (rows of `UserItems`)
+    item_ids, item_receipt_ids, prices: np.ndarray
+        One entry per item
+
+    Returns
+    -------
+    List[Dict]
+        [{"user_id": 1, "receipt_id": 2, "cost": 12.78}, ...] for every user
+        and receipt pair with at least one association
+    """
+    if user_ids.size == 0 or item_ids.size == 0:
+        return []
+
+    # Map IDs onto contiguous matrix indices
+    users, user_idx = np.unique(user_ids, return_inverse=True)
+    receipts, receipt_idx_of_item = np.unique(item_receipt_ids,
+                                              return_inverse=True)
+    item_order = np.argsort(item_ids)
+    item_idx = item_order[np.searchsorted(item_ids, unit_item_ids,
+                                          sorter=item_order)]
+
+    # Users x items unit matrix. Duplicate associations are accumulated
+    unit_matrix = np.zeros((users.size, item_ids.size))
+    np.add.at(unit_matrix, (user_idx, item_idx), units)
+
+    # Price per unit of every item. Unclaimed items have no units in total and
+    # are left out of the split
+    total_units = unit_matrix.sum(axis=0)
+    price_per_unit = np.divide(prices, total_units,
+                               out=np.zeros_like(prices),
+                               where=total_units > 0)
+    item_shares = unit_matrix * price_per_unit
+
+    # Collapse items onto their receipts -> users x receipts cost matrix
+    cost_matrix = np.zeros((users.size, receipts.size))
+    np.add.at(cost_matrix.T, receipt_idx_of_item, item_shares.T)
+
+    # Only report pairs where the user is associated with the receipt
+    associated = np.zeros((users.size, receipts.size), dtype=bool)
+    associated[user_idx, receipt_idx_of_item[item_idx]] = True
+    rows, cols = np.nonzero(associated)
+    costs = np.round(cost_matrix[rows, cols], 2)
+
+    return [{"user_id": int(user_id), "receipt_id": int(receipt_id),
+             "cost": float(cost)}
+            for user_id, receipt_id, cost
+            in zip(users[rows], receipts[cols], costs)]
+
+
+def settle_receipts(session, receipt_ids: Sequence[int]) -> List[Dict]:
+    """
+    Load the units and prices of the given receipts, compute each user's cost
+    and write the results to `UserSpending` in bulk.
+
+    Raises `StaleDataError` if a cost was updated by another request since it
+    was read here, after which the session must be rolled back.
+
+    Example Usage:
+        with SessionLocal() as session:
+            costs = settle_receipts(session, [receipt_id])
+    """
+    receipt_ids = list(receipt_ids)
+    if not receipt_ids:
+        return []
+
+    items = session.execute(
+        select(Item.item_id, Item.receipt_id, Item.price)
+        .where(Item.receipt_id.in_(receipt_ids))).all()
+    associations = session.execute(
+        select(UserItems.c.user_id, UserItems.c.item_id, UserItems.c.unit)
+        .join(Item, Item.item_id == UserItems.c.item_id)
+        .where(Item.receipt_id.in_(receipt_ids))).all()
+
+    item_ids, item_receipt_ids, prices = _columns(items, 3)
+    user_ids, unit_item_ids, units = _columns(associations, 3)
+
+    costs = compute_shares(
+        user_ids=np.asarray(user_ids, dtype=np.int64),
+        unit_item_ids=np.asarray(unit_item_ids, dtype=np.int64),
+        units=np.asarray([unit or 0 for unit in units], dtype=float),
+        item_ids=np.asarray(item_ids, dtype=np.int64),
+        item_receipt_ids=np.asarray(item_receipt_ids, dtype=np.int64),
+        prices=np.asarray(prices, dtype=float))
+
+    if not costs:
+        return costs
+
+    # Split into updates of existing rows and inserts of new rows. Updates
+    # carry the version read here, which the ORM checks and increments
+    current = {(user_id, receipt_id): (version, cost)
+               for user_id, receipt_id, version, cost in session.execute(
+        select(UserSpending.user_id, UserSpending.receipt_id,
+               UserSpending.version, UserSpending.cost)
+        .where(tuple_(UserSpending.user_id, UserSpending.receipt_id).in_(
+            [(cost["user_id"], cost["receipt_id"]) for cost in costs])))}
+    versions = {key: version for key, (version, _) in current.items()}
+    to_update = [{**cost,
+                  "version": versions[(cost["user_id"], cost["receipt_id"])]}
+                 for cost in costs
+                 if (cost["user_id"], cost["receipt_id"]) in versions]
+    to_insert = [cost for cost in costs
+                 if (cost["user_id"], cost["receipt_id"]) not in versions]
+
+    if to_update:
+        session.execute(update(UserSpending), to_update)
+    if to_insert:
+        session.execute(insert(UserSpending), to_insert)
+    record_spending(session, [
+        (cost["user_id"], cost["receipt_id"],
+         current.get((cost["user_id"], cost["receipt_id"]), (None, None))[1],
+         cost["cost"]) for cost in costs])
+
+    logger.debug("Settled %s user costs across %s receipt(s)",
+                 len(costs), len(receipt_ids))
+    return costs
+
+
+def settle_group(session, group_id: int) -> List[Dict]:
+    """
+    Recompute the costs of every receipt in a group.
+    """
+    receipt_ids = session.scalars(
+        select(Receipt.receipt_id).where(Receipt.group_id == group_id)).all()
+    return settle_receipts(session, receipt_ids)
+
+
+def _columns(rows, width: int):
+    """Transpose a list of result rows into `width` column tuples."""
+    if not rows:
+        return [()] * width
+    return list(zip(*rows))
@@ -0,0 +1,206 @@
+"""
+Records sanitized traces of the requests served, to be replayed against
+another version of the code with `benchmarks/traffic_replay.py` so that
+performance regressions are caught on the real mix of traffic (e.g. bursts of
+`PUT /receipts/user-items` and resolve calls) rather than a synthetic one.
+
+Each request is written as a JSON line to its own size-rotated file
+(TRAFFIC_RECORD_FILE), through a queue like the app's log, with:
+    ts, request_id      Start time (UNIX epoch) and ID of the request
+    method, route, endpoint
+                        e.g. `GET`, `/groups/resolve/<string:group_name>`
+    view_args, query    Arguments of the route and of its query string
+    body                Shape of the body: `{"json": ...}`, or
+                        `{"form": ..., "files": {"file": {"size": 1234}}}`
+    headers             `Idempotency-Key` and `If-None-Match`, if sent
+    user_id             Identity of the access token, if any
+    status, duration_ms, request_bytes, response_bytes, streamed
+Numbers, booleans and nulls (IDs, units, costs) are kept as they are. Strings
+are never recorded: each is replaced by `<str:LENGTH:HMAC>`, keyed with a key
+of its own (TRAFFIC_RECORD_KEY), so that repeated values (e.g. a group name
+resolved again) can be told apart without being revealed. Credentials
+(passwords, tokens) are not even hashed: they are replaced by `<credential>`.
+Other headers, tokens and file contents are never recorded.
+
+Configuration (environment variables):
+    TRAFFIC_RECORD_FILE: File of the traces, empty to disable recording.
+        Default empty
+    TRAFFIC_RECORD_SAMPLE_RATE (float): Share of requests recorded.
+        Default 1
+    TRAFFIC_RECORD_MAX_BYTES (int): Size at which the file is rotated.
+        Default 104857600
+    TRAFFIC_RECORD_BACKUP_COUNT (int): Rotated files kept. Default 5
+    TRAFFIC_RECORD_KEY: Key hashing the recorded strings. Share it between
+        workers so they hash the same strings alike, and never reuse the
+        app's secret key. Default random per process
+"""
+# Standard Imports
+import os
+import hmac
+import json
+import time
+import random
+import hashlib
+import secrets
+import logging
+from logging.handlers import RotatingFileHandler
+
+# Third-Party Imports
+from dotenv import load_dotenv
+from flask import Flask, request, g
+from flask_jwt_extended import get_jwt_identity
+
+# Project-Specific Imports
+from src.utils.app_logger import queued, request_id
+
+
+# Load environmental variables
+load_dotenv()
+
+TRAFFIC_RECORD_FILE = os.getenv('TRAFFIC_RECORD_FILE', '')
+TRAFFIC_RECORD_SAMPLE_RATE = float(os.getenv('TRAFFIC_RECORD_SAMPLE_RATE', 1))
+TRAFFIC_RECORD_MAX_BYTES = int(os.getenv('TRAFFIC_RECORD_MAX_BYTES',
+                                         100 * 1024 * 1024))
+TRAFFIC_RECORD_BACKUP_COUNT = int(os.getenv('TRAFFIC_RECORD_BACKUP_COUNT', 5))
+TRAFFIC_RECORD_KEY = os.getenv('TRAFFIC_RECORD_KEY') \
+    or secrets.token_hex(32)
+
+# Fields whose values are dropped rather than hashed
+CREDENTIAL_FIELDS = ('password', 'refresh_token', 'access_token')
+CREDENTIAL = '<credential>'
+
+# Headers whose (hashed) value is recorded, to replay retries and
+# conditional requests
+RECORDED_HEADERS = ('Idempotency-Key', 'If-None-Match')
+
+# Monitoring routes, which are not traffic
+IGNORED_ENDPOINTS = ('metrics', 'list_profiles', 'get_profile',
+                     'memory_report')
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.traffic_recording')
+
+
+def sanitize(value, key: bytes):
+    """
+    Shape of a JSON value: strings replaced by `<str:LENGTH:HMAC>`, numbers,
+    booleans and nulls kept, and credentials dropped.
+    """
+    if isinstance(value, str):
+        digest = hmac.new(key, value.encode(), hashlib.sha256).hexdigest()
+        return f"<str:{len(value)}:{digest[:12]}>"
+    if isinstance(value, dict):
+        return {name: CREDENTIAL if name in CREDENTIAL_FIELDS
+                else sanitize(item, key) for name, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [sanitize(item, key) for item in value]
+    return value
+
+
+def body_shape(key: bytes):
+    """Shape of the current request's body, None if it has none."""
+    if request.is_json:
+        data = request.get_json(silent=True)
+        return {"json": sanitize(data, key)} if data is not None else None
+    if request.files or request.form:
+        return {
+            "form": {name: [CREDENTIAL] if name in CREDENTIAL_FIELDS
+                     else sanitize(request.form.getlist(name), key)
+                     for name in request.form},
+            "files": {name: {"size": file.seek(0, os.SEEK_END) or 0,
+                             "content_type": file.mimetype}
+                      for name, file in request.files.items()}}
+    return None
+
+
+class TrafficRecorder():
+    """
+    Writes the traces of requests to a size-rotated file of JSON lines.
+
+    Example Usage:
+        traffic_recorder.record({"method": "GET", ...})
+    """
+
+    def __init__(self, path: str = TRAFFIC_RECORD_FILE,
+                 sample_rate: float = TRAFFIC_RECORD_SAMPLE_RATE,
+                 key: str = TRAFFIC_RECORD_KEY):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.key = key.encode()
+
+        # Kept out of the app's log, and opened for the current path on the
+        # first trace
+        self._log = logging.getLogger('traffic')
+        self._log.propagate = False
+        self._log.setLevel(logging.INFO)
+        self._opened = None
+
+    def sampled(self) -> bool:
+        return bool(self.path) and random.random() < self.sample_rate
+
+    def record(self, entry: dict):
+        if self._opened != self.path:
+            # The previous file's listener writes what is left on its queue,
+            # and is stopped on exit
+            for handler in list(self._log.handlers):
+                self._log.removeHandler(handler)
+            self._log.addHandler(queued([RotatingFileHandler(
+                self.path, maxBytes=TRAFFIC_RECORD_MAX_BYTES,
+                backupCount=TRAFFIC_RECORD_BACKUP_COUNT, delay=True)]))
+            self._opened = self.path
+        self._log.info(json.dumps(entry, default=str))
+
+
+def init_traffic_recording(app: Flask):
+    """Record a sanitized trace of the app's requests, if enabled."""
+
+    @app.before_request
+    def start_trace():
+        if request.endpoint in IGNORED_ENDPOINTS \
+                or not traffic_recorder.sampled():
+            return
+        g.traffic_trace = (time.time(), time.perf_counter())
+
+    @app.after_request
+    def record_trace(response):
+        if 'traffic_trace' not in g:
+            return response
+        ts, start = g.pop('traffic_trace')
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        try:
+            key = traffic_recorder.key
+            try:
+                user_id = get_jwt_identity()
+            # No token was verified for the request
+            except RuntimeError:
+                user_id = None
+
+            traffic_recorder.record({
+                "ts": round(ts, 6),
+                "request_id": request_id.get(),
+                "method": request.method,
+                "route": request.url_rule.rule if request.url_rule else None,
+                "endpoint": request.endpoint,
+                "view_args": sanitize(request.view_args or {}, key),
+                "query": {name: sanitize(request.args.getlist(name), key)
+                          for name in request.args},
+                "body": body_shape(key),
+                "headers": {name: sanitize(request.headers[name], key)
+                            for name in RECORDED_HEADERS
+                            if name in request.headers},
+                "user_id": user_id,
+                "status": response.status_code,
+                "duration_ms": round(duration_ms, 3),
+                "request_bytes": request.content_length,
+                "response_bytes": None if response.is_streamed
+                else response.calculate_content_length(),
+                "streamed": response.is_streamed,
+            })
+        except Exception as e:
+            logger.error("Failed to record trace of %s - %s", request.path, e)
+        return response
+
+
+# Shared by every app of the process
+traffic_recorder = TrafficRecorder()
@@ -0,0 +1,176 @@
+"""
+Per-resource version counters and conditional GET support.
+
+Every write to a group or receipt bumps its version in the `resource_versions`
+table within the same transaction. Read endpoints wrapped with `etag_for` emit
+the version as a strong ETag and answer a matching `If-None-Match` with
+`304 Not Modified` after a single primary key lookup, without running the
+main queries of the route.
+
+Rows users edit concurrently (`user_items`, `user_spending`) also carry their
+own `version`, which writes may be made conditional on, answering a stale
+version with `409 Conflict` (see `version_conflict`).
+
+Dependencies: models.py, database.py
+"""
+# Standard Imports
+import logging
+from functools import wraps
+from typing import Iterable, List, Optional
+
+# Third-Party Imports
+from flask import request, make_response, jsonify
+from sqlalchemy import select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Row
+from werkzeug.datastructures import ETags
+
+# Project-Specific Imports
+from src.utils.database import SessionLocal
+from src.utils.models import ResourceVersion
+from src.utils.compression import ENCODINGS, encoded_etag
+
+
+# Module-level logging inherited from 'main'
+logger = logging.getLogger('main.versioning')
+
+# Resource types
+GROUP = 'group'
+RECEIPT = 'receipt'
+GROUP_LIST = 'group_list'  # The list of all groups, has a single ID of 0
+
+def bump_versions(session, resource: str, resource_ids: Iterable[int]):
+    """
+    Increment the version of each resource. Resources without a version yet
+    start at 1. Must be called inside the session performing the write so the
+    bump is committed (or rolled back) together with it.
+
+    A single upsert, so concurrent first bumps of a resource (e.g. one
+    created before versions were tracked) both count rather than racing to
+    insert its row.
+    """
+    resource_ids = sorted({resource_id for resource_id in resource_ids
+                           if resource_id is not None})
+    if not resource_ids:
+        return
+
+    table = ResourceVersion.__table__
+    rows = [{"resource": resource, "resource_id": resource_id, "version": 1}
+            for resource_id in resource_ids]
+
+    dialect = session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        upsert = (sqlite_insert if dialect == 'sqlite'
+                  else postgresql_insert)(table)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[column.name for column in table.primary_key],
+            set_={"version": table.c.version + 1})
+    elif dialect in ('mysql', 'mariadb'):
+        upsert = mysql_insert(table)
+        upsert = upsert.on_duplicate_key_update(version=table.c.version + 1)
+    else:
+        raise NotImplementedError(f"No upsert for the {dialect} dialect")
+    session.execute(upsert, rows)
+
+
+def bump_version(session, resource: str, resource_id: int):
+    """Increment the version of a single resource."""
+    bump_versions(session, resource, [resource_id])
+
+
+def get_version(session, resource: str, resource_id: int) -> int:
+    """Current version of a resource, 0 if it has never been written."""
+    version = session.scalar(
+        select(ResourceVersion.version)
+        .where(ResourceVersion.resource == resource,
+               ResourceVersion.resource_id == resource_id))
+    return version or 0
+
+
+def version_conflict(message: str, current: List[Row]):
+    """
+    409 Conflict response for writes made against a stale row version,
+    carrying the current values (and versions) of the conflicting rows so the
+    client can merge and retry.
+    """
+    return jsonify({"error": "Conflict", "message": message,
+                    "current": [row._asdict() for row in current]}), 409
+
+
+def make_etag(resource: str, resource_id: int, version: int) -> str:
+    return f"{resource}-{resource_id}-{version}"
+
+
+def matching_etag(etag: str,
+                  if_none_match: Optional[ETags] = None) -> Optional[str]:
+    """
+    Return the variant of the ETag held by the client, if any. Compressed
+    responses carry the ETag suffixed with their encoding. Compared weakly,
+    as `If-None-Match` requires, so that ETags weakened by a proxy still
+    match.
+
+    Inputs
+    ------
+    etag (str)
+        Current ETag of the resource
+    if_none_match (ETags)
+        Parsed If-None-Match header. Defaults to that of the Flask request
+    """
+    if if_none_match is None:
+        if_none_match = request.if_none_match
+    for candidate in (etag, *(encoded_etag(etag, encoding)
+                              for encoding in ENCODINGS)):
+        if if_none_match.contains_weak(candidate):
+            return candidate
+    return None
+
+
+def etag_for(resource: str, id_arg: Optional[str] = None):
+    """
+    Decorator adding conditional GET to a route.
+
+    Inputs
+    ------
+    resource (str)
+        Resource type whose version tags the response
+    id_arg (str)
+        Name of the route argument holding the resource ID. None for resources
+        with a single instance such as GROUP_LIST
+
+    Example Usage:
+        @groups_blueprint.route('/<int:group_id>', methods=['GET'])
+        @etag_for(GROUP, 'group_id')
+        def get_group_info(group_id: int):
+            ...
+    """
+    def decorator(view):
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+
+            # Only reads are conditional
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+
+            resource_id = kwargs[id_arg] if id_arg else 0
+            with SessionLocal() as session:
+                version = get_version(session, resource, resource_id)
+            etag = make_etag(resource, resource_id, version)
+
+            # Client already holds the latest representation
+            client_etag = matching_etag(etag)
+            if client_etag:
+                response = make_response('', 304)
+                response.set_etag(client_etag)
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+            return response
+
+        return wrapper
+
+    return decorator
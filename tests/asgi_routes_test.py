@@ -0,0 +1,91 @@
+import pytest
+from starlette.testclient import TestClient
+
+from src.asgi import create_asgi_app
+
+
+@pytest.fixture(scope="module")
+def asgi_client(client):
+    """
+    Client of the ASGI app, on the database seeded by the `client` fixture.
+    """
+    app = create_asgi_app()
+    with TestClient(app) as asgi_client:
+        yield asgi_client
+
+
+@pytest.mark.parametrize("path", [
+    '/users',
+    '/users/groups',
+    '/users/costs',
+    '/users/resolve/Username1',
+    '/users/resolve/1',
+    '/users/resolve/Nobody',
+    '/users/resolve?user_id=1&user_id=999&username=Nobody',
+    '/groups',
+    '/groups/1',
+    '/groups/1/users',
+    '/groups/999',
+    '/groups/resolve?group_name=Nobody',
+])
+def test_async_routes_match_flask(client, asgi_client, auth_headers, path):
+    """
+    Async read routes respond exactly as the Flask routes they replace.
+    """
+    expected = client.get(path, headers=auth_headers)
+    response = asgi_client.get(path, headers={**auth_headers,
+                                              "Accept-Encoding": "identity"})
+
+    assert response.status_code == expected.status_code
+    assert response.json() == expected.get_json()
+    assert response.headers.get("ETag") == expected.headers.get("ETag")
+
+
+def test_async_routes_unauthorized(asgi_client):
+    """Routes requiring a JWT reject requests without one."""
+    assert asgi_client.get('/users').status_code == 401
+    assert asgi_client.get('/groups/1').status_code == 401
+
+
+def test_async_token_errors_match_flask(client, asgi_client):
+    """
+    Invalid, refresh and revoked tokens are rejected exactly as by the Flask
+    routes.
+    """
+    response = client.post('users/login', json={'username': 'Username1',
+                                                 'password': 'Username1!'})
+    tokens = response.get_json()
+    revoked = client.post('users/login', json={'username': 'Username1',
+                                                'password': 'Username1!'})\
+        .get_json()["access_token"]
+    client.post('/users/logout',
+                headers={"Authorization": f"Bearer {revoked}"})
+
+    for token in ("not-a-token", tokens["refresh_token"], revoked):
+        headers = {"Authorization": f"Bearer {token}"}
+        expected = client.get('/groups/1', headers=headers)
+        response = asgi_client.get('/groups/1', headers=headers)
+        assert expected.status_code in (401, 422)
+        assert response.status_code == expected.status_code
+        assert response.json() == expected.get_json()
+
+
+def test_async_route_not_modified(asgi_client, auth_headers):
+    """A matching If-None-Match is answered with 304 Not Modified."""
+    response = asgi_client.get('/groups/1', headers=auth_headers)
+    etag = response.headers["ETag"]
+
+    response = asgi_client.get('/groups/1', headers={**auth_headers,
+                                                     "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+
+def test_other_routes_fall_through_to_flask(asgi_client, auth_headers):
+    """Routes without an async version are served by the Flask app."""
+    response = asgi_client.post('/users/verify-token', headers=auth_headers)
+    assert response.status_code == 200
+
+    response = asgi_client.get('/receipts/1/items', headers=auth_headers)
+    assert response.status_code == 200
+    assert len(response.json()) > 0
@@ -1,3 +1,12 @@
+import os
+import tempfile
+
+# Write the app's log and the slow-query log to a temporary directory rather
+# than the repository root. Both are configured when `src` is imported
+LOG_DIR = tempfile.mkdtemp(prefix='tests-logs-')
+os.environ['LOG_FILE'] = os.path.join(LOG_DIR, 'flask.log')
+os.environ['SLOW_QUERY_LOG'] = os.path.join(LOG_DIR, 'slow_queries.log')
+
 import pytest
 from sqlalchemy import text
 from src import create_app
@@ -29,6 +38,10 @@ def client():
     
     app = create_app()
     app.config['TESTING'] = True
+    
+    # All requests come from the same address, so only throttle by username
+    app.config['RATE_LIMIT_LOGIN_IP'] = None
+    app.config['RATE_LIMIT_REGISTER_IP'] = None
 
     # Create tables before each test
     with app.app_context():
@@ -36,3 +49,15 @@ def client():
         seed_database()
 
     yield app.test_client()
+
+
+@pytest.fixture(scope="session")
+def auth_headers(client):
+    """
+    Authorization header of the pre-seeded user 'Username1', a member of both
+    pre-seeded groups.
+    """
+    response = client.post('users/login', json={"username": "Username1",
+                                                 "password": "Username1!"})
+    token = response.get_json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
@@ -25,12 +25,21 @@ def test_get_groups(client):
     assert data[0]["description"] == "Example Description"
 
 
-def test_delete_group(client):
-    """Test deletion of a group."""
+def test_delete_group(client, auth_headers):
+    """
+    Test deletion of a group, which only its members can do.
+    """
+    body = {'group_name': 'Random Group'}
+    assert client.delete('/groups', json=body).status_code == 401
+    assert client.delete('/groups', json=body, headers=auth_headers)\
+        .status_code == 403
+
+    group_id = client.get('/groups/resolve/Random Group').json["group_id"]
+    assert client.post(f'/groups/{group_id}/users/1', headers=auth_headers)\
+        .status_code == 200
+
     # Delete the newly created group
-    response = client.delete('/groups', json={
-        'group_name': 'Random Group',
-    })
+    response = client.delete('/groups', json=body, headers=auth_headers)
     assert response.status_code == 204
 
 
@@ -43,3 +52,188 @@ def test_create_group_without_name(client):
         'description': 'Missing group name.'
     })
     assert response.status_code == 400
+
+
+def test_resolve_group_after_rename(client, auth_headers):
+    """
+    Resolving a group name is cached, so renaming a group must invalidate both
+    the old and the new name.
+    """
+    response = client.post('/groups', json={'group_name': 'Cached Group',
+                                            'description': 'To be renamed'})
+    assert response.status_code == 201
+    group_id = response.json["group"]["group_id"]
+
+    # The new name is unknown (and cached as such) before the rename
+    assert client.get('/groups/resolve/Renamed Group').status_code == 400
+    response = client.get('/groups/resolve/Cached Group')
+    assert response.status_code == 200
+    assert response.json["group_id"] == group_id
+
+    # Only members can rename a group
+    body = {'old_name': 'Cached Group', 'new_name': 'Renamed Group'}
+    assert client.put('/groups', json=body).status_code == 401
+    assert client.put('/groups', json=body, headers=auth_headers)\
+        .status_code == 403
+    assert client.post(f'/groups/{group_id}/users/1', headers=auth_headers)\
+        .status_code == 200
+
+    response = client.put('/groups', json=body, headers=auth_headers)
+    assert response.status_code == 200
+
+    assert client.get('/groups/resolve/Cached Group').status_code == 400
+    response = client.get('/groups/resolve/Renamed Group')
+    assert response.status_code == 200
+    assert response.json["group_id"] == group_id
+
+
+def test_bulk_resolve_groups(client):
+    """Resolve several group names in one request."""
+    response = client.get('/groups/resolve?group_name=Example Group'
+                          '&group_name=Missing Group')
+    assert response.status_code == 200
+    assert response.json["groups"] == [{"group_id": 1,
+                                        "group_name": "Example Group"}]
+    assert response.json["missing"] == ["Missing Group"]
+
+
+def test_get_group_info(client, auth_headers):
+    """Get the name and description of a group given its ID."""
+    response = client.get('/groups/1', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json["group_name"] == "Example Group"
+
+    response = client.get('/groups/10000', headers=auth_headers)
+    assert response.status_code == 404
+
+
+def test_group_membership_required(client, auth_headers):
+    """
+    Group-scoped routes require a JWT of a member of the group. A user may
+    join a group without being a member first.
+    """
+    assert client.get('/groups/1/users').status_code == 401
+
+    response = client.post('/users', json={'username': 'Outsider',
+                                           'password': 'OutsiderPassword',
+                                           'email': 'outsider@email.com'})
+    assert response.status_code == 201
+    response = client.post('users/login', json={'username': 'Outsider',
+                                                'password': 'OutsiderPassword'})
+    user_id = response.get_json()["user_id"]
+    headers = {"Authorization": f"Bearer {response.get_json()['access_token']}"}
+
+    assert client.get('/groups/2/users', headers=headers).status_code == 403
+
+    response = client.post(f'/groups/2/users/{user_id}', headers=headers)
+    assert response.status_code == 200
+    assert client.get('/groups/2/users', headers=headers).status_code == 200
+
+    response = client.delete(f'/groups/2/users/{user_id}', headers=headers)
+    assert response.status_code == 200
+    assert client.get('/groups/2/users', headers=headers).status_code == 403
+
+
+def test_group_removal_in_another_worker(client):
+    """
+    A member removed by another worker process, whose membership cache is not
+    updated here, is denied on the next request.
+    """
+    from sqlalchemy import delete
+    from src.utils.database import SessionLocal
+    from src.utils.models import UserGroups
+    from src.utils.versioning import bump_version, GROUP
+
+    response = client.post('/users', json={'username': 'Removed',
+                                           'password': 'RemovedPassword',
+                                           'email': 'removed@email.com'})
+    assert response.status_code == 201
+    response = client.post('users/login', json={'username': 'Removed',
+                                                'password': 'RemovedPassword'})
+    user_id = response.get_json()["user_id"]
+    headers = {"Authorization": f"Bearer {response.get_json()['access_token']}"}
+
+    response = client.post(f'/groups/1/users/{user_id}', headers=headers)
+    assert response.status_code == 200
+    assert client.get('/groups/1/users', headers=headers).status_code == 200
+    assert client.get('/receipts/1/items', headers=headers).status_code == 200
+
+    # As `DELETE /groups/1/users/<user_id>` in another process
+    with SessionLocal() as session:
+        session.execute(delete(UserGroups).where(
+            UserGroups.c.user_id == user_id, UserGroups.c.group_id == 1))
+        bump_version(session, GROUP, 1)
+
+    assert client.get('/groups/1/users', headers=headers).status_code == 403
+    assert client.get('/receipts/1/items', headers=headers).status_code == 403
+
+
+def test_group_events_stream(client, auth_headers):
+    """
+    Members of a group receive its changes as Server-Sent Events.
+    """
+    from src.utils.events import event_bus
+
+    response = client.get('/groups/1/events', headers=auth_headers,
+                          buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    stream = iter(response.response)
+    assert next(stream) == b"retry: 1000\n\n"
+
+    # Receipt 1 is in group 1
+    client.put('/users/costs', headers=auth_headers,
+               json=[{"user_id": 1, "receipt_id": 1, "cost": 4.5}])
+    frame = next(stream).decode()
+    assert "event: cost-updated\n" in frame
+    assert ('data: {"receipt_id": 1, "costs": [{"user_id": 1, '
+            '"receipt_id": 1, "cost": 4.5}]}') in frame
+
+    response.close()
+    assert not event_bus.has_subscribers()
+
+
+
+def test_group_events_stream_limit(client, auth_headers, monkeypatch):
+    """
+    Streams above the limit of the process are refused with 503, and closed
+    streams free their slot.
+    """
+    from src.utils.events import event_bus
+    monkeypatch.setattr(event_bus, 'max_streams', 1)
+
+    response = client.get('/groups/1/events', headers=auth_headers,
+                          buffered=False)
+    assert response.status_code == 200
+
+    refused = client.get('/groups/1/events', headers=auth_headers)
+    assert refused.status_code == 503
+    assert refused.headers["Retry-After"]
+
+    response.close()
+    response = client.get('/groups/1/events', headers=auth_headers,
+                          buffered=False)
+    assert response.status_code == 200
+    response.close()
+
+def test_group_costs_summary(client, auth_headers):
+    """
+    Monthly spending of a group is split per member, and each member's
+    share matches their own summary.
+    """
+    query = 'bucket=month&start=2024-04-01&end=2024-05-31'
+    response = client.get(f'/groups/1/costs/summary?{query}',
+                          headers=auth_headers)
+    assert response.status_code == 200
+    summary = response.get_json()
+    assert summary["buckets"] == ["2024-04-01", "2024-05-01"]
+    assert summary["total"] == round(sum(user["total"]
+                                         for user in summary["users"]), 2)
+
+    user = next(user for user in summary["users"] if user["user_id"] == 1)
+    assert user["username"] == "Username1"
+    own = client.get(f'/users/costs/summary?{query}',
+                     headers=auth_headers).get_json()
+    group = next(group for group in own["groups"] if group["group_id"] == 1)
+    assert group["costs"] == user["costs"]
+    assert group["receipts"] == user["receipts"]
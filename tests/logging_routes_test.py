@@ -0,0 +1,67 @@
+import json
+import time
+from logging.handlers import RotatingFileHandler
+
+from src.utils import app_logger
+
+
+def read_log_lines(request_id, timeout=2.0):
+    """JSON log lines of a request, once written by the listener's thread."""
+    [handler] = [h for h in app_logger.queue_handler.listener.handlers
+                 if isinstance(h, RotatingFileHandler)]
+    deadline = time.monotonic() + timeout
+    while True:
+        with open(handler.baseFilename) as log_file:
+            lines = [json.loads(line) for line in log_file
+                     if request_id in line]
+        if lines or time.monotonic() > deadline:
+            return lines
+        time.sleep(0.05)
+
+
+def test_request_id_logged(client, auth_headers):
+    """
+    Requests are given an ID, returned to the client and logged as a field
+    of the JSON lines of the request.
+    """
+    response = client.get('/groups/1', headers=auth_headers)
+    generated = response.headers["X-Request-ID"]
+    assert len(generated) == 32
+
+    response = client.get('/groups/1', headers={**auth_headers,
+                                               "X-Request-ID": "client-id-1"})
+    assert response.headers["X-Request-ID"] == "client-id-1"
+
+    # IDs that could forge log lines are replaced
+    response = client.get('/groups/1', headers={**auth_headers,
+                                               "X-Request-ID": "a\" b"})
+    assert response.headers["X-Request-ID"] != "a\" b"
+
+    [line] = [line for line in read_log_lines(generated)
+              if line["message"].startswith("Fetching")]
+    assert line["message"] == "Fetching group information for group ID 1"
+    assert line["level"] == "INFO"
+    assert line["logger"].startswith("main.")
+    assert line["file"] == "group_routes.py"
+
+
+def test_server_timing(client, auth_headers):
+    """
+    Responses break their duration down by stage in a Server-Timing header,
+    also logged with the request's ID.
+    """
+    response = client.get('/groups/1', headers=auth_headers)
+    assert response.status_code == 200
+
+    timings = {}
+    for metric in response.headers["Server-Timing"].split(', '):
+        name, *params = metric.split(';')
+        timings[name] = dict(param.split('=', 1) for param in params)
+    assert {"jwt", "db", "json", "total"} <= set(timings)
+    assert float(timings["total"]["dur"]) >= float(timings["db"]["dur"])
+
+    lines = read_log_lines(response.headers["X-Request-ID"])
+    [line] = [line for line in lines if "timings" in line]
+    assert line["endpoint"] == "groups.get_group_info"
+    assert line["status"] == 200
+    assert line["timings"]["jwt"]["count"] == 1
@@ -0,0 +1,92 @@
+import gc
+import io
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from pypdf import PdfReader
+
+from src.receipt_reader.SainsburysReceipt import SainsburysReceipt
+from src.utils.memory_tracking import memory_tracker
+
+# Path to directory where test files are stored
+files_dir = Path(__file__).parent / "static_files"
+
+# Uploads repeated to check for leaks, and objects they may leave behind
+UPLOADS = 20
+MAX_OBJECTS_PER_UPLOAD = 25
+
+
+@pytest.fixture
+def tracking(monkeypatch):
+    monkeypatch.setattr(memory_tracker, 'enabled', True)
+    yield memory_tracker
+    tracemalloc.stop()
+
+
+def upload(client, auth_headers):
+    """Upload a receipt already in group 1, which is parsed then rejected."""
+    pdf = (files_dir / "april_4_2024.pdf").read_bytes()
+    response = client.post("groups/1/receipts",
+                           data={"file": (io.BytesIO(pdf), "april_4_2024.pdf")},
+                           content_type="multipart/form-data",
+                           headers=auth_headers)
+    assert response.status_code == 409
+    return response
+
+
+def test_memory_report(client, auth_headers, tracking, tmp_path,
+                       monkeypatch):
+    """
+    Uploads are reported with their peak, the peak of their parsing and the
+    sites retaining memory, listed by /memory with the X-Profile token, which
+    does not profile it.
+    """
+    monkeypatch.setitem(client.application.config, 'PROFILE_TOKEN', 'secret')
+    monkeypatch.setitem(client.application.config, 'PROFILE_DIR',
+                        str(tmp_path))
+
+    request_id = upload(client, auth_headers).headers["X-Request-ID"]
+    assert client.get('/memory', headers=auth_headers).status_code == 404
+
+    response = client.get('/memory?sites=5',
+                          headers={**auth_headers, "X-Profile": "secret"})
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+    assert not list(tmp_path.iterdir())
+    memory = response.get_json()
+    assert memory["tracing"]
+    assert memory["traced_bytes"] > 0
+    assert len(memory["top_sites"]) == 5
+
+    report = memory["reports"][0]
+    assert report["name"] == "upload"
+    assert report["endpoint"] == "groups.add_receipt_to_group"
+    assert report["request_id"] == request_id
+    assert 0 < report["phases"]["parse"]["peak_bytes"] \
+        <= report["peak_bytes"]
+    assert report["top_sites"]
+    assert all(site["size_bytes"] > 0 for site in report["top_sites"])
+
+
+def test_no_leak_after_repeated_uploads(client, auth_headers):
+    """
+    Repeated uploads do not keep pypdf readers, pandas frames or parsed
+    receipts alive, nor more than a few objects per upload (e.g. patterns
+    compiled for multipart boundaries, bounded by the `re` cache).
+    """
+    # Warm up caches (e.g. compiled statements) before counting
+    for _ in range(3):
+        upload(client, auth_headers)
+    gc.collect()
+    before = len(gc.get_objects())
+
+    for _ in range(UPLOADS):
+        upload(client, auth_headers)
+    gc.collect()
+
+    alive = [obj for obj in gc.get_objects()
+             if isinstance(obj, (SainsburysReceipt, PdfReader, pd.DataFrame))]
+    assert alive == []
+    assert len(gc.get_objects()) - before < UPLOADS * MAX_OBJECTS_PER_UPLOAD
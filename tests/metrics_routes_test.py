@@ -0,0 +1,39 @@
+from prometheus_client.parser import text_string_to_metric_families
+
+
+def sample_value(text, name, labels=None):
+    """Value of the sample with the given name and labels, None if absent."""
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            if sample.name == name and sample.labels == (labels or {}):
+                return sample.value
+    return None
+
+
+def test_request_metrics(client, auth_headers):
+    """
+    Requests are counted and timed per endpoint and status, and no request is
+    left in progress once served.
+    """
+    labels = {"method": "GET", "endpoint": "groups.get_group_info"}
+    before = client.get('/metrics').get_data(as_text=True)
+    count = sample_value(before, 'http_responses_total',
+                         {**labels, "status": "200"}) or 0
+
+    assert client.get('/groups/1', headers=auth_headers).status_code == 200
+    assert client.get('/no-such-route').status_code == 404
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+
+    assert sample_value(text, 'http_responses_total',
+                        {**labels, "status": "200"}) == count + 1
+    assert sample_value(text, 'http_request_duration_seconds_count',
+                        labels) >= 1
+    assert sample_value(text, 'http_requests_in_progress', labels) == 0
+    assert sample_value(text, 'http_responses_total', {
+        "method": "GET", "endpoint": "none", "status": "404"}) >= 1
+    assert sample_value(text, 'receipts_parsed_total') is not None
+    assert sample_value(text, 'db_session_retries_total') is not None
@@ -0,0 +1,57 @@
+import pstats
+from pathlib import Path
+
+# Path to directory where test files are stored
+files_dir = Path(__file__).parent / "static_files"
+
+
+def test_profile_request(client, auth_headers, tmp_path, monkeypatch):
+    """
+    Requests sent with the X-Profile token are profiled, including the
+    receipt parsing done on the parser pool, and can be listed and fetched.
+    """
+    monkeypatch.setitem(client.application.config, 'PROFILE_TOKEN', 'secret')
+    monkeypatch.setitem(client.application.config, 'PROFILE_DIR',
+                        str(tmp_path))
+    profile_headers = {"X-Profile": "secret"}
+
+    # Not profiled, and the profiles cannot be listed, without the token
+    response = client.get('/groups/1', headers=auth_headers)
+    assert "X-Profile-Id" not in response.headers
+    assert client.get('/profiles').status_code == 404
+    assert client.get('/profiles', headers={"X-Profile": "wrong"})\
+        .status_code == 404
+
+    # Uploading a receipt that already exists still parses it
+    with open(files_dir / "april_4_2024.pdf", 'rb') as test_file:
+        response = client.post(
+            "groups/1/receipts",
+            data={"file": (test_file, "april_4_2024.pdf")},
+            content_type="multipart/form-data",
+            headers={**auth_headers, **profile_headers})
+    assert response.status_code == 409
+    profile_id = response.headers["X-Profile-Id"]
+
+    response = client.get('/profiles', headers=profile_headers)
+    assert response.status_code == 200
+    [profile] = response.get_json()
+    assert profile["id"] == profile_id
+    assert profile["endpoint"] == "groups.add_receipt_to_group"
+    assert profile["status"] == 409
+    assert profile["trigger"] == "header"
+    assert profile["duration_ms"] > 0
+
+    response = client.get(f'/profiles/{profile_id}?format=text',
+                          headers=profile_headers)
+    assert response.status_code == 200
+    assert "add_receipt_to_group" in response.get_data(as_text=True)
+    assert "SainsburysReceipt" in response.get_data(as_text=True)
+
+    response = client.get(f'/profiles/{profile_id}', headers=profile_headers)
+    assert response.status_code == 200
+    path = tmp_path / "download.prof"
+    path.write_bytes(response.data)
+    assert pstats.Stats(str(path)).total_calls > 0
+
+    assert client.get('/profiles/..', headers=profile_headers)\
+        .status_code == 404
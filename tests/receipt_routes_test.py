@@ -1,3 +1,4 @@
+import io
 from pathlib import Path
 
 # Path to directory where test files are stored
@@ -15,7 +16,7 @@ def test_file_exists():
 # "Example Group" only)
 uploaded_receipts_file_names = ["april_4_2024.pdf", "april_25_2024.pdf"]
     
-def test_add_new_receipt_to_group(client):
+def test_add_new_receipt_to_group(client, auth_headers):
     """
     Add new receipts to the group "Example Group". This action should return
     a 401 - Resource created status code
@@ -40,11 +41,12 @@ def test_add_new_receipt_to_group(client):
                 response = client.post(
                     "groups/1/receipts",
                     data={"file": (test_file, filename)},
-                    content_type="multipart/form-data")
+                    content_type="multipart/form-data",
+                    headers=auth_headers)
                 
                 assert response.status_code == 201
                 
-def test_add_existing_receipt_to_group(client):
+def test_add_existing_receipt_to_group(client, auth_headers):
     """
     Attempt to add existing receipts to "Example Group". This action should 
     return a 409 - Resource Already Exists error
@@ -69,11 +71,43 @@ def test_add_existing_receipt_to_group(client):
                 response = client.post(
                     "groups/1/receipts",
                     data={"file": (test_file, filename)},
-                    content_type="multipart/form-data")
+                    content_type="multipart/form-data",
+                    headers=auth_headers)
                 
                 assert response.status_code == 409
 
-def test_add_receipt_to_non_existing_group(client):
+def test_upload_with_idempotency_key(client, auth_headers):
+    """
+    Retrying an upload with the same Idempotency-Key replays the first
+    response instead of parsing the receipt again and answering 409.
+    """
+    headers = {**auth_headers, "Idempotency-Key": "upload-may-1"}
+    body = (files_dir / "may_1_2024.pdf").read_bytes()
+
+    responses = []
+    for _ in range(2):
+        responses.append(client.post(
+            "groups/2/receipts",
+            data={"file": (io.BytesIO(body), "may_1_2024.pdf")},
+            content_type="multipart/form-data",
+            headers=headers))
+
+    assert responses[0].status_code == 201
+    assert "Idempotent-Replayed" not in responses[0].headers
+    assert responses[1].status_code == 201
+    assert responses[1].headers["Idempotent-Replayed"] == "true"
+    assert responses[1].get_json() == responses[0].get_json()
+
+    # The key cannot be reused for another request
+    response = client.post(
+        "groups/2/receipts",
+        data={"file": (io.BytesIO(body[:-1]), "may_1_2024.pdf")},
+        content_type="multipart/form-data",
+        headers=headers)
+    assert response.status_code == 422
+
+
+def test_add_receipt_to_non_existing_group(client, auth_headers):
     """
     Attempt to add receipts to a new group that does not exist. This action
     should return a 404 error.
@@ -90,21 +124,315 @@ def test_add_receipt_to_non_existing_group(client):
             response = client.post(
                 "groups/10000/receipts",
                 data={"file": (file_paths[0], file_paths[0].name)},
-                content_type="multipart/form-data")
+                content_type="multipart/form-data",
+                headers=auth_headers)
             
             # Expect a Not Found Error since no group to add receipt to
             assert response.status_code == 404
 
-def test_get_receipt_from_group(client):
+def test_get_receipt_from_group(client, auth_headers):
     """
     Get a list of receipts uploaded to the group with Group ID 1. Expects a
     list oof receipts.
     """
     
-    response = client.get('groups/1/receipts')
+    response = client.get('groups/1/receipts', headers=auth_headers)
     data = response.get_json()  
     
     assert response.status_code == 200
     assert "receipts" in data
     assert isinstance(data["receipts"], list) == True
-    
\ No newline at end of file
+    
+
+def test_settle_receipt(client, auth_headers):
+    """
+    Assign units of the first two items of receipt 1 to user 1 and settle the
+    receipt. The user should be charged for those two items only.
+    """
+    response = client.post('receipts/1/users/1', headers=auth_headers)
+    assert response.status_code == 201
+
+    response = client.put('receipts/user-items', json=[
+        {"user_id": 1, "item_id": 1, "unit": 1},
+        {"user_id": 1, "item_id": 2, "unit": 1},
+    ], headers=auth_headers)
+    assert response.status_code == 200
+
+    response = client.post('receipts/1/settle', headers=auth_headers)
+    assert response.status_code == 200
+
+    data = response.get_json()
+    assert data == [{"user_id": 1, "receipt_id": 1, "cost": 2.98}]
+
+
+def test_settle_non_existing_receipt(client, auth_headers):
+    """
+    Settling a receipt that does not exist should return 404 Not Found
+    """
+    response = client.post('receipts/10000/settle', headers=auth_headers)
+    assert response.status_code == 404
+
+
+def test_settle_group(client, auth_headers):
+    """
+    Recompute every receipt of group 1. Receipt 1 is the only receipt with
+    user-item associations.
+    """
+    response = client.post('groups/1/receipts/settle', headers=auth_headers)
+    assert response.status_code == 200
+
+    data = response.get_json()
+    assert {"user_id": 1, "receipt_id": 1, "cost": 2.98} in data
+
+
+
+def test_settle_version_conflict(client, auth_headers):
+    """
+    A cost updated by another request while a receipt is settled is reported
+    as a conflict with the current costs, and settling again succeeds.
+    """
+    from sqlalchemy import event
+    from src.utils.database import SessionLocal, engine
+    from src.utils.models import UserSpending
+    from src.utils.spending_rollups import record_spending
+
+    # Costs of receipt 1 exist, so settling updates them
+    assert client.post('receipts/1/settle',
+                       headers=auth_headers).status_code == 200
+    raced = []
+
+    def update_first(conn, cursor, statement, parameters, context, many):
+        if raced or not statement.startswith("UPDATE user_spending"):
+            return
+        raced.append(statement)
+        # As `PUT /users/costs` would, keeping the rollups in step
+        with SessionLocal() as other:
+            spending = other.get(UserSpending, (1, 1))
+            record_spending(other, [(1, 1, spending.cost, 9.99)])
+            spending.cost = 9.99
+
+    for url in ('receipts/1/settle', 'groups/1/receipts/settle'):
+        raced.clear()
+        event.listen(engine, "before_cursor_execute", update_first)
+        try:
+            response = client.post(url, headers=auth_headers)
+        finally:
+            event.remove(engine, "before_cursor_execute", update_first)
+        assert raced
+        assert response.status_code == 409
+        [current] = [row for row in response.get_json()["current"]
+                     if (row["user_id"], row["receipt_id"]) == (1, 1)]
+        assert current["cost"] == 9.99
+
+        response = client.post(url, headers=auth_headers)
+        assert response.status_code == 200
+        assert {"user_id": 1, "receipt_id": 1, "cost": 2.98} in \
+            response.get_json()
+
+def test_user_items_version_conflict(client, auth_headers):
+    """
+    Updates carrying the version last read succeed and increment it. Updates
+    carrying a stale version are rejected as a whole with the current values.
+    """
+    response = client.get('receipts/user-items/1', headers=auth_headers)
+    versions = {row["item_id"]: row["version"]
+                for row in response.get_json() if row["user_id"] == 1}
+
+    response = client.put('receipts/user-items', json=[
+        {"user_id": 1, "item_id": 1, "unit": 2, "version": versions[1]},
+    ], headers=auth_headers)
+    assert response.status_code == 200
+    assert response.get_json()["user_items"] == [
+        {"user_id": 1, "item_id": 1, "unit": 2, "version": versions[1] + 1}]
+
+    # A client still holding the old version of item 1
+    response = client.put('receipts/user-items', json=[
+        {"user_id": 1, "item_id": 2, "unit": 3, "version": versions[2]},
+        {"user_id": 1, "item_id": 1, "unit": 3, "version": versions[1]},
+    ], headers=auth_headers)
+    assert response.status_code == 409
+    assert response.get_json()["current"] == [
+        {"user_id": 1, "item_id": 1, "unit": 2, "version": versions[1] + 1}]
+
+    # Item 2 was not updated either
+    response = client.get('receipts/user-items/1', headers=auth_headers)
+    assert {"user_id": 1, "item_id": 2, "unit": 1,
+            "version": versions[2]} in response.get_json()
+
+    # Restore the units charged by the settle tests
+    response = client.put('receipts/user-items', json=[
+        {"user_id": 1, "item_id": 1, "unit": 1, "version": versions[1] + 1},
+    ], headers=auth_headers)
+    assert response.status_code == 200
+
+
+def test_receipts_in_group_conditional_get(client, auth_headers):
+    """
+    Listing receipts returns an ETag which is answered with 304 Not Modified
+    until a receipt is added to the group.
+    """
+    response = client.get('groups/2/receipts', headers=auth_headers)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = client.get('groups/2/receipts',
+                          headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+    # Adding a receipt bumps the version of the group
+    with open(files_dir / "april_4_2024.pdf", 'rb') as test_file:
+        response = client.post(
+            "groups/2/receipts",
+            data={"file": (test_file, "april_4_2024.pdf")},
+            content_type="multipart/form-data",
+            headers=auth_headers)
+        assert response.status_code == 201
+
+    response = client.get('groups/2/receipts',
+                          headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+
+def test_concurrent_first_version_bumps(client):
+    """
+    A version row created by another request right before this one bumps it
+    for the first time is incremented instead of failing on the duplicate
+    key.
+    """
+    from sqlalchemy import delete, event
+    from src.utils.database import SessionLocal, engine
+    from src.utils.models import ResourceVersion
+    from src.utils.versioning import bump_version, get_version, RECEIPT
+
+    raced = []
+
+    def bump_first(conn, cursor, statement, parameters, context, many):
+        if raced or not statement.startswith("INSERT INTO resource_versions"):
+            return
+        raced.append(statement)
+        with SessionLocal() as other:
+            bump_version(other, RECEIPT, 10001)
+
+    event.listen(engine, "before_cursor_execute", bump_first)
+    try:
+        with SessionLocal() as session:
+            bump_version(session, RECEIPT, 10001)
+    finally:
+        event.remove(engine, "before_cursor_execute", bump_first)
+    assert raced
+
+    with SessionLocal() as session:
+        assert get_version(session, RECEIPT, 10001) == 2
+        session.execute(delete(ResourceVersion).where(
+            ResourceVersion.resource == RECEIPT,
+            ResourceVersion.resource_id == 10001))
+
+def test_receipt_items_conditional_get(client, auth_headers):
+    """
+    Receipt items are revalidated rather than cached as immutable, as user
+    item writes change them, and a weakened ETag still matches.
+    """
+    response = client.get('receipts/1/items', headers=auth_headers)
+    assert response.status_code == 200
+    assert "immutable" not in response.headers.get("Cache-Control", "")
+    etag = response.headers["ETag"]
+
+    response = client.get('receipts/1/items',
+                          headers={**auth_headers, "If-None-Match": etag})
+    assert response.status_code == 304
+
+    response = client.get('receipts/1/items',
+                          headers={**auth_headers,
+                                   "If-None-Match": f"W/{etag}"})
+    assert response.status_code == 304
+
+
+def test_receipt_items_compressed(client, auth_headers):
+    """
+    Receipt items are large enough to be compressed when the client accepts
+    gzip, and the compressed ETag still validates.
+    """
+    import gzip, json
+
+    response = client.get('receipts/1/items',
+                          headers={**auth_headers, "Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(response.data)) == \
+        client.get('receipts/1/items', headers=auth_headers).get_json()
+
+    response = client.get('receipts/1/items',
+                          headers={**auth_headers, "Accept-Encoding": "gzip",
+                                   "If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+
+def test_small_response_not_compressed(client, auth_headers):
+    """Payloads below the minimum size are sent uncompressed."""
+    response = client.get('receipts/10000/items',
+                          headers={**auth_headers, "Accept-Encoding": "gzip"})
+    assert response.status_code == 404
+    assert "Content-Encoding" not in response.headers
+
+
+def test_receipt_lock_lease(client, auth_headers):
+    """
+    Only one member at a time holds the lease of a receipt. Others cannot
+    acquire it or edit units until it is released or expires.
+    """
+    from datetime import datetime as dt
+    from sqlalchemy import update
+    from src.utils.database import SessionLocal
+    from src.utils.models import Receipt
+    from src.utils.receipt_locks import sweep_expired_leases
+
+    # A second member of group 1
+    client.post('/users', json={'username': 'LockRival',
+                                'password': 'LockRivalPassword',
+                                'email': 'rival@email.com'})
+    response = client.post('users/login', json={'username': 'LockRival',
+                                                'password': 'LockRivalPassword'})
+    rival_id = response.get_json()["user_id"]
+    rival = {"Authorization": f"Bearer {response.get_json()['access_token']}"}
+    client.post(f'/groups/1/users/{rival_id}', headers=rival)
+
+    response = client.post('receipts/1/lock', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.get_json()["locked_by"] == 1
+    assert client.put('receipts/1/lock', headers=auth_headers)\
+        .status_code == 200
+
+    # The rival can neither take the lease nor edit units
+    response = client.post('receipts/1/lock', headers=rival)
+    assert response.status_code == 409
+    assert response.get_json()["locked_by"] == 1
+    response = client.put('receipts/user-items', headers=rival,
+                          json=[{'user_id': rival_id, 'item_id': 1,
+                                 'unit': 1}])
+    assert response.status_code == 409
+    assert client.delete('receipts/1/lock', headers=rival).status_code == 409
+
+    # Released leases can be taken
+    assert client.delete('receipts/1/lock', headers=auth_headers)\
+        .status_code == 204
+    assert client.post('receipts/1/lock', headers=rival).status_code == 200
+
+    # Expired leases can be taken too, and are reset by the sweeper
+    with SessionLocal() as session:
+        session.execute(update(Receipt).where(Receipt.receipt_id == 1)
+                        .values(lock_timestamp=dt(2000, 1, 1)))
+    assert client.put('receipts/1/lock', headers=auth_headers)\
+        .status_code == 409
+    assert client.post('receipts/1/lock', headers=auth_headers)\
+        .status_code == 200
+
+    with SessionLocal() as session:
+        session.execute(update(Receipt).where(Receipt.receipt_id == 1)
+                        .values(lock_timestamp=dt(2000, 1, 1)))
+        assert sweep_expired_leases(session) == 1
+    assert client.put('receipts/1/lock', headers=auth_headers)\
+        .status_code == 409
+
+    client.delete(f'/groups/1/users/{rival_id}', headers=rival)
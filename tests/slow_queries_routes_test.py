@@ -0,0 +1,57 @@
+import json
+import time
+
+from src.utils.slow_queries import slow_query_log, normalize
+from src.utils.slow_query_report import read_entries, summarize
+
+
+def read_slow_queries(request_id, timeout=2.0):
+    """Slow-query entries of a request, once written by the listener."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            entries = [entry for entry in read_entries([slow_query_log.path])
+                       if entry["request_id"] == request_id]
+        except FileNotFoundError:
+            entries = []
+        if entries or time.monotonic() > deadline:
+            return entries
+        time.sleep(0.05)
+
+
+def test_normalize():
+    """Executions differing only by their values normalize alike."""
+    assert normalize("SELECT * FROM users\n  WHERE user_id IN (?, ?, ?) "
+                     "AND username = 'Bob' LIMIT 10") == \
+        "SELECT * FROM users WHERE user_id IN (?, ...) AND username = ? " \
+        "LIMIT ?"
+    assert normalize("INSERT INTO user_items_2 VALUES (%s, %s), (%s, %s)") \
+        == "INSERT INTO user_items_2 VALUES (?, ...), ..."
+
+
+def test_slow_query_logged(client, auth_headers, monkeypatch):
+    """
+    Queries above the threshold are logged with their route, parameter
+    types and plan, and summarized by fingerprint.
+    """
+    monkeypatch.setattr(slow_query_log, 'threshold_ms', 0)
+    monkeypatch.setattr(slow_query_log, 'explain', True)
+
+    response = client.get('/groups/1', headers=auth_headers)
+    assert response.status_code == 200
+    entries = read_slow_queries(response.headers["X-Request-ID"])
+    assert entries
+
+    selects = [entry for entry in entries
+               if entry["statement"].startswith("SELECT")]
+    assert selects
+    for entry in selects:
+        assert entry["endpoint"] == "groups.get_group_info"
+        assert entry["method"] == "GET"
+        assert entry["duration_ms"] >= 0
+        assert "1" not in json.dumps(entry["params"])
+        assert entry["plan"]
+
+    [query] = [query for query in summarize(entries, by='count')
+               if query["fingerprint"] == selects[0]["fingerprint"]]
+    assert query["endpoints"]["groups.get_group_info"] == query["count"]
@@ -0,0 +1,69 @@
+from sqlalchemy import delete, event, select
+
+from src.utils.database import SessionLocal, engine
+from src.utils.models import SpendingRollup
+from src.utils.spending_rollups import backfill_rollups, record_spending
+
+
+SUMMARY = '/users/costs/summary?bucket=week&start=2024-04-01&end=2024-04-28'
+
+
+def test_rollups_backfilled(client, auth_headers):
+    """
+    Costs written before the rollups existed are rolled up on startup, so
+    later updates add to the right totals.
+    """
+    assert client.put('/users/costs', headers=auth_headers, json=[
+        {"user_id": 1, "receipt_id": 1, "cost": 2.5}]).status_code == 204
+    summary = client.get(SUMMARY, headers=auth_headers).get_json()
+
+    # As on a database which had costs before the table was created
+    with SessionLocal() as session:
+        session.execute(delete(SpendingRollup))
+    assert backfill_rollups(engine) > 0
+    assert client.get(SUMMARY, headers=auth_headers).get_json() == summary
+
+    # Only when there are no rollups
+    assert backfill_rollups(engine) == 0
+
+    assert client.put('/users/costs', headers=auth_headers, json=[
+        {"user_id": 1, "receipt_id": 1, "cost": 3.5}]).status_code == 204
+    updated = client.get(SUMMARY, headers=auth_headers).get_json()
+    assert updated["total"] == summary["total"] + 1
+    assert updated["receipts"] == summary["receipts"]
+
+
+def test_concurrent_first_writes(client):
+    """
+    A rollup created by another request right before this one writes it
+    (receipts 1 and 2 are in the same month) is added to instead of failing
+    on the duplicate key.
+    """
+    raced = []
+
+    def create_first(conn, cursor, statement, parameters, context, many):
+        if raced or not statement.startswith("INSERT INTO spending_rollups"):
+            return
+        raced.append(statement)
+        with SessionLocal() as other:
+            record_spending(other, [(2, 1, None, 1.25)])
+
+    event.listen(engine, "before_cursor_execute", create_first)
+    try:
+        with SessionLocal() as session:
+            record_spending(session, [(2, 2, None, 2.5)])
+    finally:
+        event.remove(engine, "before_cursor_execute", create_first)
+    assert raced
+
+    with SessionLocal() as session:
+        month = session.execute(
+            select(SpendingRollup.cost, SpendingRollup.receipts)
+            .where(SpendingRollup.user_id == 2,
+                   SpendingRollup.period == 'month')).one()
+        assert tuple(month) == (3.75, 2)
+
+        # Undo, as user 2 has no such costs
+        record_spending(session, [(2, 1, 1.25, None), (2, 2, 2.5, None)])
+        assert not session.scalars(select(SpendingRollup)
+                                   .where(SpendingRollup.user_id == 2)).all()
@@ -0,0 +1,65 @@
+import json
+import time
+
+from src.utils.traffic_recording import traffic_recorder
+
+
+def read_traces(path, request_ids, timeout=2.0):
+    """Traces of requests, once written by the listener."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with open(path) as trace:
+                entries = {entry["request_id"]: entry for entry
+                           in map(json.loads, trace)
+                           if entry["request_id"] in request_ids}
+        except FileNotFoundError:
+            entries = {}
+        if len(entries) == len(request_ids) or time.monotonic() > deadline:
+            return [entries.get(request_id) for request_id in request_ids]
+        time.sleep(0.05)
+
+
+def test_traffic_recorded(client, auth_headers, tmp_path, monkeypatch):
+    """
+    Requests are recorded with their route, the IDs of their arguments and
+    body, their user and timing, but none of their strings.
+    """
+    path = tmp_path / "traffic.jsonl"
+    monkeypatch.setattr(traffic_recorder, 'path', str(path))
+
+    resolve = client.get('/groups/resolve/Example Group', headers=auth_headers)
+    again = client.get('/groups/resolve?group_name=Example Group'
+                       '&group_name=Missing', headers=auth_headers)
+    update = client.put('/receipts/user-items', headers={
+        **auth_headers, "Idempotency-Key": "retry-me"},
+        json=[{"user_id": 1, "item_id": 1, "unit": 2}])
+    login = client.post('/users/login', json={"username": "Username1",
+                                              "password": "Username1!"})
+    assert client.get('/metrics').status_code == 200
+    monkeypatch.setattr(traffic_recorder, 'path', '')
+
+    resolve, again, update, login = read_traces(path, [
+        response.headers["X-Request-ID"]
+        for response in (resolve, again, update, login)])
+
+    assert resolve["route"] == "/groups/resolve/<string:group_name>"
+    assert resolve["status"] == 200
+    assert resolve["response_bytes"] > 0
+    assert resolve["duration_ms"] > 0
+    name = resolve["view_args"]["group_name"]
+    assert name.startswith("<str:13:")
+    # The same name is recorded alike, wherever it is sent
+    assert again["query"]["group_name"][0] == name
+    assert again["query"]["group_name"][1] != name
+
+    assert update["method"] == "PUT"
+    assert update["user_id"] == 1
+    assert update["body"] == {"json": [{"user_id": 1, "item_id": 1,
+                                        "unit": 2}]}
+    assert update["headers"]["Idempotency-Key"].startswith("<str:8:")
+
+    assert login["user_id"] is None
+    assert login["body"]["json"]["password"] == "<credential>"
+    assert "Username1" not in path.read_text()
+    assert "/metrics" not in path.read_text()
@@ -169,3 +169,241 @@ def test_get_username(client):
     username = data.get('username')
     assert isinstance(username, str)
     assert username == test_username
+
+
+def test_bulk_resolve_users(client):
+    """Resolve user IDs and usernames in one request."""
+    response = client.get('users/resolve?user_id=1&user_id=10000'
+                          '&username=Username1&username=Nobody')
+    assert response.status_code == 200
+
+    data = response.get_json()
+    assert data["users"] == [{"user_id": 1, "username": "Username1"}]
+    assert data["missing"] == {"user_ids": [10000], "usernames": ["Nobody"]}
+
+
+def test_resolve_deleted_user(client):
+    """
+    Deleting a user invalidates its cached username and user ID.
+    """
+    response = client.post('/users', json={
+        'username': 'ResolvedUser',
+        'password': 'ResolvedPassword',
+        'email': 'resolved@email.com'
+    })
+    assert response.status_code == 201
+
+    response = client.get('users/resolve/ResolvedUser')
+    assert response.status_code == 200
+    user_id = response.get_json()["user_id"]
+    assert client.get(f'users/resolve/{user_id}').status_code == 200
+
+    response = client.post('users/login', json={
+        'username': 'ResolvedUser', 'password': 'ResolvedPassword'})
+    token = response.get_json()["access_token"]
+    response = client.delete('/users',
+                             headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 204
+
+    assert client.get('users/resolve/ResolvedUser').status_code == 404
+    assert client.get(f'users/resolve/{user_id}').status_code == 404
+
+
+def test_login_rehashes_outdated_password(client):
+    """
+    A password stored with a different bcrypt cost is rehashed with the
+    configured cost on the next successful login.
+    """
+    from passlib.hash import bcrypt
+    from sqlalchemy import text
+    from src.utils.database import engine
+    from src.utils.hashing import BCRYPT_ROUNDS
+
+    response = client.post('/users', json={'username': 'RehashUser',
+                                           'password': 'RehashPassword',
+                                           'email': 'rehash@email.com'})
+    assert response.status_code == 201
+
+    # Store the password with a cheaper cost than configured
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE users SET hashed_password = :hash "
+                          "WHERE username = 'RehashUser'"),
+                     {"hash": bcrypt.using(rounds=4).hash('RehashPassword')})
+
+    response = client.post('users/login', json={'username': 'RehashUser',
+                                                'password': 'RehashPassword'})
+    assert response.status_code == 200
+
+    with engine.connect() as conn:
+        hashed_password = conn.execute(text(
+            "SELECT hashed_password FROM users WHERE username = 'RehashUser'"
+        )).scalar()
+    assert hashed_password.startswith(f"$2b${BCRYPT_ROUNDS:02d}$")
+
+
+def test_login_rate_limited(client):
+    """
+    Repeated failed logins for the same username are rejected with 429 Too
+    Many Requests once the per-username limit is exhausted.
+    """
+    limit = int(client.application.config['RATE_LIMIT_LOGIN_USER']
+                .split('/')[0])
+
+    for _ in range(limit):
+        response = client.post('users/login', json={
+            'username': 'RateLimitedUser', 'password': 'wrong'})
+        assert response.status_code == 401
+
+    response = client.post('users/login', json={
+        'username': 'RateLimitedUser', 'password': 'wrong'})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+
+
+def test_logout_revokes_tokens(client):
+    """
+    Logging out revokes the access token and the given refresh token, which
+    are then rejected with 401 Unauthorized.
+    """
+    response = client.post('users/login', json={'username': 'Test Username',
+                                                 'password': 'Test Password'})
+    assert response.status_code == 200
+    tokens = response.get_json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    response = client.get('/users', headers=headers)
+    assert response.status_code == 200
+
+    response = client.post('/users/logout', headers=headers,
+                           json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+
+    response = client.get('/users', headers=headers)
+    assert response.status_code == 401
+
+    response = client.post('/users/refresh', headers={
+        "Authorization": f"Bearer {tokens['refresh_token']}"})
+    assert response.status_code == 401
+
+
+def test_update_user_costs_version_conflict(client, auth_headers):
+    """
+    Costs can be updated conditionally on the version last read. A stale
+    version is answered with 409 Conflict and the current cost.
+    """
+    response = client.put('/users/costs', headers=auth_headers,
+                          json=[{"user_id": 1, "receipt_id": 2, "cost": 5}])
+    assert response.status_code == 204
+
+    response = client.get('/users/costs', headers=auth_headers)
+    cost = next(row for row in response.get_json() if row["receipt_id"] == 2)
+    assert cost["cost"] == 5
+
+    response = client.put('/users/costs', headers=auth_headers, json=[
+        {"user_id": 1, "receipt_id": 2, "cost": 6, "version": cost["version"]}])
+    assert response.status_code == 204
+
+    response = client.put('/users/costs', headers=auth_headers, json=[
+        {"user_id": 1, "receipt_id": 2, "cost": 7, "version": cost["version"]}])
+    assert response.status_code == 409
+    assert response.get_json()["current"] == [
+        {"user_id": 1, "receipt_id": 2, "cost": 6,
+         "version": cost["version"] + 1}]
+
+
+def test_update_user_costs_idempotency_key(client, auth_headers):
+    """
+    A retried update with the same Idempotency-Key is replayed rather than
+    applied again, even if the cost has been changed in between.
+    """
+    headers = {**auth_headers, "Idempotency-Key": "costs-1"}
+    body = [{"user_id": 1, "receipt_id": 2, "cost": 3}]
+
+    assert client.put('/users/costs', headers=headers, json=body)\
+        .status_code == 204
+    assert client.put('/users/costs', headers=auth_headers, json=[
+        {"user_id": 1, "receipt_id": 2, "cost": 8}]).status_code == 204
+
+    response = client.put('/users/costs', headers=headers, json=body)
+    assert response.status_code == 204
+    assert response.headers["Idempotent-Replayed"] == "true"
+
+    response = client.get('/users/costs', headers=auth_headers)
+    assert {row["receipt_id"]: row["cost"]
+            for row in response.get_json()}[2] == 8
+
+
+def test_user_costs_summary(client, auth_headers):
+    """
+    Weekly spending is served from the rollups, empty weeks included, and
+    matches both the raw costs and rollups rebuilt from them.
+    """
+    from email.utils import parsedate_to_datetime
+    from datetime import timedelta
+    from src.utils.database import SessionLocal
+    from src.utils.spending_rollups import rebuild_rollups
+
+    assert client.put('/users/costs', headers=auth_headers, json=[
+        {"user_id": 1, "receipt_id": 1, "cost": 4.25},
+        {"user_id": 1, "receipt_id": 2, "cost": 6.5}]).status_code == 204
+    assert client.put('/users/costs', headers=auth_headers, json=[
+        {"user_id": 1, "receipt_id": 2, "cost": 7.5}]).status_code == 204
+
+    url = '/users/costs/summary?bucket=week&start=2024-04-01&end=2024-04-28'
+    response = client.get(url, headers=auth_headers)
+    assert response.status_code == 200
+    summary = response.get_json()
+    buckets = ["2024-04-01", "2024-04-08", "2024-04-15", "2024-04-22"]
+    assert summary["buckets"] == buckets
+
+    expected = dict.fromkeys(buckets, 0)
+    for row in client.get('/users/costs', headers=auth_headers).get_json():
+        day = parsedate_to_datetime(row["slot_time"]).date()
+        monday = str(day - timedelta(days=day.weekday()))
+        if monday in expected:
+            expected[monday] += row["cost"]
+    assert summary["costs"] == [round(cost, 2) for cost in expected.values()]
+    assert summary["costs"][1] == 0
+    assert [group["group_id"] for group in summary["groups"]] == [1]
+
+    with SessionLocal() as session:
+        rebuild_rollups(session)
+    assert client.get(url, headers=auth_headers).get_json() == summary
+
+
+def test_user_costs_summary_invalid_arguments(client, auth_headers):
+    for query in ('bucket=day', 'start=yesterday',
+                  'start=2024-05-01&end=2024-04-01',
+                  'bucket=week&start=2000-01-01&end=2024-01-01'):
+        response = client.get(f'/users/costs/summary?{query}',
+                              headers=auth_headers)
+        assert response.status_code == 400
+
+
+def test_idempotency_key_abandoned_claim(client, auth_headers, monkeypatch):
+    """
+    A claim left in progress by a worker that died is answered with 409 until
+    it times out, then the next retry takes it over and runs the request.
+    """
+    from src.utils.idempotency import idempotency_store
+
+    headers = {**auth_headers, "Idempotency-Key": "killed-worker"}
+    body = [{"user_id": 1, "receipt_id": 2, "cost": 4}]
+
+    # The worker dies before storing the response
+    with monkeypatch.context() as patch:
+        patch.setattr(idempotency_store, 'complete', lambda key, response: None)
+        assert client.put('/users/costs', headers=headers, json=body)\
+            .status_code == 204
+
+    response = client.put('/users/costs', headers=headers, json=body)
+    assert response.status_code == 409
+
+    monkeypatch.setattr(idempotency_store, '_claim_timeout', 0)
+    response = client.put('/users/costs', headers=headers, json=body)
+    assert response.status_code == 204
+    assert "Idempotent-Replayed" not in response.headers
+
+    # Completed this time, so later retries are replayed
+    response = client.put('/users/costs', headers=headers, json=body)
+    assert response.headers["Idempotent-Replayed"] == "true"